@@ -1,79 +1,127 @@
 """
 Batch Analysis Script
 Analyzes all existing images in the database that haven't been analyzed yet.
+
+Usage:
+    python analyze_batch.py [--workers N] [--chunk-size N] [--resume]
 """
 
 import os
 import sys
+import argparse
 from database import SessionLocal
 import models
 from image_analyzer import get_analyzer
+import batch_tools
+import search
+import storage
 import logging
+from datetime import datetime
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-UPLOAD_DIR = os.path.join(os.getcwd(), "uploads")
+CHECKPOINT_NAME = "analyze_batch"
+
+ANALYSIS_BATCH_SIZE = 16
+
+def analyze_many(items):
+    """Analyze a small batch of images. Runs inside a worker process (one analyzer per process).
 
-def analyze_existing_images():
+    Analysis reads the 1600px preview when it exists instead of decoding the original.
+    Returns a list of (image_id, filename, status, analysis_or_error).
+    """
+    results = []
+    present = []
+    for image_id, filename in items:
+        file_path = storage.original_path(filename)
+        if not os.path.exists(file_path):
+            results.append((image_id, filename, "missing", None))
+            continue
+        preview_path = storage.preview_path(filename)
+        present.append((image_id, filename, preview_path if os.path.exists(preview_path) else file_path))
+    try:
+        analyses = get_analyzer().analyze_batch([path for _, _, path in present])
+        results.extend((image_id, filename, "ok", analysis) for (image_id, filename, _), analysis in zip(present, analyses))
+    except Exception as e:
+        results.extend((image_id, filename, "error", str(e)) for image_id, filename, _ in present)
+    return results
+
+def analyze_existing_images(workers: int = 1, chunk_size: int = 500, resume: bool = False):
     """Analyze all images that haven't been analyzed yet."""
     db = SessionLocal()
-    analyzer = get_analyzer()
-    
+
     try:
-        # Get all unanalyzed images
-        unanalyzed = db.query(models.Image).filter(
+        base_query = db.query(models.Image.id, models.Image.filename).filter(
             models.Image.analyzed == False,
             models.Image.media_type == "image"
-        ).all()
-        
-        total = len(unanalyzed)
-        logger.info(f"Found {total} unanalyzed images")
-        
-        for idx, image in enumerate(unanalyzed, 1):
-            try:
-                file_path = os.path.join(UPLOAD_DIR, image.filename)
-                
-                if not os.path.exists(file_path):
-                    logger.warning(f"[{idx}/{total}] File not found: {image.filename}")
-                    continue
-                
-                logger.info(f"[{idx}/{total}] Analyzing {image.filename}...")
-                
-                # Perform analysis
-                analysis = analyzer.analyze_image(file_path)
-                
-                # Update database
-                image.analyzed = True
-                image.face_count = analysis['face_count']
-                image.has_people = analysis['has_people']
-                image.dominant_colors = analysis['dominant_colors']
-                image.brightness = analysis['brightness']
-                image.tags = analysis['tags']
-                
-                db.commit()
-                
-                logger.info(f"  ✓ {len(analysis['tags'])} tags, {analysis['face_count']} faces, brightness: {analysis['brightness']:.2f}")
-                
-            except Exception as e:
-                logger.error(f"  ✗ Error analyzing {image.filename}: {e}")
-                db.rollback()
-        
-        logger.info(f"✓ Analysis complete! Processed {total} images")
-        
+        )
+        start_after = batch_tools.load_checkpoint(CHECKPOINT_NAME) if resume else 0
+
+        total = base_query.filter(models.Image.id > start_after).count()
+        logger.info(f"Found {total} unanalyzed images" + (f" (resuming after ID {start_after})" if start_after else ""))
+
+        analyzed = 0
+        progress = batch_tools.Progress(total)
+
+        with batch_tools.worker_map(workers) as run:
+            for chunk in batch_tools.iter_chunks(db, base_query, chunk_size, start_after):
+                updates = []
+                rows = [tuple(row) for row in chunk]
+                batches = [rows[i:i + ANALYSIS_BATCH_SIZE] for i in range(0, len(rows), ANALYSIS_BATCH_SIZE)]
+                results = [result for batch in run(analyze_many, batches) for result in batch]
+                for image_id, filename, status, result in results:
+                    if status == "missing":
+                        logger.warning(f"File not found: {filename}")
+                    elif status == "error":
+                        logger.error(f"  ✗ Error analyzing {filename}: {result}")
+                    else:
+                        updates.append({
+                            "id": image_id,
+                            "analyzed": True,
+                            "analyzed_at": datetime.utcnow(),
+                            "face_count": result['face_count'],
+                            "has_people": result['has_people'],
+                            "dominant_colors": result['dominant_colors'],
+                            "brightness": result['brightness'],
+                            "tags": result['tags'],
+                        })
+
+                # One transaction per chunk instead of one commit per image
+                try:
+                    db.bulk_update_mappings(models.Image, updates)
+                    search.sync_tags_bulk(db, {update["id"]: update["tags"] for update in updates})
+                    db.commit()
+                    analyzed += len(updates)
+                except Exception as e:
+                    logger.error(f"  ✗ Failed to save chunk ending at ID {chunk[-1][0]}: {e}")
+                    db.rollback()
+                    raise
+
+                progress.update(len(chunk))
+                batch_tools.save_checkpoint(CHECKPOINT_NAME, chunk[-1][0])
+
+        progress.update(0, force=True)
+        batch_tools.clear_checkpoint(CHECKPOINT_NAME)
+        logger.info(f"✓ Analysis complete! Analyzed {analyzed} of {total} images")
+
     except Exception as e:
         logger.error(f"Batch analysis failed: {e}")
     finally:
         db.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Analyze all unanalyzed images")
+    batch_tools.add_batch_args(parser)
+    args = parser.parse_args()
+
     print("=" * 60)
     print("L8tePicture - Batch Image Analysis")
     print("=" * 60)
     print()
-    
-    analyze_existing_images()
-    
+
+    analyze_existing_images(args.workers, args.chunk_size, args.resume)
+
     print()
     print("=" * 60)
     print("Analysis complete!")
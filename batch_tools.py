@@ -0,0 +1,103 @@
+"""
+Batch Tools
+Shared plumbing for the maintenance scripts (generate_thumbnails.py, analyze_batch.py):
+- Streams image IDs from the database in keyset chunks instead of loading every row
+- Fans work out to a process pool (--workers N)
+- Progress/ETA reporting and a resume checkpoint
+"""
+
+import os
+import time
+import logging
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from contextlib import contextmanager
+import models
+
+logger = logging.getLogger(__name__)
+
+CHECKPOINT_DIR = os.path.join(os.getcwd(), "data")
+
+
+def add_batch_args(parser: argparse.ArgumentParser):
+    parser.add_argument("--workers", type=int, default=1,
+                        help="Number of worker processes (default: 1, no pool)")
+    parser.add_argument("--chunk-size", type=int, default=500,
+                        help="Images per database chunk / transaction (default: 500)")
+    parser.add_argument("--resume", action="store_true",
+                        help="Continue after the last checkpointed image ID")
+
+
+def iter_chunks(db, query, chunk_size: int, start_after: int = 0):
+    """
+    Yield lists of rows from `query` ordered by Image.id, chunk_size at a time.
+
+    `query` must select models.Image.id as its first column. Uses keyset
+    pagination (id > last) so each chunk is an index range scan.
+    """
+    last_id = start_after
+    while True:
+        rows = query.filter(models.Image.id > last_id).order_by(models.Image.id).limit(chunk_size).all()
+        if not rows:
+            return
+        yield rows
+        last_id = rows[-1][0]
+
+
+@contextmanager
+def worker_map(workers: int):
+    """Yields a map(fn, iterable) that runs in a process pool when workers > 1."""
+    if workers <= 1:
+        yield map
+        return
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        yield lambda fn, items: pool.map(fn, items, chunksize=max(1, len(items) // (workers * 4)))
+
+
+class Progress:
+    """Logs a `[done/total] rate, ETA` line at most every `interval` seconds."""
+
+    def __init__(self, total: int, interval: float = 2.0):
+        self.total = total
+        self.done = 0
+        self.interval = interval
+        self.started = time.monotonic()
+        self.last_report = 0.0
+
+    def update(self, count: int = 1, force: bool = False):
+        self.done += count
+        now = time.monotonic()
+        if not force and now - self.last_report < self.interval:
+            return
+        self.last_report = now
+        elapsed = now - self.started
+        rate = self.done / elapsed if elapsed > 0 else 0.0
+        remaining = (self.total - self.done) / rate if rate > 0 else 0
+        logger.info(f"[{self.done}/{self.total}] {rate:.1f} img/s, ETA {time.strftime('%H:%M:%S', time.gmtime(remaining))}")
+
+
+def _checkpoint_path(name: str) -> str:
+    return os.path.join(CHECKPOINT_DIR, f".{name}.checkpoint")
+
+
+def load_checkpoint(name: str) -> int:
+    try:
+        with open(_checkpoint_path(name)) as f:
+            return int(f.read().strip() or 0)
+    except (OSError, ValueError):
+        return 0
+
+
+def save_checkpoint(name: str, last_id: int):
+    os.makedirs(CHECKPOINT_DIR, exist_ok=True)
+    tmp_path = _checkpoint_path(name) + ".tmp"
+    with open(tmp_path, "w") as f:
+        f.write(str(last_id))
+    os.replace(tmp_path, _checkpoint_path(name))
+
+
+def clear_checkpoint(name: str):
+    try:
+        os.remove(_checkpoint_path(name))
+    except OSError:
+        pass
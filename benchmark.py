@@ -0,0 +1,470 @@
+"""
+Benchmark Suite
+Reproducible timings for the hot paths, so releases can be compared:
+- Synthetic corpus (JPEG/PNG/WebP in three sizes, short ffmpeg test clips) from a fixed seed
+- process_image_versions, ImageAnalyzer.analyze_image, /upload, /api/images at deep offsets, sync_existing_files
+- Each benchmark runs in its own forked process and working directory (isolated database, own peak RSS)
+- JSON results with throughput, p50/p99 latency and peak RSS; compare mode flags regressions
+
+Usage:
+    python benchmark.py run [--quick] [--only NAME,...] [--output results.json] [--baseline baseline.json]
+    python benchmark.py compare baseline.json results.json [--threshold 0.15]
+"""
+
+import io
+import os
+import sys
+import json
+import time
+import shutil
+import logging
+import platform
+import argparse
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+from datetime import datetime, timezone
+from typing import Callable, Dict, List
+import numpy as np
+from PIL import Image as PILImage
+
+logging.basicConfig(level=logging.INFO, format="%(message)s", stream=sys.stderr)
+logger = logging.getLogger("benchmark")
+
+REPO_DIR = os.path.dirname(os.path.abspath(__file__))
+
+IMAGE_SIZES = {"small": (640, 480), "medium": (1920, 1080), "large": (4000, 3000)}
+IMAGE_FORMATS = {"jpg": ("JPEG", {"quality": 90}), "png": ("PNG", {}), "webp": ("WEBP", {"quality": 85})}
+VIDEO_SIZES = [(640, 360), (1280, 720), (1920, 1080)]
+DEEP_OFFSETS = (0, 0.1, 0.5, 0.99)  # fractions of --rows
+
+# Relative change that counts as a regression in compare mode
+DEFAULT_THRESHOLD = 0.15
+# p99 changes below this many milliseconds are noise, whatever the ratio
+MIN_P99_DELTA_MS = 2.0
+
+
+# --- Corpus ---
+
+def synthetic_photo(rng: np.random.Generator, width: int, height: int) -> PILImage.Image:
+    """Smooth gradients and blobs plus sensor-like noise, so codecs see photo-like content."""
+    small_w, small_h = max(width // 16, 2), max(height // 16, 2)
+    gx = np.linspace(0, 1, small_w, dtype=np.float32)[None, :, None]
+    gy = np.linspace(0, 1, small_h, dtype=np.float32)[:, None, None]
+    base = rng.uniform(40, 200, 3) + rng.uniform(-80, 80, 3) * gx + rng.uniform(-80, 80, 3) * gy
+    for _ in range(6):
+        cx, cy, r = rng.uniform(0, 1), rng.uniform(0, 1), rng.uniform(0.05, 0.3)
+        blob = np.exp(-((gx - cx) ** 2 + (gy - cy) ** 2) / (2 * r * r))
+        base = base + blob * rng.uniform(-90, 90, 3)
+    img = PILImage.fromarray(np.clip(base, 0, 255).astype(np.uint8)).resize((width, height), PILImage.BICUBIC)
+    noise = rng.integers(-12, 13, (height, width, 3), dtype=np.int16)
+    return PILImage.fromarray(np.clip(np.asarray(img, dtype=np.int16) + noise, 0, 255).astype(np.uint8))
+
+
+def build_corpus(directory: str, per_kind: int, sizes: List[str], videos: int, seed: int) -> Dict:
+    """Writes the corpus (or reuses an identical one) and returns its manifest."""
+    params = {"per_kind": per_kind, "sizes": sizes, "videos": videos, "seed": seed}
+    manifest_path = os.path.join(directory, "manifest.json")
+    if os.path.exists(manifest_path):
+        with open(manifest_path) as f:
+            manifest = json.load(f)
+        if manifest.get("params") == params:
+            logger.info(f"Reusing corpus in {directory}")
+            return manifest
+    shutil.rmtree(directory, ignore_errors=True)
+    os.makedirs(directory)
+
+    rng = np.random.default_rng(seed)
+    files = []
+    for size_name in sizes:
+        width, height = IMAGE_SIZES[size_name]
+        for i in range(per_kind):
+            img = synthetic_photo(rng, width, height)
+            for ext, (fmt, options) in IMAGE_FORMATS.items():
+                name = f"{size_name}_{i}.{ext}"
+                img.save(os.path.join(directory, name), fmt, **options)
+                files.append({"name": name, "media_type": "image", "size": size_name, "format": ext})
+    if videos:
+        if shutil.which("ffmpeg") is None:
+            logger.warning("ffmpeg not found, corpus has no video clips")
+        else:
+            for i in range(videos):
+                width, height = VIDEO_SIZES[i % len(VIDEO_SIZES)]
+                name = f"clip_{i}_{height}p.mp4"
+                subprocess.run([
+                    "ffmpeg", "-y", "-v", "error", "-f", "lavfi",
+                    "-i", f"testsrc2=size={width}x{height}:rate=30", "-t", "5",
+                    "-pix_fmt", "yuv420p", os.path.join(directory, name)
+                ], check=True)
+                files.append({"name": name, "media_type": "video", "size": f"{height}p", "format": "mp4"})
+
+    manifest = {"params": params, "files": files}
+    with open(manifest_path, "w") as f:
+        json.dump(manifest, f, indent=2)
+    logger.info(f"Corpus: {len(files)} files in {directory}")
+    return manifest
+
+
+# --- Measurement ---
+
+def summarize(name: str, durations: List[float], items: int = None) -> Dict:
+    """Latency percentiles of individual operations; throughput in items (default: operations) per second."""
+    durations = np.asarray(durations, dtype=np.float64)
+    total = float(durations.sum())
+    count = items if items is not None else len(durations)
+    return {
+        "name": name,
+        "operations": len(durations),
+        "items": count,
+        "seconds": round(total, 4),
+        "throughput_per_s": round(count / total, 3) if total > 0 else None,
+        "p50_ms": round(float(np.percentile(durations, 50)) * 1000, 3),
+        "p99_ms": round(float(np.percentile(durations, 99)) * 1000, 3),
+    }
+
+
+def timed(fn: Callable, *args) -> float:
+    started = time.perf_counter()
+    fn(*args)
+    return time.perf_counter() - started
+
+
+def peak_rss_mb() -> float:
+    # ru_maxrss is KiB on Linux; children covers ffmpeg
+    own = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    children = resource.getrusage(resource.RUSAGE_CHILDREN).ru_maxrss
+    return round(max(own, children) / 1024, 1)
+
+
+# --- Benchmarks (each runs in a fresh process with cwd = its own working directory) ---
+
+BENCHMARKS: Dict[str, Callable] = {}
+
+def benchmark(name: str):
+    def register(fn):
+        BENCHMARKS[name] = fn
+        return fn
+    return register
+
+
+def corpus_files(corpus: Dict, media_type: str = None):
+    return [f for f in corpus["files"] if media_type is None or f["media_type"] == media_type]
+
+
+@benchmark("process_image_versions")
+def bench_process_image_versions(corpus: Dict, corpus_dir: str, args) -> List[Dict]:
+    import main
+    import storage
+    results = []
+    groups: Dict[str, List[Dict]] = {}
+    for f in corpus_files(corpus):
+        groups.setdefault(f"{f['media_type']}:{f['size']}" + (f":{f['format']}" if f["media_type"] == "image" else ""), []).append(f)
+    for group, files in groups.items():
+        durations = []
+        for _ in range(args.repeat):
+            for f in files:
+                for path in storage.rendition_paths(f["name"], f["media_type"]):
+                    if os.path.exists(path):
+                        os.remove(path)
+                durations.append(timed(main.process_image_versions, os.path.join(corpus_dir, f["name"]), f["name"], f["media_type"]))
+        results.append(summarize(f"process_image_versions[{group}]", durations))
+    return results
+
+
+@benchmark("analyze_image")
+def bench_analyze_image(corpus: Dict, corpus_dir: str, args) -> List[Dict]:
+    from image_analyzer import get_analyzer
+    analyzer = get_analyzer()
+    results = []
+    for size in sorted({f["size"] for f in corpus_files(corpus, "image")}, key=list(IMAGE_SIZES).index):
+        files = [f for f in corpus_files(corpus, "image") if f["size"] == size]
+        durations = [timed(analyzer.analyze_image, os.path.join(corpus_dir, f["name"])) for _ in range(args.repeat) for f in files]
+        results.append(summarize(f"analyze_image[{size}]", durations))
+    return results
+
+
+@benchmark("upload")
+def bench_upload(corpus: Dict, corpus_dir: str, args) -> List[Dict]:
+    import main
+    from fastapi.testclient import TestClient
+    main.prepare_database()
+    client = TestClient(main.app)
+    content_types = {"jpg": "image/jpeg", "png": "image/png", "webp": "image/webp", "mp4": "video/mp4"}
+    durations = []
+    uploaded_bytes = 0
+    for round_index in range(args.repeat):
+        for f in corpus_files(corpus):
+            with open(os.path.join(corpus_dir, f["name"]), "rb") as src:
+                # A trailer per round keeps repeated uploads from being deduplicated
+                data = src.read() + f"pixi-benchmark-{round_index}".encode()
+            started = time.perf_counter()
+            response = client.post("/upload", files={"files": (f["name"], data, content_types[f["format"]])})
+            durations.append(time.perf_counter() - started)
+            response.raise_for_status()
+            uploaded_bytes += len(data)
+    result = summarize("upload", durations)
+    result["mb_per_s"] = round(uploaded_bytes / 1024 / 1024 / sum(durations), 2)
+    return [result]
+
+
+@benchmark("list_images")
+def bench_list_images(corpus: Dict, corpus_dir: str, args) -> List[Dict]:
+    import main
+    import models
+    from database import SessionLocal
+    from datetime import timedelta
+    from fastapi.testclient import TestClient
+
+    main.prepare_database()
+    started_at = datetime(2020, 1, 1)
+    with SessionLocal() as db:
+        for start in range(0, args.rows, 5000):
+            db.execute(models.Image.__table__.insert(), [{
+                "filename": f"bench_{i}.jpg", "original_name": f"bench_{i}.jpg", "media_type": "image",
+                "upload_date": started_at + timedelta(minutes=i), "width": 4000, "height": 3000, "size": 3_000_000,
+                "analyzed": i % 3 != 0, "face_count": i % 4, "has_people": i % 5 == 0, "brightness": (i % 100) / 100,
+                "tags": ["landscape", "bright"] if i % 2 else ["portrait"],
+            } for i in range(start, min(start + 5000, args.rows))])
+        db.commit()
+
+    client = TestClient(main.app)
+    cache = main.get_page_cache()
+    client.get("/api/images").raise_for_status()  # warm-up: connection pool, statement cache
+    results = []
+    for fraction in DEEP_OFFSETS:
+        offset = min(int(args.rows * fraction), max(args.rows - 50, 0))
+        durations = []
+        for _ in range(args.iterations):
+            cache.clear()  # measure the database path, not the page cache
+            started = time.perf_counter()
+            client.get("/api/images", params={"offset": offset, "limit": 50}).raise_for_status()
+            durations.append(time.perf_counter() - started)
+        results.append(summarize(f"get_images_api[offset={offset}]", durations))
+
+    # Same depth through keyset pagination, for comparison with the deepest offset
+    with SessionLocal() as db:
+        row = main.gallery_query(db).offset(offset - 1).first() if offset else None
+    cursor = main.encode_cursor(row) if row else None
+    durations = []
+    for _ in range(args.iterations):
+        cache.clear()
+        started = time.perf_counter()
+        client.get("/api/images", params={"cursor": cursor or "", "limit": 50}).raise_for_status()
+        durations.append(time.perf_counter() - started)
+    results.append(summarize(f"get_images_api[cursor@{offset}]", durations))
+
+    durations = []
+    for _ in range(args.iterations):
+        started = time.perf_counter()
+        client.get("/api/images", params={"limit": 50}).raise_for_status()
+        durations.append(time.perf_counter() - started)
+    results.append(summarize("get_images_api[cached]", durations))
+    return results
+
+
+@benchmark("sync_existing_files")
+def bench_sync_existing_files(corpus: Dict, corpus_dir: str, args) -> List[Dict]:
+    import main
+    import folder_observer
+
+    main.prepare_database()
+
+    # Tiny distinct JPEGs: the cost under test is scanning, hashing and registering, not decoding
+    buffer = io.BytesIO()
+    synthetic_photo(np.random.default_rng(args.seed), 64, 48).save(buffer, "JPEG", quality=80)
+    payload = buffer.getvalue()
+    for i in range(args.sync_files):
+        with open(os.path.join(folder_observer.UPLOAD_DIR, f"sync_{i:06d}.jpg"), "wb") as f:
+            f.write(payload + i.to_bytes(4, "little"))
+
+    results = [summarize("sync_existing_files[initial]", [timed(folder_observer.sync_existing_files)], args.sync_files)]
+    durations = [timed(folder_observer.sync_existing_files) for _ in range(args.repeat)]
+    results.append(summarize("sync_existing_files[unchanged]", durations, args.sync_files * len(durations)))
+    return results
+
+
+def _run_child(name: str, workdir: str, corpus: Dict, corpus_dir: str, args, conn):
+    try:
+        os.makedirs(workdir)
+        os.chdir(workdir)
+        for directory in ("static", "templates"):
+            os.symlink(os.path.join(REPO_DIR, directory), directory)
+        sys.path.insert(0, REPO_DIR)
+        # The app logs every request and job at INFO
+        logging.getLogger().setLevel(logging.WARNING)
+        results = BENCHMARKS[name](corpus, corpus_dir, args)
+        peak = peak_rss_mb()
+        conn.send({"results": [dict(r, peak_rss_mb=peak) for r in results]})
+    except BaseException as e:
+        conn.send({"error": f"{type(e).__name__}: {e}"})
+    finally:
+        conn.close()
+
+
+def run(args) -> Dict:
+    workdir = args.workdir or tempfile.mkdtemp(prefix="pixi-bench-")
+    corpus_dir = os.path.abspath(args.corpus or os.path.join(workdir, "corpus"))
+    sizes = ["small", "medium"] if args.quick else list(IMAGE_SIZES)
+    corpus = build_corpus(corpus_dir, args.per_kind, sizes, args.videos, args.seed)
+
+    selected = args.only.split(",") if args.only else list(BENCHMARKS)
+    unknown = set(selected) - set(BENCHMARKS)
+    if unknown:
+        raise SystemExit(f"Unknown benchmark(s): {', '.join(sorted(unknown))}")
+
+    ctx = multiprocessing.get_context("fork")
+    results = []
+    for name in selected:
+        logger.info(f"Running {name}...")
+        parent_conn, child_conn = ctx.Pipe(duplex=False)
+        process = ctx.Process(target=_run_child, args=(name, os.path.join(workdir, name), corpus, corpus_dir, args, child_conn))
+        process.start()
+        child_conn.close()
+        try:
+            outcome = parent_conn.recv()
+        except EOFError:
+            outcome = None
+        process.join()
+        if outcome is None:
+            outcome = {"error": f"process exited with code {process.exitcode}"}
+        if "error" in outcome:
+            logger.error(f"  {name} failed: {outcome['error']}")
+            results.append({"name": name, "error": outcome["error"]})
+            continue
+        for result in outcome["results"]:
+            logger.info(f"  {result['name']}: {result['throughput_per_s']}/s, p50 {result['p50_ms']}ms, "
+                        f"p99 {result['p99_ms']}ms, peak RSS {result['peak_rss_mb']}MB")
+        results.extend(outcome["results"])
+
+    if not args.keep and not args.workdir:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    return {
+        "meta": {
+            "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+            "commit": _git_commit(),
+            "python": platform.python_version(),
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "params": {k: getattr(args, k) for k in ("quick", "repeat", "iterations", "rows", "sync_files", "per_kind", "videos", "seed")},
+        },
+        "benchmarks": results,
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+# --- Compare ---
+
+def compare(baseline: Dict, current: Dict, threshold: float = DEFAULT_THRESHOLD) -> List[str]:
+    """Human-readable regressions of current against baseline (empty if none)."""
+    before = {b["name"]: b for b in baseline["benchmarks"] if "error" not in b}
+    regressions = []
+    for result in current["benchmarks"]:
+        name = result["name"]
+        if "error" in result:
+            regressions.append(f"{name}: failed ({result['error']})")
+            continue
+        old = before.get(name)
+        if old is None:
+            continue
+        if old["throughput_per_s"] and result["throughput_per_s"] is not None and \
+                result["throughput_per_s"] < old["throughput_per_s"] * (1 - threshold):
+            regressions.append(f"{name}: throughput {old['throughput_per_s']} -> {result['throughput_per_s']}/s")
+        if result["p99_ms"] > old["p99_ms"] * (1 + threshold) and result["p99_ms"] - old["p99_ms"] > MIN_P99_DELTA_MS:
+            regressions.append(f"{name}: p99 {old['p99_ms']} -> {result['p99_ms']}ms")
+        if result["peak_rss_mb"] > old["peak_rss_mb"] * (1 + threshold):
+            regressions.append(f"{name}: peak RSS {old['peak_rss_mb']} -> {result['peak_rss_mb']}MB")
+    return regressions
+
+
+def print_comparison(baseline: Dict, current: Dict, threshold: float, file=sys.stdout) -> int:
+    """Prints a before/after table and the regressions; returns the exit code (1 on regressions)."""
+    before = {b["name"]: b for b in baseline["benchmarks"] if "error" not in b}
+    print(f"{'benchmark':<48} {'throughput/s':>22} {'p99 ms':>22} {'peak RSS MB':>18}", file=file)
+    for result in current["benchmarks"]:
+        old = before.get(result["name"])
+        if old is None or "error" in result:
+            continue
+        print(f"{result['name']:<48} {_delta(old['throughput_per_s'], result['throughput_per_s']):>22} "
+              f"{_delta(old['p99_ms'], result['p99_ms']):>22} {_delta(old['peak_rss_mb'], result['peak_rss_mb']):>18}", file=file)
+    regressions = compare(baseline, current, threshold)
+    print(file=file)
+    if regressions:
+        print(f"REGRESSIONS (threshold {threshold:.0%}):", file=file)
+        for line in regressions:
+            print(f"  - {line}", file=file)
+        return 1
+    print(f"No regressions (threshold {threshold:.0%}).", file=file)
+    return 0
+
+
+def _delta(old, new) -> str:
+    if not old or new is None:
+        return f"{new}"
+    return f"{new} ({(new - old) / old:+.0%})"
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Benchmark ingest, rendition, analysis and listing hot paths")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run_parser = commands.add_parser("run", help="Run the benchmarks and emit JSON results")
+    run_parser.add_argument("--quick", action="store_true", help="Skip the 4000x3000 images; smaller defaults")
+    run_parser.add_argument("--only", help=f"Comma-separated subset of: {', '.join(BENCHMARKS)}")
+    run_parser.add_argument("--output", help="Write results to this file (default: stdout)")
+    run_parser.add_argument("--baseline", help="Compare against this saved result and exit 1 on regressions")
+    run_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+    run_parser.add_argument("--repeat", type=int, default=None, help="Passes over the corpus (default: 3, quick: 1)")
+    run_parser.add_argument("--iterations", type=int, default=50, help="Requests per listing measurement")
+    run_parser.add_argument("--rows", type=int, default=None, help="Synthetic rows for listing (default: 100000, quick: 20000)")
+    run_parser.add_argument("--sync-files", type=int, default=None, help="Files for sync_existing_files (default: 10000, quick: 1000)")
+    run_parser.add_argument("--per-kind", type=int, default=2, help="Images per size and format in the corpus")
+    run_parser.add_argument("--videos", type=int, default=3, help="ffmpeg test clips in the corpus")
+    run_parser.add_argument("--seed", type=int, default=1234)
+    run_parser.add_argument("--corpus", help="Corpus directory, reused across runs if the parameters match")
+    run_parser.add_argument("--workdir", help="Working directory (default: a temporary directory)")
+    run_parser.add_argument("--keep", action="store_true", help="Keep the temporary working directory")
+
+    compare_parser = commands.add_parser("compare", help="Compare two result files")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD)
+
+    args = parser.parse_args()
+
+    if args.command == "compare":
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        with open(args.current) as f:
+            current = json.load(f)
+        sys.exit(print_comparison(baseline, current, args.threshold))
+
+    if args.repeat is None:
+        args.repeat = 1 if args.quick else 3
+    if args.rows is None:
+        args.rows = 20000 if args.quick else 100000
+    if args.sync_files is None:
+        args.sync_files = 1000 if args.quick else 10000
+
+    report = run(args)
+    output = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output + "\n")
+        logger.info(f"Results written to {args.output}")
+    else:
+        print(output)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        # Keep stdout pure JSON when the results go there
+        sys.exit(print_comparison(baseline, report, args.threshold, sys.stdout if args.output else sys.stderr))
@@ -0,0 +1,169 @@
+"""
+Colour Similarity Index
+"Find images with this palette / similar to this image" over dominant_colors:
+- Each palette (3 colours, most dominant first) becomes a fixed 9-float CIE Lab vector
+- Vectors live in a packed float32 matrix on disk, memory-mapped for queries
+- Queries are one vectorised weighted distance pass plus a partial sort
+"""
+
+import os
+import json
+import logging
+import threading
+from typing import List, Optional, Sequence, Tuple
+import numpy as np
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import models
+
+logger = logging.getLogger(__name__)
+
+INDEX_DIR = os.path.join(os.getcwd(), "data")
+PALETTE_SIZE = 3
+DIMENSIONS = PALETTE_SIZE * 3
+# The most dominant colour counts most
+WEIGHTS = np.sqrt(np.repeat(np.array([1.0, 0.6, 0.35], dtype=np.float32), 3))
+
+
+def rgb_to_lab(rgb) -> np.ndarray:
+    """sRGB (0-255, shape (..., 3)) to CIE Lab (D65)."""
+    c = np.asarray(rgb, dtype=np.float32) / 255.0
+    c = np.where(c > 0.04045, ((c + 0.055) / 1.055) ** 2.4, c / 12.92)
+    xyz = c @ np.array([
+        [0.4124, 0.2126, 0.0193],
+        [0.3576, 0.7152, 0.1192],
+        [0.1805, 0.0722, 0.9505],
+    ], dtype=np.float32)
+    xyz /= np.array([0.95047, 1.0, 1.08883], dtype=np.float32)
+    f = np.where(xyz > 0.008856, np.cbrt(xyz), 7.787 * xyz + 16 / 116)
+    return np.stack([116 * f[..., 1] - 16, 500 * (f[..., 0] - f[..., 1]), 200 * (f[..., 1] - f[..., 2])], axis=-1)
+
+
+def palette_vector(colors: Sequence[Sequence[int]]) -> np.ndarray:
+    """Fixed-length weighted Lab vector; short palettes repeat their last colour."""
+    colors = [list(c)[:3] for c in colors][:PALETTE_SIZE] or [[128, 128, 128]]
+    while len(colors) < PALETTE_SIZE:
+        colors.append(colors[-1])
+    return (rgb_to_lab(colors).reshape(DIMENSIONS) * WEIGHTS).astype(np.float32)
+
+
+def parse_hex_palette(value: str) -> List[List[int]]:
+    """'ff0000,00ff00' -> [[255, 0, 0], [0, 255, 0]]"""
+    colors = []
+    for part in value.split(","):
+        part = part.strip().lstrip("#")
+        if len(part) != 6:
+            raise ValueError(f"Invalid colour '{part}'")
+        colors.append([int(part[i:i + 2], 16) for i in (0, 2, 4)])
+    return colors
+
+
+class ColorIndex:
+    """
+    Packed (N, 9) float32 matrix of palette vectors plus the matching image ids.
+
+    Stored as .npy files in data/ and opened with mmap_mode, so a restart
+    does not re-read every palette from the database. Each row also keeps
+    the time its image was analysed, so sync() re-reads exactly the palettes
+    that were added or re-analysed since the last call.
+    """
+
+    def __init__(self, directory: str = INDEX_DIR):
+        self.directory = directory
+        self._vectors_path = os.path.join(directory, "color_index.vectors.npy")
+        self._ids_path = os.path.join(directory, "color_index.ids.npy")
+        self._stamps_path = os.path.join(directory, "color_index.stamps.npy")
+        self._meta_path = os.path.join(directory, "color_index.json")
+        self._lock = threading.Lock()
+        # (ids, vectors) swapped as one tuple so readers never see a mismatched pair
+        self._data = (np.empty(0, dtype=np.int64), np.empty((0, DIMENSIONS), dtype=np.float32))
+        self._stamps = np.empty(0, dtype=np.float64)
+        self._signature = None
+        self._load()
+
+    def __len__(self):
+        return len(self._data[0])
+
+    def _load(self):
+        try:
+            with open(self._meta_path) as f:
+                self._signature = tuple(json.load(f)["signature"])
+            self._data = (np.load(self._ids_path, mmap_mode="r"), np.load(self._vectors_path, mmap_mode="r"))
+            self._stamps = np.load(self._stamps_path)
+        except (OSError, ValueError, KeyError):
+            # Missing or from before per-row stamps: the next sync rebuilds it
+            self._signature = None
+
+    def _save(self, ids: np.ndarray, vectors: np.ndarray, stamps: np.ndarray, signature):
+        os.makedirs(self.directory, exist_ok=True)
+        for path, array in ((self._vectors_path, vectors), (self._ids_path, ids), (self._stamps_path, stamps)):
+            tmp_path = path + ".tmp.npy"
+            np.save(tmp_path, array)
+            os.replace(tmp_path, path)
+        with open(self._meta_path + ".tmp", "w") as f:
+            json.dump({"signature": list(signature)}, f)
+        os.replace(self._meta_path + ".tmp", self._meta_path)
+        self._data = (np.load(self._ids_path, mmap_mode="r"), np.load(self._vectors_path, mmap_mode="r"))
+        self._stamps = stamps
+        self._signature = signature
+
+    def sync(self, db: Session):
+        """Bring the matrix up to date with the analyzed images in the database."""
+        indexed = (models.Image.analyzed == True, models.Image.dominant_colors.isnot(None))
+        # Julian day of the last analysis; 0 for images analysed before analyzed_at existed
+        stamp = func.coalesce(func.julianday(models.Image.analyzed_at), 0.0)
+        signature = tuple(db.query(
+            func.count(models.Image.id), func.total(models.Image.id), func.total(stamp)
+        ).filter(*indexed).one())
+        if signature == self._signature:
+            return
+        with self._lock:
+            old_ids, old_vectors = self._data
+            old_stamps = self._stamps if self._signature is not None else np.full(len(old_ids), np.nan)
+            rows = db.query(models.Image.id, stamp).filter(*indexed).order_by(models.Image.id).all()
+            ids = np.fromiter((image_id for image_id, _ in rows), dtype=np.int64, count=len(rows))
+            stamps = np.fromiter((value for _, value in rows), dtype=np.float64, count=len(rows))
+
+            # Rows whose image is still indexed and was not analysed again keep their vector
+            vectors = np.empty((len(ids), DIMENSIONS), dtype=np.float32)
+            _, old_rows, rows_kept = np.intersect1d(old_ids, ids, assume_unique=True, return_indices=True)
+            unchanged = old_stamps[old_rows] == stamps[rows_kept]
+            vectors[rows_kept[unchanged]] = old_vectors[old_rows[unchanged]]
+            fresh = np.ones(len(ids), dtype=bool)
+            fresh[rows_kept[unchanged]] = False
+
+            fresh_rows = np.flatnonzero(fresh)
+            for start in range(0, len(fresh_rows), 900):
+                chunk = fresh_rows[start:start + 900]
+                palettes = dict(db.query(models.Image.id, models.Image.dominant_colors).filter(
+                    models.Image.id.in_(ids[chunk].tolist())
+                ))
+                for row in chunk:
+                    vectors[row] = palette_vector(palettes.get(int(ids[row])) or [])
+            self._save(ids, vectors, stamps, signature)
+        logger.info(f"Colour index: {len(ids)} palettes ({len(fresh_rows)} read, "
+                    f"{len(old_ids) - int(unchanged.sum())} dropped or replaced)")
+
+    def query(self, vector: np.ndarray, limit: int, exclude: Optional[int] = None) -> List[Tuple[int, float]]:
+        """(image_id, distance) of the `limit` nearest palettes, closest first."""
+        ids, vectors = self._data
+        if not len(ids):
+            return []
+        diff = vectors - vector
+        distances = np.einsum("ij,ij->i", diff, diff)
+        if exclude is not None:
+            distances[ids == exclude] = np.inf
+        k = min(limit, len(ids))
+        top = np.argpartition(distances, k - 1)[:k]
+        top = top[np.argsort(distances[top])]
+        return [(int(ids[i]), float(np.sqrt(distances[i]))) for i in top if np.isfinite(distances[i])]
+
+
+_index = None
+
+def get_index() -> ColorIndex:
+    """Get or create the global colour index."""
+    global _index
+    if _index is None:
+        _index = ColorIndex()
+    return _index
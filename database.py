@@ -1,19 +1,69 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, event
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 
 import os
+import time
+import metrics
 
 # Create data directory if it doesn't exist
 os.makedirs("data", exist_ok=True)
 
 SQLALCHEMY_DATABASE_URL = "sqlite:///./data/data.db"
 
-engine = create_engine(
-    SQLALCHEMY_DATABASE_URL, connect_args={"check_same_thread": False}
-)
+# SQLite performance profile, applied to every new connection.
+# WAL lets readers (gallery requests) proceed while the observer, workers and
+# analysis write; busy_timeout makes concurrent writers wait instead of failing
+# with "database is locked".
+SQLITE_PRAGMAS = {
+    "journal_mode": os.environ.get("PIXI_SQLITE_JOURNAL_MODE", "WAL"),
+    "synchronous": os.environ.get("PIXI_SQLITE_SYNCHRONOUS", "NORMAL"),
+    "busy_timeout": int(os.environ.get("PIXI_SQLITE_BUSY_TIMEOUT_MS", 30000)),
+    "cache_size": -int(os.environ.get("PIXI_SQLITE_CACHE_MB", 16)) * 1024,  # negative = KiB
+    "mmap_size": int(os.environ.get("PIXI_SQLITE_MMAP_MB", 256)) * 1024 * 1024,
+    "temp_store": "MEMORY",
+}
+POOL_SIZE = int(os.environ.get("PIXI_DB_POOL_SIZE", 5))
+READ_POOL_SIZE = int(os.environ.get("PIXI_DB_READ_POOL_SIZE", 10))
+
+def _apply_pragmas(dbapi_connection, connection_record):
+    cursor = dbapi_connection.cursor()
+    for name, value in SQLITE_PRAGMAS.items():
+        cursor.execute(f"PRAGMA {name}={value}")
+    cursor.close()
+
+def _make_engine(pool_size: int, read_only: bool = False):
+    new_engine = create_engine(
+        SQLALCHEMY_DATABASE_URL,
+        connect_args={"check_same_thread": False, "timeout": SQLITE_PRAGMAS["busy_timeout"] / 1000},
+        pool_size=pool_size,
+        max_overflow=pool_size,
+    )
+    event.listen(new_engine, "connect", _apply_pragmas)
+    if read_only:
+        event.listen(new_engine, "connect", lambda conn, record: conn.execute("PRAGMA query_only=1"))
+    return new_engine
+
+# Read/write engine: uploads, favorites, job queue, observer, analysis
+engine = _make_engine(POOL_SIZE)
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# Separate read-only pool for gallery listings, so background writers holding
+# connections never make page loads wait for one
+read_engine = _make_engine(READ_POOL_SIZE, read_only=True)
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine)
+
+# Commit timing (flush included) for the db_commit pipeline stage
+@event.listens_for(SessionLocal, "before_commit")
+def _commit_started(session):
+    session.info["commit_started"] = (time.perf_counter(), time.thread_time())
+
+@event.listens_for(SessionLocal, "after_commit")
+def _commit_finished(session):
+    started = session.info.pop("commit_started", None)
+    if started:
+        metrics.stage_seconds.observe("db_commit", time.perf_counter() - started[0], time.thread_time() - started[1])
+
 Base = declarative_base()
 
 def get_db():
@@ -23,6 +73,47 @@ def get_db():
     finally:
         db.close()
 
+def get_read_db():
+    db = ReadSessionLocal()
+    try:
+        yield db
+    finally:
+        db.close()
+
+def dispose_engines():
+    """Drop pooled connections inherited across fork (worker processes)."""
+    engine.dispose(close=False)
+    read_engine.dispose(close=False)
+
+# Bump whenever run_migrations or the models change the schema; a database at
+# this version skips all PRAGMA checks on boot.
+SCHEMA_VERSION = 4  # 2: file_deletions, 3: capture dates and timeline_months, 4: analyzed_at
+
+def schema_version() -> int:
+    with engine.connect() as conn:
+        return conn.exec_driver_sql("PRAGMA user_version").scalar()
+
+def init_schema(backfill=None) -> bool:
+    """
+    Bring the database up to SCHEMA_VERSION; one PRAGMA read when it already is.
+
+    backfill(session) runs once per upgrade, before the new version is
+    recorded, so an interrupted upgrade is retried on the next boot.
+    Returns True if the schema was migrated.
+    """
+    if schema_version() >= SCHEMA_VERSION:
+        return False
+    import models  # registers the tables on Base
+    run_migrations()
+    Base.metadata.create_all(bind=engine)
+    if backfill:
+        with SessionLocal() as db:
+            backfill(db)
+    with engine.connect() as conn:
+        conn.exec_driver_sql(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        conn.commit()
+    return True
+
 def run_migrations():
     import sqlite3
     db_path = "./data/data.db"
@@ -74,7 +165,47 @@ def run_migrations():
                 cursor.execute(f"ALTER TABLE images ADD COLUMN {col} {col_type}")
                 conn.commit()
                 print(f"Migration: Successfully added {col} column.")
+
+        # File fingerprint columns for incremental startup sync, video duration, gallery placeholder
+        for col, col_type in {"file_mtime": "FLOAT", "file_inode": "INTEGER", "duration": "FLOAT", "placeholder": "VARCHAR"}.items():
+            if columns and col not in columns:
+                print(f"Migration: Adding {col} column to images table...")
+                cursor.execute(f"ALTER TABLE images ADD COLUMN {col} {col_type}")
+                conn.commit()
+
+        # Perceptual hash for near-duplicate detection
+        if columns and "perceptual_hash" not in columns:
+            print("Migration: Adding perceptual_hash column to images table...")
+            cursor.execute("ALTER TABLE images ADD COLUMN perceptual_hash INTEGER")
+            cursor.execute("CREATE INDEX ix_images_perceptual_hash ON images (perceptual_hash)")
+            conn.commit()
+
+        # EXIF capture info; existing rows are read by timeline.backfill_capture_dates
+        for col, col_type in {"taken_at": "DATETIME", "orientation": "INTEGER", "camera": "VARCHAR"}.items():
+            if columns and col not in columns:
+                print(f"Migration: Adding {col} column to images table...")
+                cursor.execute(f"ALTER TABLE images ADD COLUMN {col} {col_type}")
+                conn.commit()
+
+        # Change marker for the colour index (color_index.py)
+        if columns and "analyzed_at" not in columns:
+            print("Migration: Adding analyzed_at column to images table...")
+            cursor.execute("ALTER TABLE images ADD COLUMN analyzed_at DATETIME")
+            conn.commit()
+
+        # Composite indexes backing keyset pagination of the gallery
+        if columns:
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_images_upload_date_id ON images (upload_date, id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_images_favorite_upload_date_id ON images (is_favorite, upload_date, id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_images_timeline_id ON images (coalesce(taken_at, upload_date), id)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_images_favorite_timeline_id ON images (is_favorite, coalesce(taken_at, upload_date), id)")
+            # Smart search filters
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_images_face_count ON images (face_count)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_images_has_people ON images (has_people)")
+            cursor.execute("CREATE INDEX IF NOT EXISTS ix_images_brightness ON images (brightness)")
+            conn.commit()
     except Exception as e:
         print(f"Migration Error: {e}")
+        raise  # keeps user_version unchanged, so the migration is retried on the next boot
     finally:
         conn.close()
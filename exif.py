@@ -0,0 +1,91 @@
+"""
+EXIF Metadata
+Capture date, orientation and camera from the image header:
+- Read from an already opened PIL image (or a path), no pixels are decoded
+- DateTimeOriginal from the Exif IFD, falling back to DateTime in IFD0
+- Camera is "Make Model", without the make repeated when the model already contains it
+- Missing or malformed tags are None; a broken EXIF block never fails the ingest
+"""
+
+import logging
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Optional, Tuple
+from PIL import Image as PILImage
+
+logger = logging.getLogger(__name__)
+
+EXIF_IFD = 0x8769
+TAG_DATETIME = 0x0132
+TAG_DATETIME_ORIGINAL = 0x9003
+TAG_ORIENTATION = 0x0112
+TAG_MAKE = 0x010F
+TAG_MODEL = 0x0110
+
+# Stored in images.orientation when the file could not be read (EXIF values are 1-8)
+UNREADABLE = 0
+
+
+@dataclass
+class CaptureInfo:
+    taken_at: Optional[datetime] = None  # camera local time, as written by the camera
+    orientation: int = 1
+    camera: Optional[str] = None
+
+
+def _text(value) -> Optional[str]:
+    if isinstance(value, bytes):
+        value = value.decode("ascii", "ignore")
+    if not isinstance(value, str):
+        return None
+    value = value.replace("\x00", "").strip()
+    return value or None
+
+
+def parse_datetime(value) -> Optional[datetime]:
+    """EXIF "YYYY:MM:DD HH:MM:SS"; placeholder dates written by some cameras ("0000:00:00 …") are None."""
+    value = _text(value)
+    if not value:
+        return None
+    # Sub-second and time zone suffixes (written by some software) are ignored
+    for fmt in ("%Y:%m:%d %H:%M:%S", "%Y-%m-%d %H:%M:%S"):
+        try:
+            return datetime.strptime(value[:19], fmt)
+        except ValueError:
+            continue
+    return None
+
+
+def read(img: PILImage.Image) -> CaptureInfo:
+    """Capture info of an opened image; only the EXIF block already parsed from the header is used."""
+    # PIL decodes a whole PNG to look for an eXIf chunk behind the pixel data; one in front is in info
+    if img.format == "PNG" and "exif" not in img.info:
+        return CaptureInfo()
+    try:
+        exif = img.getexif()
+    except Exception as e:
+        logger.debug(f"Unreadable EXIF block: {e}")
+        return CaptureInfo()
+    if not exif:
+        return CaptureInfo()
+    try:
+        taken_at = parse_datetime(exif.get_ifd(EXIF_IFD).get(TAG_DATETIME_ORIGINAL))
+    except Exception:
+        taken_at = None
+    info = CaptureInfo(taken_at=taken_at or parse_datetime(exif.get(TAG_DATETIME)))
+
+    orientation = exif.get(TAG_ORIENTATION)
+    if isinstance(orientation, int) and 1 <= orientation <= 8:
+        info.orientation = orientation
+
+    make, model = _text(exif.get(TAG_MAKE)), _text(exif.get(TAG_MODEL))
+    if make and model and model.lower().startswith(make.split()[0].lower()):
+        make = None
+    info.camera = " ".join(part for part in (make, model) if part) or None
+    return info
+
+
+def read_file(path: str) -> Tuple[Tuple[int, int], CaptureInfo]:
+    """((width, height), capture info) from one lazy open of the file."""
+    with PILImage.open(path) as img:
+        return img.size, read(img)
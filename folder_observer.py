@@ -1,273 +1,263 @@
 import os
 import time
 import logging
-import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Dict, Optional, Tuple
 from watchdog.observers import Observer
 from watchdog.events import FileSystemEventHandler
-from sqlalchemy.orm import Session
-from PIL import Image as PILImage
 import models
 from database import SessionLocal
-from image_analyzer import analyze_image
+import ingest
+import job_queue
+import page_cache
+import batch_tools
+import storage
 
 # Setup logging
 logger = logging.getLogger(__name__)
 
-# Use absolute paths for reliability
-BASE_DIR = os.getcwd()
-UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
-PREVIEW_DIR = os.path.join(BASE_DIR, "previews")
-THUMB_DIR = os.path.join(BASE_DIR, "thumbnails")
+UPLOAD_DIR = storage.UPLOAD_DIR
+PREVIEW_DIR = storage.PREVIEW_DIR
+THUMB_DIR = storage.THUMB_DIR
 
-def generate_video_thumbnail(video_path, thumb_path):
-    """Extracts a frame from the video using ffmpeg and saves as WebP."""
-    import subprocess
-    try:
-        subprocess.run([
-            'ffmpeg', '-y', '-ss', '00:00:01', '-i', video_path, 
-            '-vframes', '1', 
-            '-vf', 'scale=400:-1', 
-            '-c:v', 'webp', '-lossless', '0', '-compression_level', '4', '-q:v', '65',
-            thumb_path
-        ], check=True, capture_output=True)
-        return True
-    except Exception as e:
-        logger.error(f"FFmpeg thumbnail failed (Watcher): {e}")
-        return False
-
-def generate_video_preview(video_path, preview_path):
-    """Generates a short (3s) silent looping preview of the video."""
-    import subprocess
-    try:
-        subprocess.run([
-            'ffmpeg', '-y', '-ss', '00:00:01', '-t', '3', '-i', video_path,
-            '-vf', 'fps=10,scale=320:-1:flags=lanczos',
-            '-loop', '0', '-c:v', 'webp', '-lossless', '0', '-compression_level', '4', '-q:v', '50',
-            preview_path
-        ], check=True, capture_output=True)
-        return True
-    except Exception as e:
-        logger.error(f"FFmpeg preview generation failed (Watcher): {e}")
-        return False
-
-def process_image_versions(file_path: str, filename: str, media_type: str = "image"):
-    """Generates a small thumbnail and a medium preview in WebP format."""
-    try:
-        if not os.path.exists(file_path):
-            return
+# A file counts as complete once its size/mtime stayed unchanged this long (FTP, SMB copies)
+STABLE_SECONDS = float(os.environ.get("PIXI_INGEST_STABLE_SECONDS", 2))
+SCAN_INTERVAL = 0.5
+INGEST_THREADS = int(os.environ.get("PIXI_INGEST_THREADS", 4))
+SYNC_THREADS = int(os.environ.get("PIXI_SYNC_THREADS", 4))
 
-        if media_type == "video":
-            thumb_path = os.path.join(THUMB_DIR, filename + ".webp")
-            preview_path = os.path.join(THUMB_DIR, filename + "_preview.webp")
-            
-            if not os.path.exists(thumb_path):
-                generate_video_thumbnail(file_path, thumb_path)
-            
-            if not os.path.exists(preview_path):
-                generate_video_preview(file_path, preview_path)
-            return
 
-        with PILImage.open(file_path) as img:
-            # Generate Preview (max 1600px)
-            preview_path = os.path.join(PREVIEW_DIR, filename + ".webp")
-            if not os.path.exists(preview_path):
-                preview_img = img.copy()
-                preview_img.thumbnail((1600, 1600))
-                # Ensure RGB for JPEG/PNG compatibility
-                if preview_img.mode in ("RGBA", "P"):
-                    preview_img = preview_img.convert("RGB")
-                preview_img.save(preview_path, "WEBP", quality=75)
-
-            # Generate Thumbnail (max 300px)
-            thumb_path = os.path.join(THUMB_DIR, filename + ".webp")
-            if not os.path.exists(thumb_path):
-                thumb_img = img.copy()
-                thumb_img.thumbnail((300, 300))
-                if thumb_img.mode in ("RGBA", "P"):
-                    thumb_img = thumb_img.convert("RGB")
-                thumb_img.save(thumb_path, "WEBP", quality=60)
-            
-    except Exception as e:
-        logger.error(f"Image optimization failed (Watchdog) for {filename}: {e}")
+class IngestService:
+    """
+    Coalesces watch-folder events and ingests files once they are complete.
 
-class ImageHandler(FileSystemEventHandler):
-    def on_created(self, event):
-        if event.is_directory:
-            return
-        
-        # Delay for FTP
-        time.sleep(2)
-        
-        file_path = event.src_path
-        filename = os.path.basename(file_path)
-        
-        # Skip hidden files and already generated webp versions
-        if filename.startswith('.') or filename.endswith('.webp'):
-            return
+    Any number of created/modified/moved events for a path collapse into one
+    pending entry. A scanner thread stats pending files and hands those whose
+    size and mtime stopped changing to a thread pool running ingest.ingest_existing_file.
+    """
+
+    def __init__(self, threads: int = INGEST_THREADS, stable_seconds: float = STABLE_SECONDS):
+        self.stable_seconds = stable_seconds
+        self._pending: Dict[str, Tuple[int, float, float]] = {}  # path -> (size, mtime, unchanged since)
+        self._in_progress = set()
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._pool = ThreadPoolExecutor(max_workers=threads, thread_name_prefix="ingest")
+        self._scanner = threading.Thread(target=self._scan_loop, name="ingest-scanner", daemon=True)
+
+    def start(self):
+        self._scanner.start()
 
-        ext = os.path.splitext(filename)[1].lower()
-        media_type = "image"
-        if ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']:
-            media_type = "image"
-        elif ext in ['.mp4', '.webm', '.mov', '.avi', '.mkv']:
-            media_type = "video"
-        else:
+    def stop(self):
+        self._stop.set()
+        self._scanner.join()
+        self._pool.shutdown(wait=True)
+
+    def submit(self, path: str):
+        """Note a path as touched; repeated events for the same path are deduplicated."""
+        if ingest.media_type_for(os.path.basename(path)) is None:
             return
+        with self._lock:
+            # Reset stability tracking on every event
+            self._pending[path] = (-1, -1.0, time.monotonic())
+
+    def pending_count(self) -> int:
+        with self._lock:
+            return len(self._pending) + len(self._in_progress)
+
+    def _scan_loop(self):
+        while not self._stop.wait(SCAN_INTERVAL):
+            with self._lock:
+                snapshot = list(self._pending.items())
+
+            now = time.monotonic()
+            ready = []
+            for path, (size, mtime, since) in snapshot:
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    with self._lock:
+                        self._pending.pop(path, None)
+                    continue
+                with self._lock:
+                    if path not in self._pending:
+                        continue
+                    if (stat.st_size, stat.st_mtime) != (size, mtime):
+                        self._pending[path] = (stat.st_size, stat.st_mtime, now)
+                    elif now - since >= self.stable_seconds and path not in self._in_progress:
+                        del self._pending[path]
+                        self._in_progress.add(path)
+                        ready.append(path)
+
+            for path in ready:
+                self._pool.submit(self._ingest, path)
 
+    def _ingest(self, path: str):
+        filename = os.path.basename(path)
         db = SessionLocal()
         try:
-            # Check DB
-            existing = db.query(models.Image).filter(models.Image.filename == filename).first()
-            
-            # Ensure folders exist
-            os.makedirs(PREVIEW_DIR, exist_ok=True)
-            os.makedirs(THUMB_DIR, exist_ok=True)
-            
-            # ALWAYS process versions if they are missing
-            process_image_versions(file_path, filename, media_type)
-
-            # Calculate content hash
-            sha256_hash = hashlib.sha256()
-            with open(file_path, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            content_hash = sha256_hash.hexdigest()
-
-            # Check for duplicate by hash
-            existing_by_hash = db.query(models.Image).filter(models.Image.content_hash == content_hash).first()
-
-            if not existing and not existing_by_hash:
-                width, height = 0, 0
-                if media_type == "image":
-                    with PILImage.open(file_path) as img:
-                        width, height = img.size
-                
-                actual_size = os.path.getsize(file_path)
-
-                db_image = models.Image(
-                    filename=filename,
-                    original_name=filename,
-                    width=width,
-                    height=height,
-                    size=actual_size,
-                    content_hash=content_hash,
-                    media_type=media_type
-                )
-                
-                # Perform AI Analysis
-                if media_type == "image":
-                    results = analyze_image(file_path)
-                    if results:
-                        db_image.analyzed = True
-                        db_image.face_count = results["face_count"]
-                        db_image.has_people = results["has_people"]
-                        # db_image.pose_info = results["pose_info"] # Not supported currently
-                        db_image.brightness = results["brightness"]
-                        db_image.dominant_colors = results["dominant_colors"]
-                        db_image.tags = results["tags"]
-
-                db.add(db_image)
-                db.commit()
-                logger.info(f"Auto-imported & optimized & analyzed: {filename}")
-            elif existing and not existing.content_hash:
-                # Update hash for legacy entries
-                existing.content_hash = content_hash
-                db.commit()
+            image, status = ingest.ingest_existing_file(db, path)
+            if status in ("created", "updated"):
+                page_cache.bump()
+            if status == "created":
+                logger.info(f"Auto-imported: {filename} (queued for optimization & analysis)")
+            elif status == "updated":
                 logger.info(f"Updated hash for: {filename}")
         except Exception as e:
+            db.rollback()
             logger.error(f"Watchdog failed for {filename}: {e}")
         finally:
             db.close()
+            with self._lock:
+                self._in_progress.discard(path)
 
-def start_observer():
-    sync_existing_files()
-    event_handler = ImageHandler()
+
+class ImageHandler(FileSystemEventHandler):
+    """Forwards watchdog events to the ingest service; never blocks the dispatch thread."""
+
+    def __init__(self, service: IngestService):
+        self.service = service
+
+    def on_created(self, event):
+        if not event.is_directory:
+            self.service.submit(event.src_path)
+
+    def on_modified(self, event):
+        if not event.is_directory:
+            self.service.submit(event.src_path)
+
+    def on_moved(self, event):
+        if not event.is_directory:
+            self.service.submit(event.dest_path)
+
+
+def watch() -> Tuple[Observer, IngestService]:
+    """Start watching uploads/ on daemon threads and return immediately."""
+    service = IngestService()
+    service.start()
     observer = Observer()
-    observer.schedule(event_handler, UPLOAD_DIR, recursive=False)
+    observer.schedule(ImageHandler(service), UPLOAD_DIR, recursive=False)
     observer.start()
     logger.info(f"Folder observer actively monitoring: {UPLOAD_DIR}")
+    return observer, service
+
+def start_observer():
+    sync_existing_files()
+    observer, service = watch()
     try:
         while True:
             time.sleep(10)
     except KeyboardInterrupt:
         observer.stop()
+        service.stop()
     observer.join()
 
-def sync_existing_files():
+def sync_existing_files(report: Optional[Callable[[int, int], None]] = None):
+    """
+    Incremental reconciliation of uploads/ with the database.
+
+    All known files are loaded in one query; files whose (size, mtime, inode)
+    fingerprint is unchanged are skipped without reading them. Only new or
+    changed files are hashed, in a thread pool. report(done, total) is
+    called as files are hashed (startup progress for /readyz).
+
+    Only the top level of uploads/ (legacy files, new drops) is scanned.
+    Content-addressed originals in the shards are written once by the app,
+    so only their renditions are checked.
+    """
+    os.makedirs(UPLOAD_DIR, exist_ok=True)
+    os.makedirs(PREVIEW_DIR, exist_ok=True)
+    os.makedirs(THUMB_DIR, exist_ok=True)
+
     db = SessionLocal()
     try:
-        os.makedirs(UPLOAD_DIR, exist_ok=True)
-        os.makedirs(PREVIEW_DIR, exist_ok=True)
-        os.makedirs(THUMB_DIR, exist_ok=True)
-
-        files = os.listdir(UPLOAD_DIR)
-        for filename in files:
-            if filename.startswith('.') or filename.endswith('.webp'): continue
-            
-            ext = os.path.splitext(filename)[1].lower()
-            media_type = "image"
-            if ext in ['.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp']:
-                media_type = "image"
-            elif ext in ['.mp4', '.webm', '.mov', '.avi', '.mkv']:
-                media_type = "video"
+        started = time.monotonic()
+        known = {
+            row.filename: row for row in db.query(
+                models.Image.id, models.Image.filename, models.Image.media_type, models.Image.size,
+                models.Image.file_mtime, models.Image.file_inode, models.Image.content_hash
+            )
+        }
+        thumbs = storage.list_names(THUMB_DIR)
+        previews = storage.list_names(PREVIEW_DIR)
+
+        missing = {"thumbnail": [], "preview": []}
+
+        def check_renditions(row):
+            # Ensure Previews/Thumbs exist (even for unchanged entries)
+            if row.filename + ".webp" not in thumbs:
+                missing["thumbnail"].append(row.id)
+            if row.media_type == "video":
+                has_preview = row.filename + "_preview.webp" in thumbs
             else:
-                continue
-                
-            file_path = os.path.join(UPLOAD_DIR, filename)
-            
-            # 1. Ensure Previews/Thumbs exist (even for existing DB entries)
-            process_image_versions(file_path, filename, media_type)
-            
-            # 2. Check if in DB
-            existing = db.query(models.Image).filter(models.Image.filename == filename).first()
-            
-            # Calculate hash
-            sha256_hash = hashlib.sha256()
-            with open(file_path, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            content_hash = sha256_hash.hexdigest()
-            
-            existing_by_hash = db.query(models.Image).filter(models.Image.content_hash == content_hash).first()
-
-            if not existing and not existing_by_hash:
+                has_preview = row.filename + ".webp" in previews
+            if not has_preview:
+                missing["preview"].append(row.id)
+
+        unchanged = 0
+        to_hash = []
+        with os.scandir(UPLOAD_DIR) as entries:
+            for entry in entries:
+                if ingest.media_type_for(entry.name) is None or entry.name.endswith('.webp') or not entry.is_file():
+                    continue
+                stat = entry.stat()
+                row = known.get(entry.name)
+                if row and row.content_hash and (row.size, row.file_mtime, row.file_inode) == (stat.st_size, stat.st_mtime, stat.st_ino):
+                    unchanged += 1
+                    check_renditions(row)
+                    continue
+                to_hash.append(entry.path)
+
+        stored = 0
+        for row in known.values():
+            if storage.is_content_addressed(row.filename):
+                stored += 1
+                check_renditions(row)
+
+        for kind, image_ids in missing.items():
+            if image_ids:
+                job_queue.enqueue_many(db, image_ids, kind)
+
+        logger.info(f"Startup Sync: {unchanged} files unchanged, {stored} in sharded storage, {len(to_hash)} new or changed "
+                    f"({time.monotonic() - started:.1f}s scan)")
+        if report:
+            report(0, len(to_hash))
+        if not to_hash:
+            return
+
+        progress = batch_tools.Progress(len(to_hash), interval=5.0)
+        with ThreadPoolExecutor(max_workers=SYNC_THREADS, thread_name_prefix="sync-hash") as pool:
+            for done, (file_path, hashed) in enumerate(zip(to_hash, pool.map(_safe_hash, to_hash)), 1):
+                filename = os.path.basename(file_path)
+                progress.update()
+                if report:
+                    report(done, len(to_hash))
+                if hashed is None:
+                    continue
+                content_hash, size = hashed
                 try:
-                    width, height = 0, 0
-                    if media_type == "image":
-                        with PILImage.open(file_path) as img:
-                            width, height = img.size
-                    
-                    size = os.path.getsize(file_path)
-                    
-                    db_image = models.Image(
-                        filename=filename,
-                        original_name=filename,
-                        width=width,
-                        height=height,
-                        size=size,
-                        content_hash=content_hash,
-                        media_type=media_type
-                    )
-
-                    # Perform AI Analysis
-                    if media_type == "image":
-                        results = analyze_image(file_path)
-                        if results:
-                            db_image.analyzed = True
-                            db_image.face_count = results["face_count"]
-                            db_image.has_people = results["has_people"]
-                            # db_image.pose_info = results["pose_info"]
-                            db_image.brightness = results["brightness"]
-                            db_image.dominant_colors = results["dominant_colors"]
-                            db_image.tags = results["tags"]
-
-                    db.add(db_image)
-                    db.commit()
-                    logger.info(f"Startup Sync: Added & Analyzed {filename} to DB")
+                    row = known.get(filename)
+                    if row:
+                        image = db.query(models.Image).filter(models.Image.id == row.id).first()
+                        if ingest.update_changed_file(db, image, file_path, content_hash, size):
+                            logger.info(f"Startup Sync: {filename} changed on disk, re-processing")
+                    else:
+                        image, status = ingest.ingest_existing_file(db, file_path, content_hash, size)
+                        if status == "created":
+                            logger.info(f"Startup Sync: Added {filename} to DB (queued for analysis)")
                 except Exception as e:
+                    db.rollback()
                     logger.error(f"Startup Sync failed for {filename}: {e}")
-            elif existing and not existing.content_hash:
-                existing.content_hash = content_hash
-                db.commit()
+        progress.update(0, force=True)
+        page_cache.bump()
+        logger.info(f"Startup Sync complete in {time.monotonic() - started:.1f}s")
     finally:
         db.close()
+
+def _safe_hash(file_path: str):
+    try:
+        return ingest.hash_file(file_path)
+    except OSError as e:
+        logger.error(f"Startup Sync could not read {os.path.basename(file_path)}: {e}")
+        return None
@@ -1,108 +1,137 @@
 """
 Generate Missing Thumbnails Script
-Creates thumbnails and previews for all images that don't have them yet.
+Creates thumbnails and previews for all images that don't have them yet,
+and fills in missing gallery placeholders (BlurHash) from the thumbnails.
+
+Usage:
+    python generate_thumbnails.py [--workers N] [--chunk-size N] [--resume]
 """
 
 import os
 import sys
-from PIL import Image as PILImage
+import argparse
 from database import SessionLocal
 import models
+import renditions
+import placeholders
+import storage
+import batch_tools
 import logging
 
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-UPLOAD_DIR = os.path.join(os.getcwd(), "uploads")
-PREVIEW_DIR = os.path.join(os.getcwd(), "previews")
-THUMB_DIR = os.path.join(os.getcwd(), "thumbnails")
+UPLOAD_DIR = storage.UPLOAD_DIR
+PREVIEW_DIR = storage.PREVIEW_DIR
+THUMB_DIR = storage.THUMB_DIR
+
+CHECKPOINT_NAME = "generate_thumbnails"
 
 # Create directories if they don't exist
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(PREVIEW_DIR, exist_ok=True)
 os.makedirs(THUMB_DIR, exist_ok=True)
 
-def generate_thumbnails():
+def render_one(task):
+    """Render missing versions of one image. Runs inside a worker process.
+
+    task is (filename, needs_placeholder). Returns (filename, status, detail)
+    where status is "ok", "missing" or "error"; detail of "ok" is
+    (preview written, thumbnail written, placeholder or None).
+    """
+    filename, needs_placeholder = task
+    file_path = storage.original_path(filename)
+    if not os.path.exists(file_path):
+        return filename, "missing", None
+    try:
+        # Single decode for both sizes (draft-mode for JPEGs)
+        preview_path = storage.preview_path(filename)
+        thumb_path = storage.thumbnail_path(filename)
+        written = renditions.render(file_path, [
+            (renditions.PREVIEW, preview_path),
+            (renditions.THUMBNAIL, thumb_path),
+        ])
+        placeholder = placeholders.compute(thumb_path) if needs_placeholder else None
+        return filename, "ok", (preview_path in written, thumb_path in written, placeholder)
+    except Exception as e:
+        return filename, "error", str(e)
+
+def generate_thumbnails(workers: int = 1, chunk_size: int = 500, resume: bool = False):
     """Generate thumbnails and previews for all images."""
     db = SessionLocal()
-    
+
     try:
-        # Get all images
-        images = db.query(models.Image).filter(models.Image.media_type == "image").all()
-        
-        total = len(images)
-        logger.info(f"Found {total} images in database")
-        
+        base_query = db.query(models.Image.id, models.Image.filename, models.Image.placeholder).filter(
+            models.Image.media_type == "image"
+        )
+        start_after = batch_tools.load_checkpoint(CHECKPOINT_NAME) if resume else 0
+
+        total = base_query.filter(models.Image.id > start_after).count()
+        logger.info(f"Found {total} images in database" + (f" (resuming after ID {start_after})" if start_after else ""))
+
         generated_thumbs = 0
         generated_previews = 0
+        generated_placeholders = 0
         skipped = 0
         errors = 0
-        
-        for idx, image in enumerate(images, 1):
-            try:
-                file_path = os.path.join(UPLOAD_DIR, image.filename)
-                
-                if not os.path.exists(file_path):
-                    logger.warning(f"[{idx}/{total}] File not found: {image.filename}")
-                    skipped += 1
-                    continue
-                
-                logger.info(f"[{idx}/{total}] Processing {image.filename}...")
-                
-                # Open image
-                img = PILImage.open(file_path)
-                
-                # Generate Preview (max 1600px)
-                preview_path = os.path.join(PREVIEW_DIR, image.filename + ".webp")
-                if not os.path.exists(preview_path):
-                    preview_img = img.copy()
-                    preview_img.thumbnail((1600, 1600))
-                    if preview_img.mode in ("RGBA", "P"):
-                        preview_img = preview_img.convert("RGB")
-                    preview_img.save(preview_path, "WEBP", quality=75, method=6)
-                    generated_previews += 1
-                    logger.info(f"  ✓ Generated preview")
-                
-                # Generate Thumbnail (max 300px)
-                thumb_path = os.path.join(THUMB_DIR, image.filename + ".webp")
-                if not os.path.exists(thumb_path):
-                    thumb_img = img.copy()
-                    thumb_img.thumbnail((300, 300))
-                    if thumb_img.mode in ("RGBA", "P"):
-                        thumb_img = thumb_img.convert("RGB")
-                    thumb_img.save(thumb_path, "WEBP", quality=60, method=6)
-                    generated_thumbs += 1
-                    logger.info(f"  ✓ Generated thumbnail")
-                
-                img.close()
-                
-            except Exception as e:
-                logger.error(f"  ✗ Error processing {image.filename}: {e}")
-                errors += 1
-        
+        progress = batch_tools.Progress(total)
+
+        with batch_tools.worker_map(workers) as run:
+            for chunk in batch_tools.iter_chunks(db, base_query, chunk_size, start_after):
+                ids = {filename: image_id for image_id, filename, _ in chunk}
+                updates = []
+                tasks = [(filename, not placeholder) for _, filename, placeholder in chunk]
+                for filename, status, detail in run(render_one, tasks):
+                    if status == "missing":
+                        logger.warning(f"File not found: {filename}")
+                        skipped += 1
+                    elif status == "error":
+                        logger.error(f"  ✗ Error processing {filename}: {detail}")
+                        errors += 1
+                    else:
+                        generated_previews += detail[0]
+                        generated_thumbs += detail[1]
+                        if detail[2] is not None:
+                            updates.append({"id": ids[filename], "placeholder": detail[2]})
+                # One UPDATE batch per chunk instead of a commit per image
+                if updates:
+                    db.bulk_update_mappings(models.Image, updates)
+                    db.commit()
+                    generated_placeholders += len(updates)
+                progress.update(len(chunk))
+                batch_tools.save_checkpoint(CHECKPOINT_NAME, chunk[-1][0])
+
+        progress.update(0, force=True)
+        batch_tools.clear_checkpoint(CHECKPOINT_NAME)
+
         logger.info(f"\n{'='*60}")
         logger.info(f"Thumbnail Generation Complete!")
         logger.info(f"{'='*60}")
         logger.info(f"Total images: {total}")
         logger.info(f"Thumbnails generated: {generated_thumbs}")
         logger.info(f"Previews generated: {generated_previews}")
+        logger.info(f"Placeholders generated: {generated_placeholders}")
         logger.info(f"Skipped (file not found): {skipped}")
         logger.info(f"Errors: {errors}")
         logger.info(f"{'='*60}")
-        
+
     except Exception as e:
         logger.error(f"Thumbnail generation failed: {e}")
     finally:
         db.close()
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Generate missing thumbnails and previews")
+    batch_tools.add_batch_args(parser)
+    args = parser.parse_args()
+
     print("=" * 60)
     print("L8tePicture - Generate Missing Thumbnails")
     print("=" * 60)
     print()
-    
-    generate_thumbnails()
-    
+
+    generate_thumbnails(args.workers, args.chunk_size, args.resume)
+
     print()
     print("=" * 60)
     print("Done!")
@@ -6,27 +6,34 @@ Uses OpenCV and basic computer vision to analyze images for:
 - Dominant colors
 - Brightness analysis
 - Auto-tagging
+
+Use ImageAnalyzer.analyze_batch() to analyze many images with shared buffers.
 """
 
 import cv2
 import numpy as np
 import logging
-from typing import Dict, List, Tuple
+from typing import Dict, List, Optional, Tuple
+from functools import cached_property
 import os
+import metrics
 
 logger = logging.getLogger(__name__)
 
 class ImageAnalyzer:
-    def __init__(self):
-        """Initialize the image analyzer with pre-trained models."""
-        # Load Haar Cascade for face detection (lightweight, no ML dependencies)
-        cascade_path = cv2.data.haarcascades + 'haarcascade_frontalface_default.xml'
-        self.face_cascade = cv2.CascadeClassifier(cascade_path)
-        
-        # Load full body cascade for people detection
-        body_cascade_path = cv2.data.haarcascades + 'haarcascade_fullbody.xml'
-        self.body_cascade = cv2.CascadeClassifier(body_cascade_path)
-        
+    # Haar cascades (lightweight, no ML dependencies) are parsed on first use,
+    # so creating an analyzer in a process that never detects anything is free
+
+    @cached_property
+    def face_cascade(self):
+        """Haar Cascade for face detection."""
+        return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_frontalface_default.xml')
+
+    @cached_property
+    def body_cascade(self):
+        """Full body cascade for people detection."""
+        return cv2.CascadeClassifier(cv2.data.haarcascades + 'haarcascade_fullbody.xml')
+
     def analyze_image(self, image_path: str) -> Dict:
         """
         Perform comprehensive analysis on an image.
@@ -40,12 +47,69 @@ class ImageAnalyzer:
                 'tags': list of strings
             }
         """
+        return self.analyze_batch([image_path])[0]
+
+    def analyze_batch(self, image_paths: List[str]) -> List[Dict]:
+        """
+        Analyze several images at once (same result format as analyze_image).
+
+        Each image is decoded once and converted to grayscale once; that buffer
+        feeds face detection, people detection and brightness. Dominant colors
+        for the whole batch come from one vectorised histogram pass.
+        Pass the small preview rather than the original where one exists.
+        """
+        with metrics.stage("analyze_load"):
+            loaded = [self._load(path) for path in image_paths]
+
+        color_inputs = [item[0] for item in loaded if item is not None]
+        with metrics.stage("analyze_colors"):
+            batch_colors = iter(self._extract_dominant_colors_batch(color_inputs)) if color_inputs else iter(())
+
+        results = []
+        for path, item in zip(image_paths, loaded):
+            if item is None:
+                results.append(self._empty_result())
+                continue
+            try:
+                _, gray = item
+                dominant_colors = next(batch_colors)
+
+                # Detect faces
+                with metrics.stage("analyze_faces"):
+                    face_count = self._detect_faces(gray)
+
+                # Detect people (full body)
+                with metrics.stage("analyze_people"):
+                    has_people = self._detect_people(gray) or face_count > 0
+
+                # Calculate brightness from the shared grayscale buffer
+                with metrics.stage("analyze_brightness"):
+                    brightness = self._calculate_brightness(gray)
+
+                # Generate tags
+                with metrics.stage("analyze_tags"):
+                    tags = self._generate_tags(face_count, has_people, brightness, dominant_colors)
+
+                results.append({
+                    'face_count': face_count,
+                    'has_people': has_people,
+                    'dominant_colors': dominant_colors,
+                    'brightness': brightness,
+                    'tags': tags
+                })
+            except Exception as e:
+                logger.error(f"Error analyzing image {path}: {e}")
+                results.append(self._empty_result())
+        return results
+
+    def _load(self, image_path: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """Decode an image once; returns (150x150 RGB color sample, grayscale) or None."""
         try:
             # Read image with OpenCV
             img_cv = cv2.imread(image_path)
             if img_cv is None:
                 logger.error(f"Failed to load image: {image_path}")
-                return self._empty_result()
+                return None
 
             # Resize huge images for analysis to save RAM and CPU
             # Max width 1280px is sufficient for detection
@@ -53,42 +117,18 @@ class ImageAnalyzer:
             if width > 1280:
                 scale = 1280 / width
                 new_height = int(height * scale)
-                img_cv = cv2.resize(img_cv, (1280, new_height))
-            
-            # Convert to RGB for PIL operations
-            img_rgb = cv2.cvtColor(img_cv, cv2.COLOR_BGR2RGB)
-            
-            # Detect faces
-            face_count = self._detect_faces(img_cv)
-            
-            # Detect people (full body)
-            has_people = self._detect_people(img_cv) or face_count > 0
-            
-            # Extract dominant colors
-            dominant_colors = self._extract_dominant_colors(img_rgb)
-            
-            # Calculate brightness
-            brightness = self._calculate_brightness(img_rgb)
-            
-            # Generate tags
-            tags = self._generate_tags(face_count, has_people, brightness, dominant_colors)
-            
-            return {
-                'face_count': face_count,
-                'has_people': has_people,
-                'dominant_colors': dominant_colors,
-                'brightness': brightness,
-                'tags': tags
-            }
-            
+                img_cv = cv2.resize(img_cv, (1280, new_height), interpolation=cv2.INTER_AREA)
+
+            gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
+            sample = cv2.cvtColor(cv2.resize(img_cv, (150, 150), interpolation=cv2.INTER_AREA), cv2.COLOR_BGR2RGB)
+            return sample, gray
         except Exception as e:
             logger.error(f"Error analyzing image {image_path}: {e}")
-            return self._empty_result()
+            return None
     
-    def _detect_faces(self, img_cv) -> int:
-        """Detect faces in the image using Haar Cascade."""
+    def _detect_faces(self, gray) -> int:
+        """Detect faces in the grayscale image using Haar Cascade."""
         try:
-            gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
             faces = self.face_cascade.detectMultiScale(
                 gray,
                 scaleFactor=1.1,
@@ -100,10 +140,9 @@ class ImageAnalyzer:
             logger.error(f"Face detection error: {e}")
             return 0
     
-    def _detect_people(self, img_cv) -> bool:
-        """Detect people (full body) in the image."""
+    def _detect_people(self, gray) -> bool:
+        """Detect people (full body) in the grayscale image."""
         try:
-            gray = cv2.cvtColor(img_cv, cv2.COLOR_BGR2GRAY)
             bodies = self.body_cascade.detectMultiScale(
                 gray,
                 scaleFactor=1.1,
@@ -115,42 +154,52 @@ class ImageAnalyzer:
             logger.error(f"People detection error: {e}")
             return False
     
-    def _extract_dominant_colors(self, img_rgb, num_colors=3) -> List[List[int]]:
-        """Extract dominant colors using k-means clustering."""
+    def _extract_dominant_colors_batch(self, samples: List[np.ndarray], num_colors=3) -> List[List[List[int]]]:
+        """
+        Extract dominant colors for a batch of equally sized RGB samples.
+
+        Pixels are quantised to 3 bits per channel (512 buckets); the most
+        populated buckets are the dominant colors, reported as the mean of
+        the pixels inside them. One bincount covers the whole batch.
+        """
         try:
-            # Resize image for faster processing
-            img_small = cv2.resize(img_rgb, (150, 150))
-            
-            # Reshape to list of pixels
-            pixels = img_small.reshape(-1, 3).astype(np.float32)
-            
-            # Apply k-means clustering
-            criteria = (cv2.TERM_CRITERIA_EPS + cv2.TERM_CRITERIA_MAX_ITER, 100, 0.2)
-            _, labels, centers = cv2.kmeans(
-                pixels, 
-                num_colors, 
-                None, 
-                criteria, 
-                10, 
-                cv2.KMEANS_RANDOM_CENTERS
-            )
-            
-            # Convert centers to integers and return as list
-            dominant_colors = centers.astype(int).tolist()
-            return dominant_colors
-            
+            pixels = np.stack(samples).reshape(len(samples), -1, 3)
+            n_images, n_pixels, _ = pixels.shape
+
+            q = (pixels >> 5).astype(np.int64)
+            buckets = (q[..., 0] << 6) | (q[..., 1] << 3) | q[..., 2]
+            flat = (buckets + (np.arange(n_images)[:, None] * 512)).ravel()
+
+            counts = np.bincount(flat, minlength=n_images * 512).reshape(n_images, 512)
+            flat_pixels = pixels.reshape(-1, 3).astype(np.float64)
+            sums = np.stack([
+                np.bincount(flat, weights=flat_pixels[:, c], minlength=n_images * 512)
+                for c in range(3)
+            ], axis=-1).reshape(n_images, 512, 3)
+
+            top = np.argsort(-counts, axis=1, kind="stable")[:, :num_colors]
+            rows = np.arange(n_images)[:, None]
+            top_counts = counts[rows, top]
+            means = sums[rows, top] / np.maximum(top_counts, 1)[..., None]
+
+            results = []
+            for i in range(n_images):
+                colors = [means[i, k].astype(int).tolist() for k in range(num_colors) if top_counts[i, k] > 0]
+                # Keep a fixed palette length (like k-means did) for flat images
+                while len(colors) < num_colors:
+                    colors.append(colors[0])
+                results.append(colors)
+            return results
+
         except Exception as e:
             logger.error(f"Color extraction error: {e}")
-            return [[128, 128, 128]]  # Default gray
+            return [[[128, 128, 128]] for _ in samples]  # Default gray
     
-    def _calculate_brightness(self, img_rgb) -> float:
-        """Calculate average brightness of the image (0-1 scale)."""
+    def _calculate_brightness(self, gray) -> float:
+        """Calculate average brightness of the grayscale image (0-1 scale)."""
         try:
-            # Convert to grayscale
-            gray = cv2.cvtColor(img_rgb, cv2.COLOR_RGB2GRAY)
-            
             # Calculate mean brightness
-            brightness = np.mean(gray) / 255.0
+            brightness = float(np.mean(gray)) / 255.0
             return round(brightness, 3)
             
         except Exception as e:
@@ -0,0 +1,284 @@
+"""
+Ingest
+The single code path that turns a file into an Image row, shared by
+HTTP uploads (main.upload_images) and the watch folder (folder_observer):
+- Content hashing and duplicate detection
+- Header-only metadata extraction (dimensions, EXIF capture date, orientation, camera)
+- Queueing thumbnail/preview/analysis jobs
+"""
+
+import os
+import uuid
+import hashlib
+import logging
+from typing import Optional, Tuple
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session
+import models
+import job_queue
+import media
+import metrics
+import placeholders
+import storage
+import video
+import exif
+from rendition_cache import get_cache as get_rendition_cache
+
+logger = logging.getLogger(__name__)
+
+UPLOAD_DIR = storage.UPLOAD_DIR
+
+IMAGE_EXTENSIONS = {'.jpg', '.jpeg', '.png', '.gif', '.webp', '.bmp'}
+VIDEO_EXTENSIONS = {'.mp4', '.webm', '.mov', '.avi', '.mkv'}
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def media_type_for(filename: str) -> Optional[str]:
+    """'image', 'video' or None for files the gallery does not handle."""
+    if filename.startswith('.'):
+        return None
+    ext = os.path.splitext(filename)[1].lower()
+    if ext in IMAGE_EXTENSIONS:
+        return "image"
+    if ext in VIDEO_EXTENSIONS:
+        return "video"
+    return None
+
+
+def hash_file(file_path: str) -> Tuple[str, int]:
+    """SHA-256 hex digest and size of a file, read in large chunks."""
+    sha256_hash = hashlib.sha256()
+    size = 0
+    with metrics.stage("hash"), open(file_path, "rb") as f:
+        for chunk in iter(lambda: f.read(CHUNK_SIZE), b""):
+            sha256_hash.update(chunk)
+            size += len(chunk)
+    return sha256_hash.hexdigest(), size
+
+
+def stream_to_temp(src) -> Tuple[str, str, int]:
+    """Copies an upload stream into a hidden temp file in UPLOAD_DIR, hashing it on the way.
+
+    Returns (tmp_path, sha256 hex digest, size in bytes). The dot prefix keeps the
+    folder observer from picking up half-written files.
+    """
+    tmp_path = os.path.join(UPLOAD_DIR, f".upload-{uuid.uuid4()}.tmp")
+    sha256_hash = hashlib.sha256()
+    size = 0
+    try:
+        with metrics.stage("hash"), open(tmp_path, "wb") as buffer:
+            for chunk in iter(lambda: src.read(CHUNK_SIZE), b""):
+                sha256_hash.update(chunk)
+                buffer.write(chunk)
+                size += len(chunk)
+    except Exception:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        raise
+    return tmp_path, sha256_hash.hexdigest(), size
+
+
+def apply_capture_info(image: models.Image, info: exif.CaptureInfo):
+    image.taken_at = info.taken_at
+    image.orientation = info.orientation
+    image.camera = info.camera
+
+
+def apply_video_info(image: models.Image, info: video.VideoInfo):
+    image.width = info.width
+    image.height = info.height
+    # 0 marks "probed, duration unknown" so the probe is not repeated
+    image.duration = info.duration if info.duration is not None else 0.0
+
+
+def enqueue_media_jobs(db: Session, image: models.Image, commit: bool = True):
+    """Queue all processing stages for a freshly ingested image or video."""
+    kinds = ["thumbnail", "preview"]
+    if image.media_type == "image":
+        kinds += ["phash", "analyze"]
+    job_queue.enqueue(db, image.id, kinds, commit=commit)
+
+
+def missing_rendition_kinds(image: models.Image):
+    """Job kinds whose output file (or the placeholder derived from the thumbnail) does not exist yet."""
+    if image.placeholder == placeholders.UNAVAILABLE:
+        return []  # rendering gave up on this file; update_changed_file resets the marker
+    kinds = []
+    if image.placeholder is None or not os.path.exists(storage.thumbnail_path(image.filename)):
+        kinds.append("thumbnail")
+    if not os.path.exists(storage.preview_path(image.filename, image.media_type)):
+        kinds.append("preview")
+    return kinds
+
+
+def update_changed_file(db: Session, image: models.Image, file_path: str, content_hash: str, size: int,
+                        commit: bool = True):
+    """
+    Record the current hash and fingerprint of a known file.
+
+    If the bytes changed (not just the mtime), stale renditions are removed,
+    the dimensions and capture info are re-read and the image is re-processed.
+    """
+    stat = os.stat(file_path)
+    content_changed = image.content_hash is not None and image.content_hash != content_hash
+    image.content_hash = content_hash
+    image.size = size
+    image.file_mtime = stat.st_mtime
+    image.file_inode = stat.st_ino
+    if content_changed:
+        # HEAD and 304 answers come from the stat cache alone
+        media.stat_cache.invalidate(file_path)
+        for path in storage.rendition_paths(image.filename, image.media_type):
+            if os.path.exists(path):
+                os.remove(path)
+            media.stat_cache.invalidate(path)
+        get_rendition_cache().invalidate_prefix(f"{image.id}_")
+        image.analyzed = False
+        image.perceptual_hash = None
+        image.placeholder = None
+        if image.media_type == "image":
+            (image.width, image.height), capture = exif.read_file(file_path)
+            apply_capture_info(image, capture)
+        else:
+            # Probed again by the render job (probe_video_if_needed), off the sync path
+            image.width, image.height, image.duration = 0, 0, None
+        enqueue_media_jobs(db, image, commit=False)
+    if commit:
+        db.commit()
+    return content_changed
+
+
+def find_duplicate(db: Session, content_hash: str) -> Optional[models.Image]:
+    return db.query(models.Image).filter(models.Image.content_hash == content_hash).first()
+
+
+def create_image(db: Session, filename: str, original_name: str, media_type: str, content_hash: str,
+                 size: int, metadata_path: str) -> models.Image:
+    """Insert the Image row; dimensions are read from metadata_path's header (ffprobe for videos)."""
+    width, height = 0, 0
+    info = capture = None
+    if media_type == "image":
+        # Dimensions and EXIF from one lazy open; PIL decodes no pixels
+        (width, height), capture = exif.read_file(metadata_path)
+    else:
+        try:
+            info = video.probe(metadata_path)
+        except Exception as e:
+            # The render job probes again and records the failure on the job
+            logger.warning(f"ffprobe failed for {original_name}: {e}")
+
+    # Renaming within uploads/ keeps inode and mtime, so a temp file's fingerprint stays valid
+    stat = os.stat(metadata_path)
+    db_image = models.Image(
+        filename=filename,
+        original_name=original_name,
+        width=width,
+        height=height,
+        size=size,
+        content_hash=content_hash,
+        media_type=media_type,
+        file_mtime=stat.st_mtime,
+        file_inode=stat.st_ino
+    )
+    if info is not None:
+        apply_video_info(db_image, info)
+    if capture is not None:
+        apply_capture_info(db_image, capture)
+    db.add(db_image)
+    db.commit()
+    db.refresh(db_image)
+    return db_image
+
+
+def ingest_upload(db: Session, src, original_name: str, media_type: str) -> Tuple[models.Image, bool]:
+    """
+    Store an uploaded stream in uploads/ and register it.
+
+    Returns (image, created); for duplicates the existing image is returned
+    and nothing is written to uploads/.
+    """
+    ext = os.path.splitext(original_name)[1]
+
+    # Single streaming pass: write to a hidden temp file while hashing
+    tmp_path, content_hash, size = stream_to_temp(src)
+    try:
+        # Check for duplicate before the file ever lands in uploads/
+        existing_image = find_duplicate(db, content_hash)
+        if existing_image:
+            return existing_image, False
+
+        filename = storage.stored_name(content_hash, original_name, f"{uuid.uuid4()}{ext}")
+        try:
+            db_image = create_image(db, filename, original_name, media_type, content_hash, size, tmp_path)
+        except IntegrityError:
+            # A concurrent upload of the same bytes registered the content-addressed name first
+            db.rollback()
+            existing_image = find_duplicate(db, content_hash)
+            if existing_image is None:
+                raise
+            return existing_image, False
+        try:
+            storage.place(tmp_path, storage.original_path(filename))
+        except Exception:
+            db.delete(db_image)
+            db.commit()
+            raise
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    # Row exists before the file appears, so the watch folder sees it as known
+    enqueue_media_jobs(db, db_image)
+    return db_image, True
+
+
+def ingest_existing_file(db: Session, file_path: str, content_hash: Optional[str] = None,
+                         size: Optional[int] = None) -> Tuple[Optional[models.Image], str]:
+    """
+    Register a file that already lives in uploads/ (watch folder, startup sync).
+
+    In the sharded layout a new file is moved from the watch folder into
+    its shard under its content-addressed name.
+
+    Pass content_hash/size if the caller already hashed the file.
+    Returns (image, status) with status one of
+    'skipped', 'known', 'updated', 'duplicate' or 'created'.
+    """
+    filename = os.path.basename(file_path)
+    media_type = media_type_for(filename)
+    if media_type is None or filename.endswith('.webp'):
+        return None, "skipped"
+
+    existing = db.query(models.Image).filter(models.Image.filename == filename).first()
+    if existing and existing.content_hash:
+        # Already ingested: just make sure no rendition is missing
+        kinds = missing_rendition_kinds(existing)
+        if kinds:
+            job_queue.enqueue(db, existing.id, kinds)
+        return existing, "known"
+
+    if content_hash is None:
+        content_hash, size = hash_file(file_path)
+
+    if existing:
+        # Update hash (and fingerprint) for legacy entries
+        update_changed_file(db, existing, file_path, content_hash, size)
+        return existing, "updated"
+
+    duplicate = find_duplicate(db, content_hash)
+    if duplicate:
+        return duplicate, "duplicate"
+
+    stored = storage.stored_name(content_hash, filename, filename)
+    db_image = create_image(db, stored, filename, media_type, content_hash, size, file_path)
+    dest = storage.original_path(stored)
+    if dest != file_path:
+        try:
+            storage.place(file_path, dest)
+        except Exception:
+            db.delete(db_image)
+            db.commit()
+            raise
+    enqueue_media_jobs(db, db_image)
+    return db_image, "created"
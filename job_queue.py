@@ -0,0 +1,232 @@
+"""
+Media Job Queue
+Durable, prioritized background work for uploaded media:
+- Jobs live in the `jobs` table, so nothing is lost on restart
+- A pool of worker processes claims jobs atomically
+- Failed jobs are retried with exponential backoff
+- Priorities make thumbnails finish before previews and previews before AI analysis
+"""
+
+import os
+import logging
+import multiprocessing
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional
+from sqlalchemy import text, bindparam, DateTime
+import models
+import metrics
+import page_cache
+from database import SessionLocal, dispose_engines
+
+logger = logging.getLogger(__name__)
+
+# Lower value runs first
+PRIORITIES = {
+    "thumbnail": 0,
+    "preview": 10,
+    "phash": 15,
+    "analyze": 20,
+}
+metrics.register_job_kinds(tuple(PRIORITIES))
+
+WORKER_COUNT = int(os.environ.get("PIXI_WORKERS", os.cpu_count() or 1))
+MAX_ATTEMPTS = int(os.environ.get("PIXI_JOB_MAX_ATTEMPTS", 5))
+BACKOFF_SECONDS = float(os.environ.get("PIXI_JOB_BACKOFF", 5))
+POLL_INTERVAL = float(os.environ.get("PIXI_JOB_POLL", 0.5))
+
+# kind -> callable(db, image); filled in via the @handler decorator
+_handlers: Dict[str, Callable] = {}
+# kind -> callable(db, image_id), called when a job fails permanently; see @on_give_up
+_give_up_handlers: Dict[str, Callable] = {}
+_workers: List[multiprocessing.Process] = []
+_stop_event = None
+
+
+def handler(kind: str):
+    """Register the function that executes jobs of the given kind."""
+    def decorator(fn):
+        _handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def on_give_up(kind: str):
+    """Register a function that records a permanent failure, committed together with the job."""
+    def decorator(fn):
+        _give_up_handlers[kind] = fn
+        return fn
+    return decorator
+
+
+def enqueue(db, image_id: int, kinds: List[str], commit: bool = True):
+    """Queue jobs for an image, skipping kinds that are already pending or running."""
+    existing = {
+        kind for (kind,) in db.query(models.Job.kind).filter(
+            models.Job.image_id == image_id,
+            models.Job.kind.in_(kinds),
+            models.Job.status.in_(["pending", "running"])
+        )
+    }
+    for kind in kinds:
+        if kind in existing:
+            continue
+        db.add(models.Job(
+            image_id=image_id,
+            kind=kind,
+            priority=PRIORITIES.get(kind, 100),
+            max_attempts=MAX_ATTEMPTS
+        ))
+    if commit:
+        db.commit()
+
+
+def enqueue_many(db, image_ids: List[int], kind: str):
+    """Queue one job of the same kind for many images in a single transaction."""
+    queued = {
+        image_id for (image_id,) in db.query(models.Job.image_id).filter(
+            models.Job.kind == kind,
+            models.Job.status.in_(["pending", "running"])
+        )
+    }
+    new_ids = [image_id for image_id in image_ids if image_id not in queued]
+    db.bulk_save_objects([
+        models.Job(image_id=image_id, kind=kind, priority=PRIORITIES.get(kind, 100), max_attempts=MAX_ATTEMPTS)
+        for image_id in new_ids
+    ])
+    db.commit()
+    return len(new_ids)
+
+
+def claim_next(db) -> Optional[models.Job]:
+    """Atomically mark the most urgent runnable job as running and return it."""
+    now = datetime.utcnow()
+    row = db.execute(text(
+        "UPDATE jobs SET status = 'running', attempts = attempts + 1, updated_at = :now "
+        "WHERE id = ("
+        "  SELECT id FROM jobs WHERE status = 'pending' AND run_after <= :now "
+        "  ORDER BY priority, id LIMIT 1"
+        ") AND status = 'pending' "
+        "RETURNING id"
+    ).bindparams(bindparam("now", type_=DateTime)), {"now": now}).first()
+    db.commit()
+    if row is None:
+        return None
+    return db.query(models.Job).filter(models.Job.id == row[0]).first()
+
+
+def complete(db, job: models.Job):
+    """Finished jobs are deleted, so the table only holds outstanding and failed work."""
+    db.delete(job)
+    db.commit()
+
+
+def fail(db, job: models.Job, error: str):
+    """Reschedule a failed job with exponential backoff, or give up after max_attempts."""
+    job.last_error = error[:1000]
+    job.updated_at = datetime.utcnow()
+    if job.attempts >= job.max_attempts:
+        job.status = "failed"
+        logger.error(f"Job {job.id} ({job.kind} for image {job.image_id}) failed permanently: {error}")
+        give_up = _give_up_handlers.get(job.kind)
+        if give_up:
+            try:
+                give_up(db, job.image_id)
+            except Exception as e:
+                logger.error(f"Recording the failure of job {job.id} failed: {e}")
+    else:
+        delay = BACKOFF_SECONDS * (2 ** (job.attempts - 1))
+        job.status = "pending"
+        job.run_after = datetime.utcnow() + timedelta(seconds=delay)
+        logger.warning(f"Job {job.id} ({job.kind}) failed, retry {job.attempts}/{job.max_attempts} in {delay:.0f}s: {error}")
+    db.commit()
+
+
+def requeue_stale_jobs():
+    """Return jobs left 'running' by a previous process (crash/restart) to the queue."""
+    db = SessionLocal()
+    try:
+        count = db.query(models.Job).filter(models.Job.status == "running").update(
+            {"status": "pending", "run_after": datetime.utcnow()}, synchronize_session=False
+        )
+        # Left behind by versions that kept finished jobs
+        pruned = db.query(models.Job).filter(models.Job.status == "done").delete(synchronize_session=False)
+        db.commit()
+        if count:
+            logger.info(f"Requeued {count} interrupted jobs")
+        if pruned:
+            logger.info(f"Removed {pruned} finished jobs")
+    finally:
+        db.close()
+
+
+def alive_workers() -> int:
+    return sum(1 for p in _workers if p.is_alive())
+
+
+def run_job(db, job: models.Job):
+    """Execute a claimed job and record the outcome."""
+    fn = _handlers.get(job.kind)
+    if fn is None:
+        fail(db, job, f"No handler registered for job kind '{job.kind}'")
+        return
+    image = db.query(models.Image).filter(models.Image.id == job.image_id).first()
+    if image is None:
+        # Image was deleted while the job was queued
+        complete(db, job)
+        return
+    try:
+        with metrics.job(job.kind):
+            fn(db, image)
+        complete(db, job)
+        # Thumbnails, placeholders, probe and analysis results all show up in listings
+        page_cache.bump()
+    except Exception as e:
+        db.rollback()
+        fail(db, job, str(e))
+
+
+def _worker_loop(stop_event):
+    # Connections inherited through fork must not be shared with the parent
+    dispose_engines()
+    db = SessionLocal()
+    try:
+        while not stop_event.is_set():
+            try:
+                job = claim_next(db)
+            except Exception as e:
+                logger.error(f"Job claim failed: {e}")
+                db.rollback()
+                job = None
+            if job is None:
+                stop_event.wait(POLL_INTERVAL)
+                continue
+            run_job(db, job)
+    finally:
+        db.close()
+
+
+def start_workers(count: int = WORKER_COUNT):
+    """Start the worker pool. Handlers must be registered before calling this."""
+    global _stop_event
+    if _workers:
+        return
+    requeue_stale_jobs()
+    # fork so workers inherit the registered handlers
+    ctx = multiprocessing.get_context("fork")
+    _stop_event = ctx.Event()
+    for i in range(max(1, count)):
+        p = ctx.Process(target=_worker_loop, args=(_stop_event,), name=f"pixi-worker-{i}", daemon=True)
+        p.start()
+        _workers.append(p)
+    logger.info(f"Started {len(_workers)} media workers")
+
+
+def stop_workers(timeout: float = 10):
+    if _stop_event is None:
+        return
+    _stop_event.set()
+    for p in _workers:
+        p.join(timeout)
+        if p.is_alive():
+            p.terminate()
+    _workers.clear()
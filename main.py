@@ -1,248 +1,430 @@
 import os
-import uuid
-import shutil
 import logging
-import hashlib
-import time
+import base64
+import mimetypes
+import anyio
 from typing import List, Optional
 from datetime import datetime, timedelta
-from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Request, BackgroundTasks, Query
+from fastapi import FastAPI, UploadFile, File, Depends, HTTPException, Request, Query
 from fastapi.staticfiles import StaticFiles
 from fastapi.templating import Jinja2Templates
-from fastapi.responses import JSONResponse, FileResponse, HTMLResponse
+from fastapi.responses import JSONResponse, FileResponse, HTMLResponse, Response
+from pydantic import BaseModel, Field
 from sqlalchemy.orm import Session
-from sqlalchemy import and_, or_
-from PIL import Image as PILImage
+from sqlalchemy import and_, or_, func, text
 import models
-from database import engine, get_db, SessionLocal
+import database
+from database import get_db, get_read_db, SessionLocal, ReadSessionLocal
 import json
-from image_analyzer import get_analyzer
+import job_queue
+import ingest
+import search
+import near_duplicates
+import color_index
+import renditions
+import video
+import media
+import sprites
+import storage
+import placeholders
+import page_cache
+import metrics
+import startup
+import media_gc
+import timeline
+from rendition_cache import get_cache as get_rendition_cache
+from page_cache import get_cache as get_page_cache
 
 # Setup logging
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
-# Create database tables
-try:
-    from database import run_migrations
-    run_migrations()
-    models.Base.metadata.create_all(bind=engine)
-    logger.info("Database tables created or already exist.")
-except Exception as e:
-    logger.error(f"Error creating database tables or running migrations: {e}")
-
 app = FastAPI(title="P.I.X.I.")
+app.add_middleware(metrics.RequestMetricsMiddleware)
 
 # Setup directories
-UPLOAD_DIR = os.path.join(os.getcwd(), "uploads")
-PREVIEW_DIR = os.path.join(os.getcwd(), "previews")
-THUMB_DIR = os.path.join(os.getcwd(), "thumbnails")
+UPLOAD_DIR = storage.UPLOAD_DIR
+PREVIEW_DIR = storage.PREVIEW_DIR
+THUMB_DIR = storage.THUMB_DIR
 os.makedirs(UPLOAD_DIR, exist_ok=True)
 os.makedirs(PREVIEW_DIR, exist_ok=True)
 os.makedirs(THUMB_DIR, exist_ok=True)
 
+# Sync endpoints and file streaming share one thread pool of REQUEST_THREADS.
+# Uploads (stream to disk, SHA-256, probe) get their own, smaller limiter so any
+# number of uploaders can never occupy the threads that serve the gallery.
+REQUEST_THREADS = int(os.environ.get("PIXI_REQUEST_THREADS", 40))
+UPLOAD_CONCURRENCY = int(os.environ.get("PIXI_UPLOAD_CONCURRENCY", 4))
+upload_limiter = anyio.CapacityLimiter(UPLOAD_CONCURRENCY)
+
 # Mount static files and templates
 app.mount("/static", StaticFiles(directory="static"), name="static")
-app.mount("/uploads", StaticFiles(directory=UPLOAD_DIR), name="uploads")
 
-# Specialized mounts with caching headers
-@app.get("/thumbnails/{filename}")
-async def get_thumbnail(filename: str):
-    path = os.path.join(THUMB_DIR, filename)
-    if not os.path.exists(path): raise HTTPException(404)
-    return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+# Media routes: ETag/304, Range requests and a stat cache (see media.py)
+_original_etags = {}  # filename -> ((inode, size, mtime_ns), etag)
+
+def original_etag(filename: str, st: os.stat_result) -> Optional[str]:
+    """Strong ETag from the content hash, re-read from the DB only when the file changed."""
+    key = (st.st_ino, st.st_size, st.st_mtime_ns)
+    cached = _original_etags.get(filename)
+    if cached and cached[0] == key:
+        return cached[1]
+    with ReadSessionLocal() as db:
+        content_hash = db.query(models.Image.content_hash).filter(models.Image.filename == filename).scalar()
+    etag = f'"{content_hash}"' if content_hash else None
+    if len(_original_etags) >= media.STAT_CACHE_SIZE:
+        _original_etags.clear()
+    _original_etags[filename] = (key, etag)
+    return etag
+
+@app.api_route("/uploads/{filename}", methods=["GET", "HEAD"])
+def get_original(filename: str, request: Request):
+    path = storage.original_path(filename)
+    st = media.stat_cache.get(path)
+    if st is None or filename.startswith('.'):
+        raise HTTPException(404)
+    media_type = mimetypes.guess_type(filename)[0] or "application/octet-stream"
+    # Originals never change under the same name, but may be deleted: revalidate instead of immutable
+    return media.serve_file(request, path, media_type, original_etag(filename, st), "public, max-age=86400")
+
+@app.api_route("/thumbnails/{filename}", methods=["GET", "HEAD"])
+def get_thumbnail(filename: str, request: Request):
+    response = media.serve_file(request, storage.path(THUMB_DIR, filename), "image/webp")
+    if response.status_code == 404: raise HTTPException(404)
+    return response
+
+@app.api_route("/previews/{filename}", methods=["GET", "HEAD"])
+def get_preview(filename: str, request: Request):
+    response = media.serve_file(request, storage.path(PREVIEW_DIR, filename), "image/webp")
+    if response.status_code == 404: raise HTTPException(404)
+    return response
+
+@app.get("/img/{image_id}")
+def get_image_rendition(image_id: int, request: Request, w: int = Query(0, ge=0, le=4096), h: int = Query(0, ge=0, le=4096),
+                        fmt: str = "webp", db: Session = Depends(get_read_db)):
+    """On-demand rendition in any size (bounding box w x h) and format, cached on disk (LRU)."""
+    fmt = "jpeg" if fmt.lower() == "jpg" else fmt.lower()
+    if not w and not h:
+        raise HTTPException(status_code=400, detail="w or h is required")
+    if not renditions.format_supported(fmt):
+        raise HTTPException(status_code=400, detail=f"Unsupported format: {fmt}")
 
-@app.get("/previews/{filename}")
-async def get_preview(filename: str):
-    path = os.path.join(PREVIEW_DIR, filename)
-    if not os.path.exists(path): raise HTTPException(404)
-    return FileResponse(path, headers={"Cache-Control": "public, max-age=31536000, immutable"})
+    image = db.query(models.Image).filter(models.Image.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
 
-templates = Jinja2Templates(directory="templates")
+    box = (w or 4096, h or 4096)
+
+    def render(out_path: str):
+        # Only on a cache miss: hits are served without touching the source files
+        source = rendition_source(image, box)
+        if not os.path.exists(source):
+            raise HTTPException(404)
+        renditions.render_dynamic(source, out_path, box[0], box[1], fmt)
+
+    path = get_rendition_cache().get_or_render(f"{image_id}_{w}x{h}.{fmt}", render)
+    # The id can outlive its content (changed file, reused rowid): revalidate against the content hash
+    etag = f'"{image.content_hash}-{w}x{h}.{fmt}"' if image.content_hash else None
+    return media.serve_file(request, path, f"image/{fmt}", etag, "no-cache")
+
+def rendition_source(image: models.Image, box) -> str:
+    """Smallest existing file that still covers the requested bounding box."""
+    if image.media_type == "video":
+        return storage.thumbnail_path(image.filename)
+    original = storage.original_path(image.filename)
+    if not image.width or not image.height:
+        return original
+    # The preview is the original scaled into PREVIEW.max_size, so its size follows from the row
+    needed = min(box[0] / image.width, box[1] / image.height, 1)
+    preview_scale = min(renditions.PREVIEW.max_size / max(image.width, image.height), 1)
+    preview = storage.preview_path(image.filename)
+    if needed <= preview_scale and os.path.exists(preview):
+        return preview
+    return original
 
-def generate_video_thumbnail(video_path, thumb_path):
-    """Extracts a frame from the video using ffmpeg and saves as WebP."""
-    import subprocess
-    try:
-        # Extract frame at 1 second mark, scale, and save as WebP directly
-        subprocess.run([
-            'ffmpeg', '-y', '-ss', '00:00:01', '-i', video_path, 
-            '-vframes', '1', 
-            '-vf', 'scale=400:-1', 
-            '-c:v', 'webp', '-lossless', '0', '-compression_level', '4', '-q:v', '65',
-            thumb_path
-        ], check=True, capture_output=True)
-        return True
-    except Exception as e:
-        logger.error(f"FFmpeg thumbnail failed: {e}")
-        return False
+templates = Jinja2Templates(directory="templates")
 
-def generate_video_preview(video_path, preview_path):
-    """Generates a short (3s) silent looping preview of the video."""
-    import subprocess
-    try:
-        # Generate a small, low-fps animated WebP for hover previews
-        # 3 seconds, 10fps, 320px width
-        subprocess.run([
-            'ffmpeg', '-y', '-ss', '00:00:01', '-t', '3', '-i', video_path,
-            '-vf', 'fps=10,scale=320:-1:flags=lanczos',
-            '-loop', '0', '-c:v', 'webp', '-lossless', '0', '-compression_level', '4', '-q:v', '50',
-            preview_path
-        ], check=True, capture_output=True)
-        return True
-    except Exception as e:
-        logger.error(f"FFmpeg preview generation failed: {e}")
-        return False
+def apply_analysis(image: models.Image, analysis: dict):
+    """Copy analyzer output onto an Image row."""
+    image.analyzed = True
+    image.analyzed_at = datetime.utcnow()
+    image.face_count = analysis['face_count']
+    image.has_people = analysis['has_people']
+    image.dominant_colors = analysis['dominant_colors']
+    image.brightness = analysis['brightness']
+    image.tags = analysis['tags']
+    search.sync_tags(Session.object_session(image), image.id, analysis['tags'])
+
+def generate_video_renditions(file_path: str, filename: str, duration: Optional[float] = None):
+    """Poster frame and animated hover preview of a video, from a single ffmpeg decode."""
+    video.ensure_renditions(
+        file_path,
+        storage.thumbnail_path(filename),
+        storage.preview_path(filename, "video"),
+        duration
+    )
+
+def generate_thumbnail(file_path: str, filename: str, media_type: str = "image", duration: Optional[float] = None):
+    """Generates the small gallery thumbnail (max 300px / video poster frame) in WebP format."""
+    thumb_path = storage.thumbnail_path(filename)
+    if os.path.exists(thumb_path):
+        return
+    if media_type == "video":
+        # The hover preview comes out of the same decode
+        generate_video_renditions(file_path, filename, duration)
+        return
+    # JPEGs decode at 1/8 scale here, so thumbnails stay cheap ahead of previews
+    renditions.render(file_path, [(renditions.THUMBNAIL, thumb_path)])
+
+def generate_preview(file_path: str, filename: str, media_type: str = "image", duration: Optional[float] = None):
+    """Generates the medium preview (max 1600px / animated video loop) in WebP format."""
+    if media_type == "video":
+        generate_video_renditions(file_path, filename, duration)
+        return
+    # Single decode: the thumbnail (if still missing) is derived from the preview
+    renditions.render(file_path, [
+        (renditions.PREVIEW, storage.preview_path(filename)),
+        (renditions.THUMBNAIL, storage.thumbnail_path(filename)),
+    ])
+
+def analysis_source(file_path: str, filename: str) -> str:
+    """The 1600px preview is plenty for analysis and far cheaper to decode than the original."""
+    preview_path = storage.preview_path(filename)
+    return preview_path if os.path.exists(preview_path) else file_path
+
+def get_analyzer():
+    # OpenCV is imported on the first analysis (in the job workers), not when the app boots
+    from image_analyzer import get_analyzer as load_analyzer
+    return load_analyzer()
 
 def analyze_and_update_image(image_id: int, file_path: str):
     """Analyze image and update database with AI metadata."""
+    db = SessionLocal()
     try:
-        from database import SessionLocal
-        db = SessionLocal()
-        
-        analyzer = get_analyzer()
-        analysis = analyzer.analyze_image(file_path)
-        
-        # Update database
+        analysis = get_analyzer().analyze_image(file_path)
         image = db.query(models.Image).filter(models.Image.id == image_id).first()
         if image:
-            image.analyzed = True
-            image.face_count = analysis['face_count']
-            image.has_people = analysis['has_people']
-            image.dominant_colors = analysis['dominant_colors']
-            image.brightness = analysis['brightness']
-            image.tags = analysis['tags']
+            apply_analysis(image, analysis)
             db.commit()
             logger.info(f"Analysis complete for image {image_id}: {len(analysis['tags'])} tags, {analysis['face_count']} faces")
-        
-        db.close()
     except Exception as e:
         logger.error(f"Analysis failed for image {image_id}: {e}")
+    finally:
+        db.close()
 
 def process_image_versions(file_path: str, filename: str, media_type: str = "image", image_id: int = None):
-    """Generates a small thumbnail and a medium preview in WebP format."""
+    """Synchronously generates thumbnail and preview (and analysis for images) in one go."""
     try:
-        # Use a small delay to ensure file is flushed
-        time.sleep(0.1)
-        
-        if media_type == "video":
-            thumb_path = os.path.join(THUMB_DIR, filename + ".webp")
-            preview_path = os.path.join(THUMB_DIR, filename + "_preview.webp")
-            
-            if not os.path.exists(thumb_path):
-                generate_video_thumbnail(file_path, thumb_path)
-            
-            if not os.path.exists(preview_path):
-                generate_video_preview(file_path, preview_path)
-            return
-
-        with PILImage.open(file_path) as img:
-            # Generate Preview (max 1600px)
-            preview_path = os.path.join(PREVIEW_DIR, filename + ".webp")
-            if not os.path.exists(preview_path):
-                preview_img = img.copy()
-                preview_img.thumbnail((1600, 1600))
-                if preview_img.mode in ("RGBA", "P"):
-                    preview_img = preview_img.convert("RGB")
-                preview_img.save(preview_path, "WEBP", quality=75, method=6) # Method 6 is best compression
-
-            # Generate Thumbnail (max 300px)
-            thumb_path = os.path.join(THUMB_DIR, filename + ".webp")
-            if not os.path.exists(thumb_path):
-                thumb_img = img.copy()
-                thumb_img.thumbnail((300, 300))
-                if thumb_img.mode in ("RGBA", "P"):
-                    thumb_img = thumb_img.convert("RGB")
-                thumb_img.save(thumb_path, "WEBP", quality=60, method=6)
-        
-        # Perform AI analysis for images (not videos)
+        # Images derive the thumbnail from the preview decode, videos render both in one ffmpeg run
+        generate_preview(file_path, filename, media_type)
         if media_type == "image" and image_id:
-            analyze_and_update_image(image_id, file_path)
-            
+            analyze_and_update_image(image_id, analysis_source(file_path, filename))
     except Exception as e:
         logger.error(f"Background optimization failed for {filename}: {e}")
 
+# --- Job queue handlers (executed in worker processes) ---
 
+def probe_video_if_needed(db: Session, image: models.Image):
+    """Videos ingested before probing existed get their dimensions and duration on first processing."""
+    if image.media_type != "video" or image.duration is not None:
+        return
+    ingest.apply_video_info(image, video.probe(storage.original_path(image.filename)))
+    db.commit()
 
-def analyze_unanalyzed_images_on_startup():
-    """Background task to analyze all unanalyzed images on server startup."""
-    import time
-    time.sleep(5)  # Wait 5 seconds for server to fully start
-    
-    from database import SessionLocal
+def store_placeholder_if_needed(db: Session, image: models.Image):
+    """BlurHash from the freshly written thumbnail (video: poster frame), computed once per file."""
+    thumb_path = storage.thumbnail_path(image.filename)
+    if image.placeholder or not os.path.exists(thumb_path):
+        return
+    image.placeholder = placeholders.compute(thumb_path)
+    db.commit()
+
+@job_queue.handler("thumbnail")
+def thumbnail_job(db: Session, image: models.Image):
+    probe_video_if_needed(db, image)
+    generate_thumbnail(storage.original_path(image.filename), image.filename, image.media_type, image.duration)
+    store_placeholder_if_needed(db, image)
+
+@job_queue.on_give_up("thumbnail")
+def thumbnail_given_up(db: Session, image_id: int):
+    # Otherwise the startup backfill and folder sync queue it again on every start
+    db.query(models.Image).filter(
+        models.Image.id == image_id, models.Image.placeholder.is_(None)
+    ).update({"placeholder": placeholders.UNAVAILABLE}, synchronize_session=False)
+
+@job_queue.handler("preview")
+def preview_job(db: Session, image: models.Image):
+    probe_video_if_needed(db, image)
+    generate_preview(storage.original_path(image.filename), image.filename, image.media_type, image.duration)
+    store_placeholder_if_needed(db, image)
+
+@job_queue.handler("analyze")
+def analyze_job(db: Session, image: models.Image):
+    file_path = storage.original_path(image.filename)
+    if not os.path.exists(file_path):
+        raise FileNotFoundError(file_path)
+    analysis = get_analyzer().analyze_image(analysis_source(file_path, image.filename))
+    apply_analysis(image, analysis)
+    db.commit()
+    logger.info(f"Analysis complete for image {image.id}: {len(analysis['tags'])} tags, {analysis['face_count']} faces")
+
+@job_queue.handler("phash")
+def phash_job(db: Session, image: models.Image):
+    # The 300px thumbnail is plenty for a 9x8 hash and far cheaper to decode
+    thumb_path = storage.thumbnail_path(image.filename)
+    source = thumb_path if os.path.exists(thumb_path) else storage.original_path(image.filename)
+    image.perceptual_hash = near_duplicates.compute_hash(source)
+    db.commit()
+
+def enqueue_unanalyzed_images_on_startup():
+    """Queue analysis jobs for every image that has not been analyzed yet."""
     db = SessionLocal()
-    
     try:
-        # Count unanalyzed images
-        unanalyzed = db.query(models.Image).filter(
+        unanalyzed_ids = [image_id for (image_id,) in db.query(models.Image.id).filter(
             models.Image.analyzed == False,
             models.Image.media_type == "image"
-        ).all()
-        
-        total = len(unanalyzed)
-        
-        if total == 0:
+        )]
+
+        if not unanalyzed_ids:
             logger.info("✓ All images are already analyzed!")
             return
-        
-        logger.info(f"🔍 Found {total} unanalyzed images. Starting background analysis...")
-        
-        for idx, image in enumerate(unanalyzed, 1):
-            try:
-                file_path = os.path.join(UPLOAD_DIR, image.filename)
-                
-                if not os.path.exists(file_path):
-                    logger.warning(f"[{idx}/{total}] File not found: {image.filename}")
-                    continue
-                
-                logger.info(f"[{idx}/{total}] Analyzing {image.filename}...")
-                
-                # Perform analysis
-                analyzer = get_analyzer()
-                analysis = analyzer.analyze_image(file_path)
-                
-                # Update database
-                image.analyzed = True
-                image.face_count = analysis['face_count']
-                image.has_people = analysis['has_people']
-                image.dominant_colors = analysis['dominant_colors']
-                image.brightness = analysis['brightness']
-                image.tags = analysis['tags']
-                
-                db.commit()
-                
-                logger.info(f"  ✓ {len(analysis['tags'])} tags, {analysis['face_count']} faces, brightness: {analysis['brightness']:.2f}")
-                
-            except Exception as e:
-                logger.error(f"  ✗ Error analyzing {image.filename}: {e}")
-                db.rollback()
-        
-        logger.info(f"✓ Startup analysis complete! Processed {total} images")
-        
+
+        queued = job_queue.enqueue_many(db, unanalyzed_ids, "analyze")
+        logger.info(f"🔍 Found {len(unanalyzed_ids)} unanalyzed images, queued {queued} for background analysis")
     except Exception as e:
         logger.error(f"Startup analysis failed: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+def enqueue_missing_placeholders_on_startup():
+    """Images from before placeholders existed: the thumbnail job computes them (and skips the existing thumbnail)."""
+    db = SessionLocal()
+    try:
+        missing_ids = [image_id for (image_id,) in db.query(models.Image.id).filter(models.Image.placeholder.is_(None))]
+        if missing_ids:
+            queued = job_queue.enqueue_many(db, missing_ids, "thumbnail")
+            logger.info(f"Queued {queued} images for placeholder generation")
+    except Exception as e:
+        logger.error(f"Placeholder backfill failed: {e}")
+        db.rollback()
+    finally:
+        db.close()
+
+def prepare_similarity_indexes_on_startup():
+    """Queue hashing for images without a perceptual hash and load the near-duplicate and colour indexes."""
+    db = SessionLocal()
+    try:
+        unhashed_ids = [image_id for (image_id,) in db.query(models.Image.id).filter(
+            models.Image.perceptual_hash.is_(None),
+            models.Image.media_type == "image"
+        )]
+        if unhashed_ids:
+            queued = job_queue.enqueue_many(db, unhashed_ids, "phash")
+            logger.info(f"Queued {queued} images for perceptual hashing")
+        near_duplicates.get_index().sync(db)
+        color_index.get_index().sync(db)
+    except Exception as e:
+        logger.error(f"Similarity index setup failed: {e}")
+        db.rollback()
     finally:
         db.close()
 
+def backfill_schema(db: Session):
+    """Data work after a schema upgrade, done before the new version is recorded."""
+    search.backfill_tags(db)
+    timeline.install(db)
+    db.commit()
+
+def prepare_database():
+    """Create/migrate the schema; a single PRAGMA read once the database is current."""
+    try:
+        if database.init_schema(backfill=backfill_schema):
+            logger.info(f"Database migrated to schema version {database.SCHEMA_VERSION}.")
+    except Exception as e:
+        logger.error(f"Error creating database tables or running migrations: {e}")
+
+def refresh_search_statistics():
+    with SessionLocal() as db:
+        search.refresh_statistics(db)
+
+# folder_observer (watchdog) is imported on the startup thread, not while uvicorn waits for startup_event
+def sync_library(report):
+    from folder_observer import sync_existing_files
+    sync_existing_files(report)
+
+def watch_upload_folder():
+    from folder_observer import watch
+    watch()
+
+def start_background_startup():
+    """Everything the gallery does not need to serve its first page, in order, on one background thread."""
+    startup.get_progress().start([
+        ("search_statistics", lambda report: refresh_search_statistics()),
+        ("analysis_queue", lambda report: enqueue_unanalyzed_images_on_startup()),
+        ("placeholder_queue", lambda report: enqueue_missing_placeholders_on_startup()),
+        ("similarity_indexes", lambda report: prepare_similarity_indexes_on_startup()),
+        ("capture_dates", timeline.backfill_capture_dates),
+        ("library_sync", sync_library),
+        ("folder_observer", lambda report: watch_upload_folder()),
+        ("file_gc", lambda report: media_gc.get_collector().start()),
+    ])
+
 @app.on_event("startup")
 async def startup_event():
-    # Start the folder observer in the background
+    anyio.to_thread.current_default_thread_limiter().total_tokens = REQUEST_THREADS
+    prepare_database()
+    # Workers are forked before any other threads are started
     try:
-        from folder_observer import start_observer
-        import threading
-        # Running observer in a separate thread to not block uvicorn startup
-        threading.Thread(target=start_observer, daemon=True).start()
-        logger.info("Folder observer started in background thread.")
+        job_queue.start_workers()
     except Exception as e:
-        logger.error(f"Failed to start folder observer: {e}")
-    
-    # Start background analysis of unanalyzed images
+        logger.error(f"Failed to start media workers: {e}")
+    start_background_startup()
+
+@app.on_event("shutdown")
+async def shutdown_event():
+    job_queue.stop_workers()
+
+@app.get("/healthz")
+async def healthz():
+    """Liveness: the process is up and serving requests."""
+    return {"status": "ok"}
+
+@app.get("/readyz")
+def readyz(db: Session = Depends(get_read_db)):
+    """Readiness: the database answers; also reports the progress of the background startup phases."""
+    state = startup.get_progress().snapshot()
     try:
-        import threading
-        threading.Thread(target=analyze_unanalyzed_images_on_startup, daemon=True).start()
-        logger.info("Background image analysis started.")
+        db.execute(text("SELECT 1"))
     except Exception as e:
-        logger.error(f"Failed to start background analysis: {e}")
+        return JSONResponse({"status": "unavailable", "error": str(e), **state}, status_code=503)
+    return {"status": "ready", **state}
+
+@app.get("/metrics")
+def get_metrics(db: Session = Depends(get_read_db)):
+    """Prometheus text format: pipeline stage timings, job durations, request latency, queue and backlog."""
+    jobs = db.query(models.Job.kind, models.Job.status, func.count(models.Job.id)).filter(
+        models.Job.status.in_(["pending", "running", "failed"])
+    ).group_by(models.Job.kind, models.Job.status).all()
+    images = models.Image.media_type == "image"
+    backlog = {
+        "unanalyzed": db.query(func.count(models.Image.id)).filter(images, models.Image.analyzed == False).scalar(),
+        "unhashed": db.query(func.count(models.Image.id)).filter(images, models.Image.perceptual_hash.is_(None)).scalar(),
+        # The thumbnail job stores the placeholder right after writing the thumbnail
+        "missing_thumbnail": db.query(func.count(models.Image.id)).filter(models.Image.placeholder.is_(None)).scalar(),
+        "missing_preview": sum(count for kind, status, count in jobs if kind == "preview" and status != "failed"),
+    }
+    media_counts = db.query(models.Image.media_type, func.count(models.Image.id)).group_by(models.Image.media_type).all()
+    extra = (
+        metrics.gauge("pixi_jobs", "Jobs in the queue by kind and status",
+                      [([("kind", kind), ("status", status)], count) for kind, status, count in jobs])
+        + metrics.gauge("pixi_backlog", "Media still waiting for a pipeline step",
+                        [([("kind", kind)], count) for kind, count in backlog.items()])
+        + metrics.gauge("pixi_images", "Images and videos in the library",
+                        [([("media_type", media_type or "unknown")], count) for media_type, count in media_counts])
+        + metrics.gauge("pixi_workers_alive", "Running job worker processes", [([], job_queue.alive_workers())])
+    )
+    return Response(metrics.render(extra), media_type=metrics.CONTENT_TYPE)
 
 @app.get("/manifest.json")
 async def manifest():
@@ -252,18 +434,86 @@ async def manifest():
 async def service_worker():
     return FileResponse("static/sw.js", media_type="application/javascript")
 
+def cursor_at(date: datetime, image_id: int) -> str:
+    """Opaque keyset cursor: the next page starts below (date, image_id)."""
+    raw = f"{date.isoformat()}|{image_id}"
+    return base64.urlsafe_b64encode(raw.encode()).decode().rstrip("=")
+
+def encode_cursor(image: models.Image, order: str = "uploaded") -> str:
+    """Cursor pointing just past the given image in gallery order."""
+    date = image.upload_date if order == "uploaded" else image.taken_at or image.upload_date
+    return cursor_at(date, image.id)
+
+def decode_cursor(cursor: str):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date_str, image_id = base64.urlsafe_b64decode(padded.encode()).decode().split("|")
+        return datetime.fromisoformat(date_str), int(image_id)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+# What listings render and serialize; leaves out dominant_colors, fingerprints and the like
+GALLERY_COLUMNS = (
+    models.Image.id, models.Image.filename, models.Image.is_favorite, models.Image.media_type,
+    models.Image.width, models.Image.height, models.Image.duration, models.Image.placeholder,
+    models.Image.upload_date, models.Image.tags, models.Image.face_count, models.Image.has_people,
+    models.Image.brightness, models.Image.analyzed, models.Image.content_hash, models.Image.taken_at,
+)
+
+# Gallery sort keys: import time, or capture time (timeline.DATE, falls back to the upload date)
+GALLERY_ORDERS = {"uploaded": models.Image.upload_date, "taken": timeline.DATE}
+ORDER_PATTERN = "^(uploaded|taken)$"
+
+def gallery_query(db: Session, favorites: bool = False, order: str = "uploaded"):
+    """Gallery rows (GALLERY_COLUMNS, not ORM objects) newest first, backed by the (sort key, id) indexes."""
+    query = db.query(*GALLERY_COLUMNS).order_by(GALLERY_ORDERS[order].desc(), models.Image.id.desc())
+    if favorites:
+        query = query.filter(models.Image.is_favorite == True)
+    return query
+
+def fetch_page(db: Session, limit: int, favorites: bool = False, cursor: Optional[str] = None, query=None,
+               order: str = "uploaded"):
+    """Returns (images, next_cursor) using keyset pagination; next_cursor is None on the last page."""
+    if query is None:
+        query = gallery_query(db, favorites, order)
+    if cursor:
+        date, image_id = decode_cursor(cursor)
+        key = GALLERY_ORDERS[order]
+        # (key, id) < (date, id) spelled out: SQLite only seeks an expression index on a plain key <= date
+        query = query.filter(key <= date, or_(key < date, models.Image.id < image_id))
+    images = query.limit(limit).all()
+    next_cursor = encode_cursor(images[-1], order) if len(images) == limit else None
+    return images, next_cursor
+
+def cached_page(db: Session, limit: int, favorites: bool = False, cursor: Optional[str] = None,
+                offset: int = 0, order: str = "uploaded") -> page_cache.CachedPage:
+    """A gallery page from the page cache; only a miss touches the database."""
+    def build():
+        if cursor is not None or offset == 0:
+            images, next_cursor = fetch_page(db, limit, favorites, cursor or None, order=order)
+        else:
+            images = gallery_query(db, favorites, order).offset(offset).limit(limit).all()
+            next_cursor = encode_cursor(images[-1], order) if len(images) == limit else None
+        return images, [serialize_image(img) for img in images], next_cursor
+    # The first page is shared by / and /api/images
+    key = (cursor or None, offset if cursor is None else 0, limit, favorites, order)
+    return get_page_cache().get_or_build(key, build)
+
 @app.get("/")
-async def read_root(request: Request, db: Session = Depends(get_db), favorites: bool = False):
+def read_root(request: Request, db: Session = Depends(get_read_db), favorites: bool = False):
     try:
-        query = db.query(models.Image).order_by(models.Image.upload_date.desc())
-        if favorites:
-            query = query.filter(models.Image.is_favorite == True)
-        
-        images = query.limit(50).all()
-        return templates.TemplateResponse("index.html", {"request": request, "images": images, "favorites": favorites})
+        page = cached_page(db, 50, favorites)
+        dense = request.cookies.get("pixi_density") == "high"
+        etag = f'W/"{page.etag[1:-1]}-{"dense" if dense else "grid"}"'
+        headers = {"ETag": etag, "Cache-Control": "no-cache"}
+        if media.etag_matches(request.headers.get("if-none-match", ""), etag):
+            return Response(status_code=304, headers=headers)
+        # Dense grid mode (set by app.js): one sprite sheet instead of 50 thumbnail requests
+        sprite = sprites.sheet_for(sprite_entries(page.rows)) if dense and page.rows else None
+        return templates.TemplateResponse("index.html", {"request": request, "images": page.rows, "favorites": favorites, "next_cursor": page.next_cursor, "sprite": sprite}, headers=headers)
     except Exception as e:
         logger.error(f"Error loading images for root: {e}")
-        return templates.TemplateResponse("index.html", {"request": request, "images": [], "favorites": False})
+        return templates.TemplateResponse("index.html", {"request": request, "images": [], "favorites": False, "next_cursor": None, "sprite": None})
 
 @app.get("/gallery")
 async def gallery_redirect():
@@ -272,15 +522,172 @@ async def gallery_redirect():
 
 
 @app.get("/api/images")
-async def get_images_api(db: Session = Depends(get_db), offset: int = 0, limit: int = 50, favorites: bool = False):
-    """API endpoint for infinite scrolling and efficient image fetching."""
-    query = db.query(models.Image).order_by(models.Image.upload_date.desc())
-    
-    if favorites:
-        query = query.filter(models.Image.is_favorite == True)
-    
-    images = query.offset(offset).limit(limit).all()
-    return [{
+def get_images_api(request: Request, db: Session = Depends(get_read_db), offset: int = 0, limit: int = Query(50, ge=1, le=500),
+                         favorites: bool = False, cursor: Optional[str] = None,
+                         order: str = Query("uploaded", pattern=ORDER_PATTERN)):
+    """API endpoint for infinite scrolling and efficient image fetching.
+
+    Pass `cursor` (from the X-Next-Cursor header of the previous page, or a month
+    from /api/timeline) for constant-time keyset pagination; `offset` is still
+    accepted for older clients. `order=taken` sorts by capture date. Pages are
+    served from the page cache with an ETag, so revalidations get a bodiless 304.
+    """
+    page = cached_page(db, limit, favorites, cursor, offset, order)
+    headers = {"ETag": page.etag, "Cache-Control": "no-cache"}
+    if page.next_cursor:
+        headers["X-Next-Cursor"] = page.next_cursor
+    if media.etag_matches(request.headers.get("if-none-match", ""), page.etag):
+        return Response(status_code=304, headers=headers)
+    return Response(content=page.body, media_type="application/json", headers=headers)
+
+def sprite_entries(images: List[models.Image]) -> List[sprites.SpriteEntry]:
+    entries = []
+    for img in images:
+        thumb_path = storage.thumbnail_path(img.filename)
+        exists = media.stat_cache.get(thumb_path) is not None
+        entries.append(sprites.SpriteEntry(img.id, img.content_hash, thumb_path if exists else None))
+    return entries
+
+@app.get("/api/bundle")
+def get_bundle(response: Response, db: Session = Depends(get_read_db), q: str = "", favorites: bool = False,
+               cursor: Optional[str] = None, limit: int = Query(50, ge=1, le=sprites.MAX_TILES),
+               order: str = Query("uploaded", pattern=ORDER_PATTERN)):
+    """One gallery page plus the sprite sheet holding all of its thumbnails (dense grid mode)."""
+    query = gallery_query(db, favorites, order)
+    if q:
+        try:
+            query = search.apply_query(query, q)
+        except search.SearchError as e:
+            raise HTTPException(status_code=400, detail=str(e))
+    images, next_cursor = fetch_page(db, limit, cursor=cursor, query=query, order=order)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    if not images:
+        return {"sprite": None, "images": []}
+    sheet = sprites.sheet_for(sprite_entries(images))
+    return {
+        "sprite": {"url": sheet.url, "background_size": sheet.background_size},
+        "images": [dict(serialize_image(img), sprite_position=sheet.position(i)) for i, img in enumerate(images)]
+    }
+
+@app.get("/sprites/{digest}.webp")
+def get_sprite(digest: str, ids: str, request: Request, db: Session = Depends(get_read_db)):
+    try:
+        image_ids = sprites.parse_ids(ids)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    found = {img.id: img for img in db.query(models.Image).filter(models.Image.id.in_(image_ids))}
+    # Deleted images keep their (empty) slot so positions handed out earlier stay valid
+    entries = [
+        sprite_entries([found[image_id]])[0] if image_id in found else sprites.SpriteEntry(image_id, None, None)
+        for image_id in image_ids
+    ]
+    current = sprites.digest(entries)
+    path = get_rendition_cache().get_or_render(f"sprite_{current}.webp", lambda out_path: sprites.render(entries, out_path))
+    # A stale digest (thumbnail finished meanwhile) gets the current sheet, but must not be cached forever
+    cache_control = media.IMMUTABLE if current == digest else "no-cache"
+    return media.serve_file(request, path, "image/webp", cache_control=cache_control)
+
+@app.get("/api/search")
+def search_images(response: Response, q: str = "", db: Session = Depends(get_read_db),
+                        limit: int = Query(50, ge=1, le=500), favorites: bool = False, cursor: Optional[str] = None,
+                        order: str = Query("uploaded", pattern=ORDER_PATTERN)):
+    """Smart search over AI metadata, e.g. `tag:portrait faces:>2 bright` (see search.py for the grammar)."""
+    try:
+        query = search.apply_query(gallery_query(db, favorites, order), q)
+    except search.SearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    images, next_cursor = fetch_page(db, limit, cursor=cursor, query=query, order=order)
+    if next_cursor:
+        response.headers["X-Next-Cursor"] = next_cursor
+    return [serialize_image(img) for img in images]
+
+def month_cursor(month: str) -> str:
+    """Cursor for /api/images?order=taken that starts with the newest image of the month."""
+    start = datetime.strptime(month, "%Y-%m")
+    return cursor_at(start.replace(year=start.year + start.month // 12, month=start.month % 12 + 1), 0)
+
+@app.get("/api/timeline")
+def get_timeline(db: Session = Depends(get_read_db)):
+    """Images per month by capture date, newest first, each with a cursor to jump there (scrubber)."""
+    months = timeline.months(db)
+    return {
+        "total": sum(count for _, count in months),
+        "months": [{"month": month, "count": count, "cursor": month_cursor(month)} for month, count in months],
+    }
+
+@app.get("/api/timeline/seek")
+def seek_timeline(date: str):
+    """Cursor for /api/images?order=taken starting at the newest image taken in or before a YYYY, YYYY-MM or YYYY-MM-DD period."""
+    try:
+        _, end = search.date_range(date)
+    except search.SearchError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    return {"date": date, "cursor": cursor_at(end, 0)}
+
+@app.get("/api/duplicates")
+def get_duplicates(db: Session = Depends(get_read_db),
+                   distance: int = Query(near_duplicates.MAX_DISTANCE, ge=0, le=near_duplicates.MAX_DISTANCE),
+                   offset: int = Query(0, ge=0), limit: int = Query(50, ge=1, le=500)):
+    """Clusters of near-duplicate images (dHash Hamming distance <= distance), largest first."""
+    index = near_duplicates.get_index()
+    index.sync(db)
+    clusters = index.clusters(distance)
+    page = clusters[offset:offset + limit]
+    ids = [image_id for cluster in page for image_id in cluster]
+    images = {img.id: img for img in db.query(models.Image).filter(models.Image.id.in_(ids))}
+    return {
+        "total": len(clusters),
+        "clusters": [
+            [serialize_image(images[image_id]) for image_id in cluster if image_id in images]
+            for cluster in page
+        ]
+    }
+
+@app.get("/api/images/{image_id}/duplicates")
+def get_image_duplicates(image_id: int, db: Session = Depends(get_read_db),
+                         distance: int = Query(near_duplicates.MAX_DISTANCE, ge=0, le=near_duplicates.MAX_DISTANCE)):
+    """Near-duplicates of one image, closest first."""
+    image = db.query(models.Image).filter(models.Image.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if image.perceptual_hash is None:
+        return []
+    index = near_duplicates.get_index()
+    index.sync(db)
+    matches = [(match_id, d) for match_id, d in index.query(image.perceptual_hash, distance) if match_id != image_id]
+    images = {img.id: img for img in db.query(models.Image).filter(models.Image.id.in_([m for m, _ in matches]))}
+    return [dict(serialize_image(images[match_id]), distance=d) for match_id, d in matches if match_id in images]
+
+@app.get("/api/search/color")
+def search_by_color(colors: str, db: Session = Depends(get_read_db), limit: int = Query(50, ge=1, le=500)):
+    """Images whose palette is closest to `colors` (comma separated hex, most dominant first)."""
+    try:
+        palette = color_index.parse_hex_palette(colors)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    index = color_index.get_index()
+    index.sync(db)
+    return color_results(db, index.query(color_index.palette_vector(palette), limit))
+
+@app.get("/api/images/{image_id}/similar")
+def get_similar_colors(image_id: int, db: Session = Depends(get_read_db), limit: int = Query(50, ge=1, le=500)):
+    """Images with a palette similar to this image's, closest first."""
+    image = db.query(models.Image).filter(models.Image.id == image_id).first()
+    if not image:
+        raise HTTPException(status_code=404, detail="Image not found")
+    if not image.analyzed or not image.dominant_colors:
+        return []
+    index = color_index.get_index()
+    index.sync(db)
+    return color_results(db, index.query(color_index.palette_vector(image.dominant_colors), limit, exclude=image_id))
+
+def color_results(db: Session, matches):
+    images = {img.id: img for img in db.query(models.Image).filter(models.Image.id.in_([m for m, _ in matches]))}
+    return [dict(serialize_image(images[match_id]), color_distance=round(d, 2)) for match_id, d in matches if match_id in images]
+
+def serialize_image(img: models.Image) -> dict:
+    return {
         "id": img.id,
         "filename": img.filename,
         "original_name": "Private Media", # Privacy: Hide original filenames
@@ -288,16 +695,24 @@ async def get_images_api(db: Session = Depends(get_db), offset: int = 0, limit:
         "media_type": img.media_type,
         "width": img.width,
         "height": img.height,
+        "duration": img.duration,
+        "placeholder": img.placeholder,
         "upload_date": img.upload_date.isoformat() if img.upload_date else None,
+        "taken_at": img.taken_at.isoformat() if img.taken_at else None,
         "tags": img.tags or [],
         "face_count": img.face_count if img.analyzed else 0,
         "has_people": img.has_people if img.analyzed else False,
         "brightness": img.brightness if img.analyzed else None,
         "analyzed": img.analyzed
-    } for img in images]
+    }
 
 @app.post("/upload")
-async def upload_images(background_tasks: BackgroundTasks, files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+async def upload_images(files: List[UploadFile] = File(...), db: Session = Depends(get_db)):
+    # The multipart body is already spooled to temp files; ingesting it blocks, so it runs off the event loop
+    return await anyio.to_thread.run_sync(ingest_uploads, db, files, limiter=upload_limiter)
+
+def ingest_uploads(db: Session, files: List[UploadFile]) -> dict:
+    """Stores, hashes and registers uploaded files. Runs in a thread bounded by upload_limiter."""
     uploaded_count = 0
     errors = []
     
@@ -313,60 +728,23 @@ async def upload_images(background_tasks: BackgroundTasks, files: List[UploadFil
             continue
             
         try:
-            # Generate unique filename
-            ext = os.path.splitext(file.filename)[1]
-            unique_filename = f"{uuid.uuid4()}{ext}"
-            file_path = os.path.join(UPLOAD_DIR, unique_filename)
-
-            # Save original file instantly
-            with open(file_path, "wb") as buffer:
-                shutil.copyfileobj(file.file, buffer)
-
-            # Calculate hash for duplicate detection
-            sha256_hash = hashlib.sha256()
-            with open(file_path, "rb") as f:
-                for byte_block in iter(lambda: f.read(4096), b""):
-                    sha256_hash.update(byte_block)
-            content_hash = sha256_hash.hexdigest()
-
-            # Check for duplicate
-            existing_image = db.query(models.Image).filter(models.Image.content_hash == content_hash).first()
-            if existing_image:
-                os.remove(file_path) # Delete the duplicate file
-                new_image_ids.append(existing_image.id)
+            # Streams to disk while hashing, dedups, registers and queues processing jobs
+            db_image, created = ingest.ingest_upload(db, file.file, file.filename, media_type)
+            if not created:
+                new_image_ids.append(db_image.id)
                 continue
 
-            # Quick metadata extraction
-            width, height = 0, 0
-            if media_type == "image":
-                with PILImage.open(file_path) as img:
-                    width, height = img.size
-            
-            actual_size = os.path.getsize(file_path)
-
-            # Save to DB instantly
-            db_image = models.Image(
-                filename=unique_filename,
-                original_name=file.filename,
-                width=width,
-                height=height,
-                size=actual_size,
-                content_hash=content_hash,
-                media_type=media_type
-            )
-            db.add(db_image)
-            db.commit()
-            db.refresh(db_image)
-            
-            # OFFLOAD heavy processing to background (including AI analysis)
-            background_tasks.add_task(process_image_versions, file_path, unique_filename, media_type, db_image.id)
-            
             new_image_ids.append(db_image.id)
             uploaded_count += 1
         except Exception as e:
+            # The remaining files of the batch share this session
+            db.rollback()
             logger.error(f"Upload error: {e}")
             errors.append(f"Failed to process {file.filename}")
 
+    if new_image_ids:
+        page_cache.bump()
+
     # Fetch recently added images for the response
     new_images = db.query(models.Image).filter(models.Image.id.in_(new_image_ids)).all()
 
@@ -383,36 +761,92 @@ async def upload_images(background_tasks: BackgroundTasks, files: List[UploadFil
     }
 
 @app.post("/favorite/{image_id}")
-async def toggle_favorite(image_id: int, db: Session = Depends(get_db)):
+def toggle_favorite(image_id: int, db: Session = Depends(get_db)):
     image = db.query(models.Image).filter(models.Image.id == image_id).first()
     if not image:
         raise HTTPException(status_code=404, detail="Image not found")
     image.is_favorite = not image.is_favorite
     db.commit()
+    page_cache.bump()
     return {"is_favorite": image.is_favorite}
 
+def delete_images(db: Session, image_ids: List[int]) -> int:
+    """
+    Delete images, their tags and queued jobs in one transaction; returns how many existed.
+
+    The files are queued in the same transaction and removed by media_gc,
+    so a request never waits on the filesystem and a crash cannot leave
+    files without a row (or rows without files) behind.
+    """
+    deleted = []
+    for start in range(0, len(image_ids), BULK_CHUNK):
+        chunk = image_ids[start:start + BULK_CHUNK]
+        rows = db.query(models.Image.id, models.Image.filename, models.Image.media_type).filter(
+            models.Image.id.in_(chunk)
+        ).all()
+        if not rows:
+            continue
+        ids = [row.id for row in rows]
+        db.query(models.ImageTag).filter(models.ImageTag.image_id.in_(ids)).delete(synchronize_session=False)
+        # A reused rowid must not inherit them; running jobs belong to a worker and complete on their own
+        db.query(models.Job).filter(
+            models.Job.image_id.in_(ids), models.Job.status.in_(["pending", "failed"])
+        ).delete(synchronize_session=False)
+        db.query(models.Image).filter(models.Image.id.in_(ids)).delete(synchronize_session=False)
+        media_gc.schedule(db, [(row.filename, row.media_type) for row in rows])
+        deleted += ids
+    if not deleted:
+        return 0
+    with metrics.stage("db_commit"):
+        db.commit()
+    index = near_duplicates.get_index()
+    for image_id in deleted:
+        index.remove(image_id)
+    get_rendition_cache().invalidate_images(deleted)
+    page_cache.bump()
+    media_gc.get_collector().wake()
+    return len(deleted)
+
 @app.delete("/delete/{image_id}")
-async def delete_image(image_id: int, db: Session = Depends(get_db)):
-    image = db.query(models.Image).filter(models.Image.id == image_id).first()
-    if not image:
+def delete_image(image_id: int, db: Session = Depends(get_db)):
+    if not delete_images(db, [image_id]):
         raise HTTPException(status_code=404, detail="Image not found")
-    
-    # Remove files
-    file_path = os.path.join(UPLOAD_DIR, image.filename)
-    thumb_path = os.path.join(THUMB_DIR, image.filename)
-    
-    try:
-        if os.path.exists(file_path):
-            os.remove(file_path)
-        if os.path.exists(thumb_path):
-            os.remove(thumb_path)
-    except Exception as e:
-        logger.error(f"Error deleting physical files for image {image_id}: {e}")
-        
-    db.delete(image)
-    db.commit()
     return {"message": "Image deleted successfully"}
 
+# Bulk actions: one request, one transaction, however many IDs (up to MAX_BULK_IDS).
+# IDs are processed in chunks below SQLite's bound-parameter limit.
+MAX_BULK_IDS = int(os.environ.get("PIXI_BULK_MAX_IDS", 10000))
+BULK_CHUNK = 900
+
+class BulkRequest(BaseModel):
+    ids: List[int] = Field(min_length=1, max_length=MAX_BULK_IDS)
+
+def set_favorite(db: Session, image_ids: List[int], value: bool) -> int:
+    updated = 0
+    for start in range(0, len(image_ids), BULK_CHUNK):
+        updated += db.query(models.Image).filter(
+            models.Image.id.in_(image_ids[start:start + BULK_CHUNK])
+        ).update({models.Image.is_favorite: value}, synchronize_session=False)
+    with metrics.stage("db_commit"):
+        db.commit()
+    page_cache.bump()
+    return updated
+
+@app.post("/api/bulk/favorite")
+def bulk_favorite(request: BulkRequest, db: Session = Depends(get_db)):
+    ids = sorted(set(request.ids))
+    return {"requested": len(ids), "updated": set_favorite(db, ids, True)}
+
+@app.post("/api/bulk/unfavorite")
+def bulk_unfavorite(request: BulkRequest, db: Session = Depends(get_db)):
+    ids = sorted(set(request.ids))
+    return {"requested": len(ids), "updated": set_favorite(db, ids, False)}
+
+@app.post("/api/bulk/delete")
+def bulk_delete(request: BulkRequest, db: Session = Depends(get_db)):
+    ids = sorted(set(request.ids))
+    return {"requested": len(ids), "deleted": delete_images(db, ids)}
+
 if __name__ == "__main__":
     import uvicorn
     uvicorn.run(app, host="0.0.0.0", port=8000)
@@ -0,0 +1,273 @@
+"""
+Media Serving
+File responses for originals and renditions, built for video scrubbing and revalidation:
+- Strong ETags (content_hash for originals, inode/size/mtime for renditions) and Last-Modified
+- 304 for If-None-Match / If-Modified-Since, If-Range aware
+- Single and multi-range requests (206, multipart/byteranges, 416)
+- Zero-copy send where the ASGI server offers it, otherwise chunked reads in a thread
+- In-memory stat cache so revalidations do not touch the filesystem
+"""
+
+import os
+import stat
+import time
+import uuid
+import threading
+from collections import OrderedDict
+from email.utils import formatdate, parsedate_to_datetime
+from typing import List, Optional, Tuple
+import anyio
+from starlette.requests import Request
+from starlette.responses import Response
+
+STAT_TTL = float(os.environ.get("PIXI_STAT_CACHE_TTL", 10))
+MISSING_TTL = 1.0  # renditions appear asynchronously, so 404s are only cached briefly
+STAT_CACHE_SIZE = int(os.environ.get("PIXI_STAT_CACHE_SIZE", 20000))
+CHUNK_SIZE = 256 * 1024
+
+IMMUTABLE = "public, max-age=31536000, immutable"
+
+
+class StatCache:
+    """LRU of path -> (os.stat_result or None, expires_at)."""
+
+    def __init__(self, max_entries: int = STAT_CACHE_SIZE):
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[str, Tuple[Optional[os.stat_result], float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, path: str) -> Optional[os.stat_result]:
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(path)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(path)
+                return entry[0]
+        try:
+            st = os.stat(path)
+            if not stat.S_ISREG(st.st_mode):
+                st = None
+        except OSError:
+            st = None
+        with self._lock:
+            self._entries[path] = (st, now + (STAT_TTL if st else MISSING_TTL))
+            self._entries.move_to_end(path)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return st
+
+    def put(self, path: str, st: os.stat_result):
+        with self._lock:
+            self._entries[path] = (st, time.monotonic() + STAT_TTL)
+            self._entries.move_to_end(path)
+
+    def invalidate(self, path: str):
+        with self._lock:
+            self._entries.pop(path, None)
+
+
+stat_cache = StatCache()
+
+
+def stat_etag(st: os.stat_result) -> str:
+    return f'"{st.st_ino:x}-{st.st_size:x}-{st.st_mtime_ns:x}"'
+
+
+def _same_file(a: os.stat_result, b: os.stat_result) -> bool:
+    return (a.st_ino, a.st_size, a.st_mtime_ns) == (b.st_ino, b.st_size, b.st_mtime_ns)
+
+
+def parse_ranges(header: str, size: int) -> Optional[List[Tuple[int, int]]]:
+    """
+    Parse a `bytes=` Range header into inclusive (start, end) pairs.
+
+    Returns None if the header should be ignored (malformed or not bytes) and
+    an empty list if no range is satisfiable.
+    """
+    unit, _, spec = header.partition("=")
+    if unit.strip().lower() != "bytes" or not spec:
+        return None
+    ranges = []
+    for part in spec.split(","):
+        start_s, sep, end_s = part.strip().partition("-")
+        if not sep:
+            return None
+        try:
+            if start_s == "":
+                length = int(end_s)
+                if length <= 0:
+                    continue
+                start, end = max(size - length, 0), size - 1
+            else:
+                start = int(start_s)
+                end = int(end_s) if end_s else size - 1
+                if end < start:
+                    return None
+                end = min(end, size - 1)
+        except ValueError:
+            return None
+        if start < size:
+            ranges.append((start, end))
+    # Coalesce overlapping/adjacent ranges so a client cannot multiply the transfer
+    ranges.sort()
+    merged: List[Tuple[int, int]] = []
+    for start, end in ranges:
+        if merged and start <= merged[-1][1] + 1:
+            merged[-1] = (merged[-1][0], max(merged[-1][1], end))
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def etag_matches(if_none_match: str, etag: str) -> bool:
+    """Weak comparison of an If-None-Match header against one ETag."""
+    tags = [t.strip() for t in if_none_match.split(",")]
+    return "*" in tags or etag in tags or f"W/{etag}" in tags
+
+
+def _not_modified(request: Request, etag: str, st: os.stat_result) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        return etag_matches(if_none_match, etag)
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(st.st_mtime) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def _if_range_matches(request: Request, etag: str, st: os.stat_result) -> bool:
+    if_range = request.headers.get("if-range")
+    if not if_range:
+        return True
+    if if_range.startswith('"') or if_range.startswith("W/"):
+        return if_range == etag
+    try:
+        return int(st.st_mtime) == parsedate_to_datetime(if_range).timestamp()
+    except (TypeError, ValueError):
+        return False
+
+
+class FileRangeResponse(Response):
+    """Streams byte ranges of an already opened file and closes it afterwards."""
+
+    def __init__(self, file, status_code: int, headers: dict, parts: List[Tuple[int, int, bytes]],
+                 epilogue: bytes = b""):
+        # parts: (start, end_inclusive, preamble sent before the bytes)
+        super().__init__(status_code=status_code, headers=headers)
+        self.file = file
+        self.parts = parts
+        self.epilogue = epilogue
+
+    async def __call__(self, scope, receive, send):
+        f = self.file
+        try:
+            await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+            zerocopy = "http.response.zerocopysend" in scope.get("extensions", {})
+            for start, end, preamble in self.parts:
+                if preamble:
+                    await send({"type": "http.response.body", "body": preamble, "more_body": True})
+                if zerocopy:
+                    await send({
+                        "type": "http.response.zerocopysend", "file": f.fileno(),
+                        "offset": start, "count": end - start + 1, "more_body": True,
+                    })
+                    continue
+                remaining = end - start + 1
+                await anyio.to_thread.run_sync(f.seek, start)
+                while remaining > 0:
+                    chunk = await anyio.to_thread.run_sync(f.read, min(CHUNK_SIZE, remaining))
+                    if not chunk:
+                        break
+                    remaining -= len(chunk)
+                    await send({"type": "http.response.body", "body": chunk, "more_body": True})
+            await send({"type": "http.response.body", "body": self.epilogue, "more_body": False})
+        finally:
+            f.close()
+
+
+def serve_file(request: Request, path: str, media_type: str, etag: Optional[str] = None,
+               cache_control: str = IMMUTABLE) -> Response:
+    """
+    Response for a file on disk with validators, conditional GET and Range support.
+
+    Revalidations (304) and HEAD are answered from the stat cache alone. For
+    bodies the open file is fstat'ed, so a file replaced since it was cached
+    never gets stale headers. etag defaults to one derived from the stat result.
+    """
+    st = stat_cache.get(path)
+    if st is None:
+        return Response(status_code=404)
+    headers = _validators(st, etag, cache_control)
+    if _not_modified(request, headers["ETag"], st):
+        return Response(status_code=304, headers=headers)
+
+    f = None
+    if request.method != "HEAD":
+        try:
+            f = open(path, "rb")
+        except OSError:
+            stat_cache.invalidate(path)
+            return Response(status_code=404)
+        current = os.fstat(f.fileno())
+        if not _same_file(current, st):
+            stat_cache.put(path, current)
+            st = current
+            headers = _validators(st, etag, cache_control)
+
+    size = st.st_size
+    range_header = request.headers.get("range")
+    ranges = None
+    if range_header and _if_range_matches(request, headers["ETag"], st):
+        ranges = parse_ranges(range_header, size)
+
+    if ranges is not None and not ranges:
+        headers["Content-Range"] = f"bytes */{size}"
+        return _respond(f, 416, headers, [])
+
+    if ranges is None:
+        headers["Content-Type"] = media_type
+        headers["Content-Length"] = str(size)
+        return _respond(f, 200, headers, [(0, size - 1, b"")] if size else [])
+
+    if len(ranges) == 1:
+        start, end = ranges[0]
+        headers["Content-Type"] = media_type
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+        headers["Content-Length"] = str(end - start + 1)
+        return _respond(f, 206, headers, [(start, end, b"")])
+
+    boundary = uuid.uuid4().hex
+    parts = []
+    length = 0
+    for index, (start, end) in enumerate(ranges):
+        preamble = (
+            ("" if index == 0 else "\r\n") +
+            f"--{boundary}\r\nContent-Type: {media_type}\r\nContent-Range: bytes {start}-{end}/{size}\r\n\r\n"
+        ).encode("latin-1")
+        parts.append((start, end, preamble))
+        length += len(preamble) + end - start + 1
+    epilogue = f"\r\n--{boundary}--\r\n".encode("latin-1")
+    headers["Content-Type"] = f"multipart/byteranges; boundary={boundary}"
+    headers["Content-Length"] = str(length + len(epilogue))
+    return _respond(f, 206, headers, parts, epilogue)
+
+
+def _validators(st: os.stat_result, etag: Optional[str], cache_control: str) -> dict:
+    return {
+        "ETag": etag or stat_etag(st),
+        "Last-Modified": formatdate(st.st_mtime, usegmt=True),
+        "Cache-Control": cache_control,
+        "Accept-Ranges": "bytes",
+    }
+
+
+def _respond(f, status_code: int, headers: dict, parts, epilogue: bytes = b"") -> Response:
+    if f is None or status_code == 416:
+        # HEAD, or nothing to send
+        if f is not None:
+            f.close()
+        return Response(status_code=status_code, headers=headers)
+    return FileRangeResponse(f, status_code, headers, parts, epilogue)
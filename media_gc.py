@@ -0,0 +1,165 @@
+"""
+Media Garbage Collector
+Removes files that no longer belong to an image, off the request path:
+- Deletes record the files of removed images in file_deletions, in the same transaction as the row delete
+- A background thread removes them shortly after; a crash only delays it, the rows stay until the files are gone
+- A periodic sweep removes orphaned renditions, sharded originals without a row and stale temp files
+- Files younger than the grace period are never swept (in-flight uploads, renders and storage migrations)
+"""
+
+import os
+import time
+import logging
+import threading
+from datetime import timezone
+from typing import Iterable, List, Optional, Tuple
+from sqlalchemy.orm import Session
+import models
+import media
+import storage
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+GRACE_SECONDS = float(os.environ.get("PIXI_GC_GRACE", 600))
+SWEEP_INTERVAL = float(os.environ.get("PIXI_GC_INTERVAL", 6 * 3600))
+BATCH_SIZE = 500
+
+
+def schedule(db: Session, images: Iterable[Tuple[str, str]]):
+    """Queue the files of deleted images as (filename, media_type); committed by the caller."""
+    db.bulk_insert_mappings(models.FileDeletion, [
+        {"filename": filename, "media_type": media_type} for filename, media_type in images
+    ])
+
+
+def _remove(path: str, changed_before: Optional[float] = None) -> int:
+    """Remove a file and drop it from the stat cache; returns the bytes freed."""
+    try:
+        st = os.stat(path)
+        if changed_before is not None and max(st.st_mtime, st.st_ctime) >= changed_before:
+            return 0
+        size = st.st_size
+        os.remove(path)
+    except FileNotFoundError:
+        return 0
+    finally:
+        media.stat_cache.invalidate(path)
+    return size
+
+
+def _rendition_owner(name: str):
+    """Stored name of the original a rendition file belongs to, or None for other files."""
+    if name.endswith("_preview.webp"):
+        return name[:-len("_preview.webp")]
+    if name.endswith(".webp"):
+        return name[:-len(".webp")]
+    return None
+
+
+class MediaCollector:
+    """Single background thread: drains file_deletions when woken, sweeps every SWEEP_INTERVAL."""
+
+    def __init__(self, grace: float = GRACE_SECONDS, interval: float = SWEEP_INTERVAL):
+        self.grace = grace
+        self.interval = interval
+        self._wake = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self._thread is None:
+            self._thread = threading.Thread(target=self._loop, name="media-gc", daemon=True)
+            self._thread.start()
+
+    def wake(self):
+        """Called after committing deletions."""
+        self._wake.set()
+
+    def _loop(self):
+        next_sweep = time.monotonic()
+        while True:
+            try:
+                with SessionLocal() as db:
+                    self.collect(db)
+                    if time.monotonic() >= next_sweep:
+                        self.sweep(db)
+                        next_sweep = time.monotonic() + self.interval
+            except Exception as e:
+                logger.error(f"Media GC failed: {e}")
+            self._wake.wait(timeout=max(1.0, next_sweep - time.monotonic()))
+            self._wake.clear()
+
+    def collect(self, db: Session) -> int:
+        """Remove the files queued in file_deletions; returns the bytes freed."""
+        freed = files = 0
+        while True:
+            batch = db.query(models.FileDeletion).order_by(models.FileDeletion.id).limit(BATCH_SIZE).all()
+            if not batch:
+                break
+            # Re-uploading the same bytes recreates the same content-addressed name: keep those files
+            live = {filename for (filename,) in db.query(models.Image.filename).filter(
+                models.Image.filename.in_({d.filename for d in batch})
+            )}
+            for deletion in batch:
+                if deletion.filename in live:
+                    continue
+                # A file written after the delete (re-upload, late render) belongs to someone else
+                deleted_at = deletion.created_at.replace(tzinfo=timezone.utc).timestamp()
+                for path in [storage.original_path(deletion.filename)] + storage.rendition_paths(deletion.filename, deletion.media_type):
+                    size = _remove(path, deleted_at)
+                    freed += size
+                    files += bool(size)
+            db.query(models.FileDeletion).filter(
+                models.FileDeletion.id.in_([d.id for d in batch])
+            ).delete(synchronize_session=False)
+            db.commit()
+        if files:
+            logger.info(f"Media GC: removed {files} files ({freed / 1024 / 1024:.1f} MB)")
+        return freed
+
+    def sweep(self, db: Session) -> int:
+        """
+        Remove orphaned files; returns the bytes freed.
+
+        Orphans are renditions whose original has no row, content-addressed
+        originals in the shards without a row, and temp files of interrupted
+        writers. The top level of uploads/ is the watch folder and is only
+        checked for stale upload temp files.
+        """
+        started = time.monotonic()
+        known = {filename for (filename,) in db.query(models.Image.filename)}
+        # ctime changes on hard links and renames too, so freshly migrated files count as young
+        cutoff = time.time() - self.grace
+        orphans: List[str] = []
+
+        def old(entry: os.DirEntry) -> bool:
+            st = entry.stat()
+            return max(st.st_mtime, st.st_ctime) < cutoff
+
+        for root in (storage.THUMB_DIR, storage.PREVIEW_DIR):
+            for entry in storage.iter_files(root):
+                owner = _rendition_owner(entry.name)
+                if (entry.name.endswith(".tmp") or (owner is not None and owner not in known)) and old(entry):
+                    orphans.append(entry.path)
+        for entry in storage.iter_files(storage.UPLOAD_DIR, top_level=False):
+            if storage.is_content_addressed(entry.name) and entry.name not in known and old(entry):
+                orphans.append(entry.path)
+        with os.scandir(storage.UPLOAD_DIR) as entries:
+            for entry in entries:
+                if entry.name.startswith(".upload-") and entry.name.endswith(".tmp") and old(entry):
+                    orphans.append(entry.path)
+
+        freed = sum(_remove(path) for path in orphans)
+        logger.info(f"Media GC sweep: {len(orphans)} orphaned files ({freed / 1024 / 1024:.1f} MB) "
+                    f"in {time.monotonic() - started:.1f}s")
+        return freed
+
+
+_collector = None
+
+def get_collector() -> MediaCollector:
+    """Get or create the global media collector."""
+    global _collector
+    if _collector is None:
+        _collector = MediaCollector()
+    return _collector
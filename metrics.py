@@ -0,0 +1,204 @@
+"""
+Metrics
+Prometheus text-format metrics without a client library or external service:
+- Per-stage timing of the media pipeline (hash, decode, renditions, ffmpeg, analyzer steps, DB commits)
+- Wall-clock histograms plus CPU seconds per stage, to tell CPU-bound from I/O-bound stages
+- Pipeline counters live in fork-shared memory, so observations from the job workers are included
+- Request latency per route via a pure ASGI middleware (keeps zero-copy file sends working)
+"""
+
+import time
+import bisect
+import threading
+import multiprocessing
+from contextlib import contextmanager
+from typing import Dict, Iterable, List, Optional, Sequence, Tuple
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0, 120.0)
+
+STAGES = (
+    "hash",               # SHA-256 of uploads and watch-folder files (includes the copy for uploads)
+    "decode",             # Opening and decoding an original for its renditions
+    "preview",            # Downscale + WebP encode of the 1600px preview
+    "thumbnail",          # Downscale + WebP encode of the 300px thumbnail
+    "ffprobe",
+    "ffmpeg",             # Poster and hover preview of a video
+    "analyze_load",       # Analyzer decode, resize and grayscale conversion
+    "analyze_faces",
+    "analyze_people",
+    "analyze_colors",     # Dominant colours (clustering)
+    "analyze_brightness",
+    "analyze_tags",
+    "db_commit",
+)
+
+_fork = multiprocessing.get_context("fork")
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _labels(pairs: Sequence[Tuple[str, str]]) -> str:
+    return "{" + ",".join(f'{key}="{_escape(value)}"' for key, value in pairs) + "}" if pairs else ""
+
+
+def _bucket_lines(name: str, labels: Sequence[Tuple[str, str]], counts: Sequence[float], total: float, count: float):
+    cumulative = 0
+    for bound, bucket in zip(BUCKETS, counts):
+        cumulative += bucket
+        yield f"{name}_bucket{_labels([*labels, ('le', repr(bound))])} {int(cumulative)}"
+    yield f"{name}_bucket{_labels([*labels, ('le', '+Inf')])} {int(count)}"
+    yield f"{name}_sum{_labels(labels)} {total}"
+    yield f"{name}_count{_labels(labels)} {int(count)}"
+
+
+class SharedHistogram:
+    """
+    Histogram over a fixed set of label values, stored in one shared-memory array.
+
+    Created at import time, before job_queue forks its workers, so every
+    process adds to the same counters. Per label: one slot per bucket, then
+    sum, count and CPU seconds.
+    """
+
+    def __init__(self, name: str, documentation: str, label_name: str, values: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_name = label_name
+        self._index = {value: i for i, value in enumerate(values)}
+        self._width = len(BUCKETS) + 3
+        self._data = _fork.Array("d", len(values) * self._width)
+
+    def observe(self, value: str, seconds: float, cpu_seconds: float = 0.0):
+        i = self._index.get(value)
+        if i is None:
+            return
+        base = i * self._width
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._data.get_lock():
+            data = self._data.get_obj()
+            if bucket < len(BUCKETS):
+                data[base + bucket] += 1
+            data[base + len(BUCKETS)] += seconds
+            data[base + len(BUCKETS) + 1] += 1
+            data[base + len(BUCKETS) + 2] += cpu_seconds
+
+    @contextmanager
+    def time(self, value: str):
+        """Wall and CPU (this thread) time of the block; recorded even if it raises."""
+        started, cpu_started = time.perf_counter(), time.thread_time()
+        try:
+            yield
+        finally:
+            self.observe(value, time.perf_counter() - started, time.thread_time() - cpu_started)
+
+    def render(self) -> List[str]:
+        with self._data.get_lock():
+            data = list(self._data.get_obj())
+        lines = [f"# HELP {self.name}_seconds {self.documentation}", f"# TYPE {self.name}_seconds histogram"]
+        cpu = [f"# HELP {self.name}_cpu_seconds_total CPU time spent, compare with {self.name}_seconds_sum",
+               f"# TYPE {self.name}_cpu_seconds_total counter"]
+        for value, i in self._index.items():
+            base = i * self._width
+            labels = [(self.label_name, value)]
+            lines.extend(_bucket_lines(f"{self.name}_seconds", labels, data[base:base + len(BUCKETS)],
+                                       data[base + len(BUCKETS)], data[base + len(BUCKETS) + 1]))
+            cpu.append(f"{self.name}_cpu_seconds_total{_labels(labels)} {data[base + len(BUCKETS) + 2]}")
+        return lines + cpu
+
+
+class Histogram:
+    """In-process histogram with arbitrary label sets (request latency is only observed in the web process)."""
+
+    def __init__(self, name: str, documentation: str, label_names: Sequence[str]):
+        self.name = name
+        self.documentation = documentation
+        self.label_names = tuple(label_names)
+        self._series: Dict[Tuple[str, ...], List[float]] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, label_values: Tuple[str, ...], seconds: float):
+        bucket = bisect.bisect_left(BUCKETS, seconds)
+        with self._lock:
+            series = self._series.setdefault(label_values, [0.0] * (len(BUCKETS) + 2))
+            if bucket < len(BUCKETS):
+                series[bucket] += 1
+            series[-2] += seconds
+            series[-1] += 1
+
+    def render(self) -> List[str]:
+        with self._lock:
+            series = {labels: list(values) for labels, values in self._series.items()}
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        for label_values, values in sorted(series.items()):
+            lines.extend(_bucket_lines(self.name, list(zip(self.label_names, label_values)),
+                                       values[:len(BUCKETS)], values[-2], values[-1]))
+        return lines
+
+
+def gauge(name: str, documentation: str, samples: Iterable[Tuple[Sequence[Tuple[str, str]], float]]) -> List[str]:
+    """Exposition lines for a gauge computed at scrape time; samples are (label pairs, value)."""
+    lines = [f"# HELP {name} {documentation}", f"# TYPE {name} gauge"]
+    lines.extend(f"{name}{_labels(labels)} {value}" for labels, value in samples)
+    return lines
+
+
+stage_seconds = SharedHistogram("pixi_stage", "Wall-clock time per media pipeline stage", "stage", STAGES)
+request_seconds = Histogram("pixi_request_seconds", "HTTP request latency per route", ("method", "route", "status"))
+
+_job_seconds: Optional[SharedHistogram] = None
+
+
+def register_job_kinds(kinds: Sequence[str]):
+    """Called by job_queue at import with its known job kinds."""
+    global _job_seconds
+    _job_seconds = SharedHistogram("pixi_job", "Wall-clock time per job, by kind", "kind", kinds)
+
+
+def stage(name: str):
+    """with metrics.stage("hash"): ..."""
+    return stage_seconds.time(name)
+
+
+def job(kind: str):
+    return _job_seconds.time(kind)
+
+
+def render(extra: Iterable[str] = ()) -> str:
+    lines = stage_seconds.render()
+    if _job_seconds is not None:
+        lines += _job_seconds.render()
+    lines += request_seconds.render()
+    lines += list(extra)
+    return "\n".join(lines) + "\n"
+
+
+class RequestMetricsMiddleware:
+    """Times each HTTP request until its last body message, labelled with the matched route template."""
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status = 500
+
+        async def send_wrapper(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            route = scope.get("route")
+            # Unmatched paths and mounts (static files) share one series, so labels stay bounded
+            path = getattr(route, "path", None) or "other"
+            request_seconds.observe((scope["method"], path, f"{status // 100}xx"), time.perf_counter() - started)
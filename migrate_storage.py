@@ -0,0 +1,163 @@
+"""
+Storage Migration Script
+Moves an existing library from the flat layout (uploads/<uuid>.jpg) into the
+sharded, content-addressed layout (uploads/ab/cd/<sha256>.jpg), see storage.py.
+
+Runs online, next to the app:
+- Originals and renditions are hard-linked into their shard first, then the rows are renamed (one commit per chunk)
+- The old paths are removed only after a grace period, so pages and caches that still hold the old names keep working
+- Pending removals are journaled in data/, an interrupted run finishes them on the next start
+- Renditions written to the old path during the grace period are moved instead of removed
+
+Usage:
+    python migrate_storage.py [--chunk-size N] [--grace SECONDS] [--dry-run]
+"""
+
+import os
+import sys
+import json
+import time
+import argparse
+import logging
+from database import SessionLocal
+import models
+import ingest
+import storage
+import batch_tools
+
+logging.basicConfig(level=logging.INFO)
+logger = logging.getLogger(__name__)
+
+JOURNAL_PATH = os.path.join(batch_tools.CHECKPOINT_DIR, ".migrate_storage.pending")
+
+# Longer than the gallery page cache TTL (PIXI_PAGE_CACHE_TTL) and the stat cache
+DEFAULT_GRACE_SECONDS = 60
+
+
+def load_journal():
+    """(old path, new path) pairs a previous run committed but did not clean up."""
+    try:
+        with open(JOURNAL_PATH) as f:
+            return [tuple(json.loads(line)) for line in f if line.strip()]
+    except OSError:
+        return []
+
+
+def append_journal(pairs):
+    os.makedirs(os.path.dirname(JOURNAL_PATH), exist_ok=True)
+    with open(JOURNAL_PATH, "a") as f:
+        for pair in pairs:
+            f.write(json.dumps(pair) + "\n")
+        f.flush()
+        os.fsync(f.fileno())
+
+
+def clean_up(pairs):
+    """Remove old paths; a rendition that only exists at the old path (written late) is moved instead."""
+    for old, new in pairs:
+        try:
+            if not os.path.exists(old):
+                continue
+            if os.path.exists(new):
+                os.remove(old)
+            else:
+                storage.place(old, new)
+        except OSError as e:
+            logger.error(f"Could not clean up {old}: {e}")
+
+
+def plan_moves(image: models.Image, new_name: str):
+    """(old, new) pairs for the original and every rendition that exists."""
+    pairs = [(storage.original_path(image.filename), storage.original_path(new_name))]
+    pairs += zip(storage.rendition_paths(image.filename, image.media_type),
+                 storage.rendition_paths(new_name, image.media_type))
+    return [(old, new) for old, new in pairs if os.path.exists(old)]
+
+
+def migrate(chunk_size: int = 500, grace: float = DEFAULT_GRACE_SECONDS, dry_run: bool = False):
+    leftover = load_journal()
+    if leftover and not dry_run:
+        logger.info(f"Finishing {len(leftover)} removals from an interrupted run")
+        clean_up(leftover)
+        os.remove(JOURNAL_PATH)
+
+    db = SessionLocal()
+    moved = 0
+    skipped = 0
+    pending = []  # (deadline, [(old, new), ...])
+    try:
+        base_query = db.query(models.Image.id, models.Image.filename)
+        total = base_query.count()
+        logger.info(f"Checking {total} images" + (" (dry run)" if dry_run else ""))
+        progress = batch_tools.Progress(total)
+
+        for chunk in batch_tools.iter_chunks(db, base_query, chunk_size):
+            progress.update(len(chunk))
+            ids = [image_id for image_id, filename in chunk if not storage.is_content_addressed(filename)]
+            if not ids:
+                continue
+            committed = []
+            taken = set()  # names assigned in this chunk, not flushed yet
+            for image in db.query(models.Image).filter(models.Image.id.in_(ids)):
+                original = storage.original_path(image.filename)
+                if not os.path.exists(original):
+                    logger.warning(f"File not found: {image.filename}")
+                    skipped += 1
+                    continue
+                if not image.content_hash:
+                    image.content_hash, image.size = ingest.hash_file(original)
+                new_name = storage.content_name(image.content_hash, image.filename)
+                if new_name in taken or db.query(models.Image.id).filter(models.Image.filename == new_name).first():
+                    logger.warning(f"{image.filename}: same content as an already migrated image, left in place")
+                    skipped += 1
+                    continue
+                taken.add(new_name)
+                moves = plan_moves(image, new_name)
+                if dry_run:
+                    logger.info(f"{image.filename} -> {storage.shard(new_name)}/{new_name} ({len(moves)} files)")
+                    moved += 1
+                    continue
+                for old, new in moves:
+                    storage.place(old, new, keep_source=True)
+                stat = os.stat(storage.original_path(new_name))
+                image.filename = new_name
+                # A hard link keeps inode and mtime; the copy fallback does not
+                image.file_mtime, image.file_inode = stat.st_mtime, stat.st_ino
+                committed += moves
+                moved += 1
+            if dry_run:
+                db.rollback()
+                continue
+            db.commit()
+            append_journal(committed)
+            pending.append((time.monotonic() + grace, committed))
+            while pending and pending[0][0] <= time.monotonic():
+                clean_up(pending.pop(0)[1])
+
+        progress.update(0, force=True)
+        if pending:
+            wait = max(0.0, pending[-1][0] - time.monotonic())
+            logger.info(f"Removing old paths after the grace period ({wait:.0f}s)")
+            time.sleep(wait)
+            for _, pairs in pending:
+                clean_up(pairs)
+        if not dry_run and os.path.exists(JOURNAL_PATH):
+            os.remove(JOURNAL_PATH)
+        logger.info(f"✓ Storage migration complete: {moved} moved, {skipped} skipped")
+    except Exception as e:
+        db.rollback()
+        logger.error(f"Storage migration failed: {e}")
+        sys.exit(1)
+    finally:
+        db.close()
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Move the library into the sharded, content-addressed layout")
+    parser.add_argument("--chunk-size", type=int, default=500,
+                        help="Images per database chunk / transaction (default: 500)")
+    parser.add_argument("--grace", type=float, default=DEFAULT_GRACE_SECONDS,
+                        help=f"Seconds to keep the old paths after renaming (default: {DEFAULT_GRACE_SECONDS})")
+    parser.add_argument("--dry-run", action="store_true", help="Only report what would be moved")
+    args = parser.parse_args()
+    migrate(args.chunk_size, args.grace, args.dry_run)
@@ -1,4 +1,4 @@
-from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, Float
+from sqlalchemy import Column, Integer, String, Boolean, DateTime, JSON, Float, Index, func
 from datetime import datetime
 from database import Base
 
@@ -15,11 +15,84 @@ class Image(Base):
     size = Column(Integer)  # in bytes
     content_hash = Column(String, index=True)
     media_type = Column(String, default="image") # "image" or "video"
+    # File fingerprint for incremental startup sync (size above + mtime + inode)
+    file_mtime = Column(Float)
+    file_inode = Column(Integer)
+    duration = Column(Float)  # seconds, videos only
+    # 64-bit dHash (signed) for near-duplicate detection, see near_duplicates.py
+    perceptual_hash = Column(Integer, index=True)
+    # BlurHash shown while the thumbnail loads, see placeholders.py
+    placeholder = Column(String)
+    # From the EXIF header, see exif.py; orientation NULL = not read yet (libraries from before)
+    taken_at = Column(DateTime)
+    orientation = Column(Integer)
+    camera = Column(String)
     
     # AI Analysis fields
     analyzed = Column(Boolean, default=False)
+    analyzed_at = Column(DateTime)  # Last analysis; change marker for the colour index
     face_count = Column(Integer, default=0)  # Fixed: was faces_count
     has_people = Column(Boolean, default=False)
     dominant_colors = Column(JSON)  # Store top 3 dominant colors as JSON array
     brightness = Column(Float)  # Average brightness 0-1
     tags = Column(JSON)  # Auto-generated tags based on analysis
+
+    __table_args__ = (
+        # Keyset pagination for the gallery (newest first, optionally favorites only)
+        Index("ix_images_upload_date_id", "upload_date", "id"),
+        Index("ix_images_favorite_upload_date_id", "is_favorite", "upload_date", "id"),
+        # Timeline order: capture date, upload date for files without one (see timeline.py)
+        Index("ix_images_timeline_id", func.coalesce(taken_at, upload_date), "id"),
+        Index("ix_images_favorite_timeline_id", "is_favorite", func.coalesce(taken_at, upload_date), "id"),
+        # Smart search filters
+        Index("ix_images_face_count", "face_count"),
+        Index("ix_images_has_people", "has_people"),
+        Index("ix_images_brightness", "brightness"),
+    )
+
+
+class ImageTag(Base):
+    """Normalized copy of Image.tags so tag filters are index lookups, not JSON scans."""
+    __tablename__ = "image_tags"
+
+    tag = Column(String, primary_key=True)
+    image_id = Column(Integer, primary_key=True, index=True)
+
+
+class TimelineMonth(Base):
+    """Images per month of the timeline date, maintained by triggers on images (see timeline.py)."""
+    __tablename__ = "timeline_months"
+
+    month = Column(String, primary_key=True)  # "YYYY-MM"
+    count = Column(Integer, nullable=False, default=0)
+
+
+class FileDeletion(Base):
+    """Files of a deleted image, written in the deleting transaction and removed later by media_gc."""
+    __tablename__ = "file_deletions"
+
+    id = Column(Integer, primary_key=True)
+    filename = Column(String)
+    media_type = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+
+
+class Job(Base):
+    """A unit of background media work (rendition, analysis) stored durably."""
+    __tablename__ = "jobs"
+
+    id = Column(Integer, primary_key=True, index=True)
+    image_id = Column(Integer, index=True)
+    kind = Column(String)  # "thumbnail", "preview" or "analyze"
+    priority = Column(Integer, default=0)  # Lower runs first
+    status = Column(String, default="pending")  # pending, running, failed; finished jobs are deleted
+    attempts = Column(Integer, default=0)
+    max_attempts = Column(Integer, default=5)
+    run_after = Column(DateTime, default=datetime.utcnow)
+    last_error = Column(String)
+    created_at = Column(DateTime, default=datetime.utcnow)
+    updated_at = Column(DateTime, default=datetime.utcnow)
+
+    __table_args__ = (
+        Index("ix_jobs_claim", "status", "priority", "run_after"),
+    )
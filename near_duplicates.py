@@ -0,0 +1,227 @@
+"""
+Near-Duplicate Detection
+Finds re-encoded, resized or recompressed copies of the same photo:
+- 64-bit difference hash (dHash) per image, stored in images.perceptual_hash
+- In-memory multi-index hash table answering "Hamming distance <= k" without pairwise scans
+- Clusters of near-duplicates for /api/duplicates
+- Images without contrast (solid colours, blank scans, black frames) hash to FLAT_HASH and are never matched
+"""
+
+import os
+import logging
+import threading
+from typing import Dict, List, Optional, Set, Tuple
+import numpy as np
+from PIL import Image as PILImage
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+import models
+
+logger = logging.getLogger(__name__)
+
+HASH_BITS = 64
+# Largest distance the index answers; copies of one photo are typically within 0-4 bits
+MAX_DISTANCE = int(os.environ.get("PIXI_DUPLICATE_DISTANCE", 6))
+# Row block for pairwise comparison inside one bucket (bounds memory for huge buckets)
+BLOCK_SIZE = 1024
+# Below this standard deviation (grey levels of the 9x8 grid) the bits are noise, not structure
+FLAT_STD = 2.0
+# Hash of every flat image; stored so it is not queued again, but left out of the index
+FLAT_HASH = 0
+
+
+def to_signed(value: int) -> int:
+    """SQLite integers are signed 64-bit."""
+    return value - (1 << 64) if value >= (1 << 63) else value
+
+
+def to_unsigned(value: int) -> int:
+    return value & ((1 << 64) - 1)
+
+
+def dhash(img: PILImage.Image) -> int:
+    """Difference hash: one bit per horizontally adjacent pixel pair of a 9x8 grayscale image."""
+    img.thumbnail((64, 64))
+    pixels = np.asarray(img.convert("L").resize((9, 8), PILImage.LANCZOS), dtype=np.int16)
+    if pixels.std() < FLAT_STD:
+        return FLAT_HASH
+    bits = (pixels[:, 1:] > pixels[:, :-1]).flatten()
+    return int(np.packbits(bits).view(">u8")[0])
+
+
+def compute_hash(file_path: str) -> int:
+    """dHash of an image file, as stored in the database (signed)."""
+    with PILImage.open(file_path) as img:
+        if img.format == "JPEG":
+            img.draft("L", (64, 64))
+        return to_signed(dhash(img))
+
+
+class MultiIndexHash:
+    """
+    Multi-index hashing over 64-bit hashes.
+
+    The hash is split into max_distance + 1 disjoint bit chunks, one lookup
+    table per chunk. Two hashes within distance k <= max_distance differ in at
+    most k chunks, so they share at least one chunk exactly (pigeonhole): only
+    hashes in the same bucket of some table have to be compared.
+    """
+
+    def __init__(self, max_distance: int = MAX_DISTANCE):
+        self.max_distance = max_distance
+        chunks = max_distance + 1
+        widths = [HASH_BITS // chunks + (1 if i < HASH_BITS % chunks else 0) for i in range(chunks)]
+        self._chunks: List[Tuple[int, int]] = []  # (shift, mask)
+        shift = 0
+        for width in widths:
+            self._chunks.append((shift, (1 << width) - 1))
+            shift += width
+        self._tables: List[Dict[int, Set[int]]] = [{} for _ in self._chunks]
+        self._hashes: Dict[int, int] = {}  # image id -> unsigned hash
+        self._lock = threading.Lock()
+        self.generation = 0
+        self._clusters_cache: Optional[Tuple[int, int, List[List[int]]]] = None
+        self._signature = None
+
+    def __len__(self):
+        return len(self._hashes)
+
+    def _keys(self, value: int):
+        return [(value >> shift) & mask for shift, mask in self._chunks]
+
+    def add(self, image_id: int, value: int):
+        value = to_unsigned(value)
+        with self._lock:
+            if self._hashes.get(image_id) == value:
+                return
+            self._remove(image_id)
+            if value == FLAT_HASH:
+                return
+            self._hashes[image_id] = value
+            for table, key in zip(self._tables, self._keys(value)):
+                table.setdefault(key, set()).add(image_id)
+            self.generation += 1
+
+    def remove(self, image_id: int):
+        with self._lock:
+            self._remove(image_id)
+
+    def _remove(self, image_id: int):
+        value = self._hashes.pop(image_id, None)
+        if value is None:
+            return
+        for table, key in zip(self._tables, self._keys(value)):
+            bucket = table[key]
+            bucket.discard(image_id)
+            if not bucket:
+                del table[key]
+        self.generation += 1
+
+    def query(self, value: int, distance: int) -> List[Tuple[int, int]]:
+        """(image_id, distance) of every indexed hash within `distance` bits, closest first."""
+        if distance > self.max_distance:
+            raise ValueError(f"distance must be <= {self.max_distance}")
+        value = to_unsigned(value)
+        if value == FLAT_HASH:
+            return []
+        with self._lock:
+            candidates = set()
+            for table, key in zip(self._tables, self._keys(value)):
+                candidates |= table.get(key, set())
+            matches = [(image_id, bin(value ^ self._hashes[image_id]).count("1")) for image_id in candidates]
+        return sorted(((i, d) for i, d in matches if d <= distance), key=lambda m: (m[1], m[0]))
+
+    def clusters(self, distance: int) -> List[List[int]]:
+        """Connected groups of images linked by distance <= `distance`, largest first."""
+        if distance > self.max_distance:
+            raise ValueError(f"distance must be <= {self.max_distance}")
+        with self._lock:
+            cached = self._clusters_cache
+            if cached and cached[0] == self.generation and cached[1] == distance:
+                return cached[2]
+            generation = self.generation
+            ids = np.fromiter(self._hashes.keys(), dtype=np.int64, count=len(self._hashes))
+            values = np.fromiter(self._hashes.values(), dtype=np.uint64, count=len(self._hashes))
+        by_id = np.argsort(ids)
+        ids, values = ids[by_id], values[by_id]
+
+        # Same buckets as the lookup tables, rebuilt as sorted runs of equal chunk keys.
+        # The stable sort keeps ids ascending within a run, so each pair is taken once (col > row).
+        pairs = []
+        for shift, mask in self._chunks:
+            keys = (values >> np.uint64(shift)) & np.uint64(mask)
+            order = np.argsort(keys, kind="stable")
+            bounds = np.flatnonzero(np.diff(keys[order])) + 1
+            for run in np.split(order, bounds):
+                if len(run) < 2:
+                    continue
+                run_ids, run_values = ids[run], values[run]
+                for start in range(0, len(run), BLOCK_SIZE):
+                    block = run_values[start:start + BLOCK_SIZE]
+                    rows, cols = np.nonzero(np.bitwise_count(block[:, None] ^ run_values[None, :]) <= distance)
+                    later = cols > rows + start
+                    pairs.append(np.stack([run_ids[rows[later] + start], run_ids[cols[later]]], axis=1))
+
+        parent: Dict[int, int] = {}
+
+        def find(x):
+            while parent.get(x, x) != x:
+                parent[x] = parent.get(parent[x], parent[x])
+                x = parent[x]
+            return x
+
+        # A pair sharing several chunks shows up in several tables
+        edges = np.unique(np.concatenate(pairs), axis=0) if pairs else np.empty((0, 2), dtype=np.int64)
+        for a, b in edges.tolist():
+            ra, rb = find(a), find(b)
+            if ra != rb:
+                parent[ra] = parent[rb] = min(ra, rb)
+
+        groups: Dict[int, List[int]] = {}
+        for image_id in parent:
+            groups.setdefault(find(image_id), []).append(image_id)
+        result = sorted((sorted(g) for g in groups.values()), key=lambda g: (-len(g), g[0]))
+
+        with self._lock:
+            if self.generation == generation:
+                self._clusters_cache = (generation, distance, result)
+        return result
+
+    def sync(self, db: Session):
+        """
+        Pick up hashes written by the worker processes.
+
+        A cheap aggregate over the indexed column decides whether anything
+        changed; only then are (id, hash) pairs reloaded. The checksums are
+        exact integer sums (a float total() loses small or cancelling changes);
+        weighting by id catches a hash that moved to another image.
+        """
+        hashed = models.Image.perceptual_hash.isnot(None)
+        signature = tuple(db.query(
+            func.count(models.Image.id),
+            func.max(models.Image.id),
+            func.sum(models.Image.perceptual_hash % 2147483647),
+            func.sum((models.Image.id % 65521) * (models.Image.perceptual_hash % 65521)),
+        ).filter(hashed).one())
+        if signature == self._signature:
+            return
+        rows = db.query(models.Image.id, models.Image.perceptual_hash).filter(hashed).all()
+        current = {image_id for image_id, _ in rows}
+        with self._lock:
+            stale = set(self._hashes) - current
+        for image_id in stale:
+            self.remove(image_id)
+        for image_id, value in rows:
+            self.add(image_id, value)
+        self._signature = signature
+        logger.info(f"Near-duplicate index: {len(self._hashes)} hashes")
+
+
+_index = None
+
+def get_index() -> MultiIndexHash:
+    """Get or create the global near-duplicate index."""
+    global _index
+    if _index is None:
+        _index = MultiIndexHash()
+    return _index
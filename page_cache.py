@@ -0,0 +1,91 @@
+"""
+Gallery Page Cache
+Serialized gallery pages kept in memory until the library changes:
+- Pages are keyed by their request parameters plus a library generation counter
+- Uploads, favourites, deletes, watch-folder imports and finished jobs bump the counter
+- The counter lives in shared memory, so the forked job workers bump it too
+- Bodies are encoded once with orjson and carry a content ETag for 304 revalidation
+"""
+
+import os
+import time
+import hashlib
+import threading
+import multiprocessing
+from collections import OrderedDict
+from typing import Any, Callable, Hashable, List, NamedTuple, Optional, Tuple
+import orjson
+
+# Safety net for writers outside this process tree (analyze_batch.py, generate_thumbnails.py)
+TTL = float(os.environ.get("PIXI_PAGE_CACHE_TTL", 30))
+MAX_ENTRIES = int(os.environ.get("PIXI_PAGE_CACHE_SIZE", 512))
+
+# Created at import, before job_queue forks its workers, so every process shares the same counter
+_generation = multiprocessing.get_context("fork").Value("Q", 0)
+
+
+def generation() -> int:
+    return _generation.value
+
+
+def bump():
+    """Call after committing any change that shows up in a gallery listing."""
+    with _generation.get_lock():
+        _generation.value += 1
+
+
+class CachedPage(NamedTuple):
+    rows: List[Any]  # Query rows of the page, for server-side rendering
+    body: bytes  # JSON API payload
+    etag: str
+    next_cursor: Optional[str]
+
+
+class PageCache:
+    """LRU of (key, generation) -> (CachedPage, expires_at)."""
+
+    def __init__(self, max_entries: int = MAX_ENTRIES, ttl: float = TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries: "OrderedDict[Tuple[Hashable, int], Tuple[CachedPage, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get_or_build(self, key: Hashable, build: Callable[[], Tuple[List[Any], Any, Optional[str]]]) -> CachedPage:
+        """
+        Cached page for key, or build() -> (rows, payload, next_cursor) on a miss.
+
+        The generation is read before build() queries the database, so a page
+        built while a change commits is stored under the old generation and
+        never served after the bump.
+        """
+        full_key = (key, generation())
+        now = time.monotonic()
+        with self._lock:
+            entry = self._entries.get(full_key)
+            if entry and entry[1] > now:
+                self._entries.move_to_end(full_key)
+                return entry[0]
+
+        rows, payload, next_cursor = build()
+        body = orjson.dumps(payload)
+        page = CachedPage(rows, body, f'"{hashlib.sha1(body).hexdigest()[:20]}"', next_cursor)
+        with self._lock:
+            self._entries[full_key] = (page, now + self.ttl)
+            self._entries.move_to_end(full_key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return page
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+_cache = None
+
+def get_cache() -> PageCache:
+    """Get or create the global page cache."""
+    global _cache
+    if _cache is None:
+        _cache = PageCache()
+    return _cache
@@ -0,0 +1,77 @@
+"""
+Image Placeholders
+BlurHash strings shown in the gallery while thumbnails load:
+- ~28 ASCII characters per image, stored on images.placeholder and sent with every listing
+- Encoded from the 300px thumbnail, so it costs one tiny decode per image
+- Decoded on the client into a blurred background (static/js/app.js)
+"""
+
+import numpy as np
+from PIL import Image as PILImage
+
+COMPONENTS_X = 4
+COMPONENTS_Y = 3
+# The encoder averages over all pixels, 32px is indistinguishable from full size
+SAMPLE_SIZE = 32
+# Stored when the thumbnail job gave up (corrupt file): not queued again until the file changes
+UNAVAILABLE = ""
+
+_BASE83 = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~"
+
+
+def _base83(value: int, length: int) -> str:
+    return "".join(_BASE83[(value // 83 ** (length - i - 1)) % 83] for i in range(length))
+
+
+def _srgb_to_linear(c: np.ndarray) -> np.ndarray:
+    c = c / 255.0
+    return np.where(c <= 0.04045, c / 12.92, ((c + 0.055) / 1.055) ** 2.4)
+
+
+def _linear_to_srgb(value: float) -> int:
+    v = min(max(value, 0.0), 1.0)
+    if v <= 0.0031308:
+        return int(v * 12.92 * 255 + 0.5)
+    return int((1.055 * v ** (1 / 2.4) - 0.055) * 255 + 0.5)
+
+
+def encode(img: PILImage.Image, components_x: int = COMPONENTS_X, components_y: int = COMPONENTS_Y) -> str:
+    """BlurHash of a PIL image (https://blurha.sh, reference algorithm)."""
+    img = img.convert("RGB")
+    img.thumbnail((SAMPLE_SIZE, SAMPLE_SIZE))
+    pixels = _srgb_to_linear(np.asarray(img, dtype=np.float64))
+    height, width = pixels.shape[:2]
+
+    # factors[j, i] = mean of pixels weighted by the cosine basis cos(pi*i*x/w) * cos(pi*j*y/h)
+    basis_x = np.cos(np.pi * np.outer(np.arange(components_x), np.arange(width)) / width)
+    basis_y = np.cos(np.pi * np.outer(np.arange(components_y), np.arange(height)) / height)
+    factors = np.einsum("jy,ix,yxc->jic", basis_y, basis_x, pixels) / (width * height)
+    factors[1:] *= 2
+    factors[0, 1:] *= 2
+    factors = factors.reshape(-1, 3)
+    dc, ac = factors[0], factors[1:]
+
+    result = _base83((components_x - 1) + (components_y - 1) * 9, 1)
+    if len(ac):
+        quantised_max = int(min(max(np.abs(ac).max() * 166 - 0.5, 0), 82))
+        maximum = (quantised_max + 1) / 166
+        result += _base83(quantised_max, 1)
+    else:
+        maximum = 1.0
+        result += _base83(0, 1)
+
+    r, g, b = (_linear_to_srgb(v) for v in dc)
+    result += _base83((r << 16) + (g << 8) + b, 4)
+
+    quantised = np.clip(np.floor(np.sign(ac) * np.sqrt(np.abs(ac / maximum)) * 9 + 9.5), 0, 18).astype(int)
+    for qr, qg, qb in quantised.tolist():
+        result += _base83(qr * 19 * 19 + qg * 19 + qb, 2)
+    return result
+
+
+def compute(file_path: str) -> str:
+    """BlurHash of an image file (normally the thumbnail)."""
+    with PILImage.open(file_path) as img:
+        if img.format == "JPEG":
+            img.draft("RGB", (SAMPLE_SIZE, SAMPLE_SIZE))
+        return encode(img)
@@ -0,0 +1,129 @@
+"""
+Rendition Cache
+Size-bounded disk cache for on-demand renditions (/img/{id}):
+- Least recently used files are evicted once the cache exceeds its byte budget
+- Single-flight: concurrent requests for the same rendition render it only once
+"""
+
+import os
+import logging
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable
+
+logger = logging.getLogger(__name__)
+
+CACHE_DIR = os.path.join(os.getcwd(), "cache")
+MAX_BYTES = int(float(os.environ.get("PIXI_CACHE_MAX_MB", 1024)) * 1024 * 1024)
+
+
+class RenditionCache:
+    def __init__(self, directory: str = CACHE_DIR, max_bytes: int = MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries: "OrderedDict[str, int]" = OrderedDict()  # key -> size, oldest first
+        self._total = 0
+        self._lock = threading.Lock()
+        self._inflight: Dict[str, threading.Lock] = {}
+        os.makedirs(directory, exist_ok=True)
+        self._load()
+
+    def _load(self):
+        """Rebuild LRU order from file modification times (hits touch the file)."""
+        entries = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and not entry.name.endswith(".tmp"):
+                stat = entry.stat()
+                entries.append((stat.st_mtime, entry.name, stat.st_size))
+            elif entry.name.endswith(".tmp"):
+                os.remove(entry.path)  # Leftover from an interrupted render
+        for _, name, size in sorted(entries):
+            self._entries[name] = size
+            self._total += size
+        self._evict()
+
+    def path_for(self, key: str) -> str:
+        return os.path.join(self.directory, key)
+
+    def get_or_render(self, key: str, render: Callable[[str], None]) -> str:
+        """
+        Return the cached file for `key`, calling render(out_path) on a miss.
+
+        Only one thread renders a given key; others wait and then reuse the result.
+        """
+        path = self.path_for(key)
+        if self._hit(key, path):
+            return path
+
+        with self._lock:
+            key_lock = self._inflight.setdefault(key, threading.Lock())
+        with key_lock:
+            try:
+                if self._hit(key, path):
+                    return path
+                render(path)
+                size = os.path.getsize(path)
+                with self._lock:
+                    self._total += size - self._entries.pop(key, 0)
+                    self._entries[key] = size
+                    self._evict()
+                return path
+            finally:
+                with self._lock:
+                    self._inflight.pop(key, None)
+
+    def _hit(self, key: str, path: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._entries.move_to_end(key)
+        try:
+            os.utime(path)
+        except OSError:
+            # Deleted behind our back
+            with self._lock:
+                self._total -= self._entries.pop(key, 0)
+            return False
+        return True
+
+    def _evict(self):
+        """Drop least recently used entries until under budget. Caller holds self._lock.
+
+        The most recent entry is always kept so a fresh render can still be served.
+        """
+        while self._total > self.max_bytes and len(self._entries) > 1:
+            key, size = self._entries.popitem(last=False)
+            self._total -= size
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+    def invalidate_prefix(self, prefix: str):
+        """Remove every cached rendition whose key starts with prefix (e.g. a deleted image)."""
+        with self._lock:
+            self._remove_keys([k for k in self._entries if k.startswith(prefix)])
+
+    def invalidate_images(self, image_ids: Iterable[int]):
+        """invalidate_prefix for many deleted images in one pass over the cache."""
+        prefixes = {str(image_id) for image_id in image_ids}
+        with self._lock:
+            self._remove_keys([k for k in self._entries if k.split("_", 1)[0] in prefixes])
+
+    def _remove_keys(self, keys):
+        for key in keys:
+            self._total -= self._entries.pop(key)
+            try:
+                os.remove(self.path_for(key))
+            except OSError:
+                pass
+
+
+_cache = None
+
+def get_cache() -> RenditionCache:
+    """Get or create the global rendition cache."""
+    global _cache
+    if _cache is None:
+        _cache = RenditionCache()
+    return _cache
@@ -0,0 +1,111 @@
+"""
+Rendition Engine
+Produces the WebP preview and thumbnail of an image from a single decode:
+- JPEGs are decoded at reduced scale via PIL draft mode
+- Each smaller rendition is derived from the next larger one, not from the original
+- WebP encoder effort (method 0-6) is configurable per size
+"""
+
+import os
+import uuid
+import logging
+from typing import List, NamedTuple, Tuple
+from PIL import Image as PILImage
+import metrics
+
+logger = logging.getLogger(__name__)
+
+
+class RenditionSpec(NamedTuple):
+    name: str
+    max_size: int  # Longest edge in pixels
+    quality: int
+    method: int  # WebP encoder effort, 0 (fast) - 6 (slowest, smallest)
+
+
+PREVIEW = RenditionSpec("preview", 1600, 75, int(os.environ.get("PIXI_PREVIEW_WEBP_METHOD", 4)))
+THUMBNAIL = RenditionSpec("thumbnail", 300, 60, int(os.environ.get("PIXI_THUMB_WEBP_METHOD", 6)))
+
+
+def open_scaled(file_path: str, max_size: int) -> PILImage.Image:
+    """Opens an image, asking JPEG decoders to decode at the smallest scale >= max_size."""
+    img = PILImage.open(file_path)
+    if img.format == "JPEG":
+        img.draft("RGB", (max_size, max_size))
+    return img
+
+
+def _tmp_path(path: str) -> str:
+    # Unique per writer: the thumbnail and preview jobs may render the same file concurrently
+    return f"{path}.{uuid.uuid4().hex}.tmp"
+
+
+def save_webp(img: PILImage.Image, path: str, spec: RenditionSpec):
+    """Writes atomically so a half-written rendition is never served."""
+    os.makedirs(os.path.dirname(path), exist_ok=True)  # shard directory (storage.py)
+    tmp_path = _tmp_path(path)
+    img.save(tmp_path, "WEBP", quality=spec.quality, method=spec.method)
+    os.replace(tmp_path, path)
+
+
+def render(file_path: str, targets: List[Tuple[RenditionSpec, str]]) -> List[str]:
+    """
+    Render several sizes of one image with a single decode.
+
+    Args:
+        file_path: Original image
+        targets: (spec, output path) pairs; targets whose output already exists are skipped
+
+    Returns:
+        list of output paths that were written
+    """
+    pending = sorted(
+        [(spec, path) for spec, path in targets if not os.path.exists(path)],
+        key=lambda target: target[0].max_size,
+        reverse=True
+    )
+    if not pending:
+        return []
+
+    written = []
+    with open_scaled(file_path, pending[0][0].max_size) as img:
+        with metrics.stage("decode"):
+            img.load()
+            current = img
+            if current.mode not in ("RGB", "L"):
+                current = current.convert("RGB")
+        for spec, path in pending:
+            with metrics.stage(spec.name):
+                # In-place downscale: each size is derived from the previous (larger) one
+                current.thumbnail((spec.max_size, spec.max_size))
+                save_webp(current, path, spec)
+            written.append(path)
+    return written
+
+
+# Output formats for on-demand renditions: fmt -> (PIL format, save options)
+DYNAMIC_FORMATS = {
+    "webp": ("WEBP", {"quality": 70, "method": 4}),
+    "avif": ("AVIF", {"quality": 55, "speed": 8}),
+    "jpeg": ("JPEG", {"quality": 80, "optimize": True, "progressive": True}),
+}
+
+
+def format_supported(fmt: str) -> bool:
+    from PIL import features
+    if fmt not in DYNAMIC_FORMATS:
+        return False
+    return fmt == "jpeg" or features.check(fmt)
+
+
+def render_dynamic(source_path: str, out_path: str, width: int, height: int, fmt: str):
+    """Render one arbitrary size (bounding box width x height, never upscaled) to out_path."""
+    pil_format, options = DYNAMIC_FORMATS[fmt]
+    with open_scaled(source_path, max(width, height)) as img:
+        current = img
+        if current.mode not in ("RGB", "L"):
+            current = current.convert("RGB")
+        current.thumbnail((width, height))
+        tmp_path = _tmp_path(out_path)
+        current.save(tmp_path, pil_format, **options)
+        os.replace(tmp_path, out_path)
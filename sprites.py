@@ -0,0 +1,81 @@
+"""
+Thumbnail Sprites
+One WebP contact sheet per gallery page instead of one request per card:
+- Square, center-cropped tiles cut from the existing 300px thumbnails
+- The sheet URL carries a digest of ids + content hashes, so it is immutable
+- Rendered lazily into the rendition cache (LRU, single-flight)
+"""
+
+import os
+import math
+import hashlib
+from typing import List, NamedTuple, Optional, Sequence
+from PIL import Image as PILImage, ImageOps
+import renditions
+
+TILE_SIZE = int(os.environ.get("PIXI_SPRITE_TILE", 192))
+COLUMNS = 10
+MAX_TILES = 100
+SPRITE = renditions.RenditionSpec("sprite", TILE_SIZE, 70, 4)
+BACKGROUND = (21, 21, 24)  # .image-card background, shown for thumbnails still being generated
+
+
+class SpriteEntry(NamedTuple):
+    image_id: int
+    content_hash: Optional[str]
+    thumb_path: Optional[str]  # None if the thumbnail does not exist yet
+
+
+class SpriteSheet(NamedTuple):
+    url: str
+    columns: int
+    rows: int
+
+    @property
+    def background_size(self) -> str:
+        return f"{self.columns * 100}% {self.rows * 100}%"
+
+    def position(self, index: int) -> str:
+        """CSS background-position of tile `index` for a card of any size."""
+        col, row = index % self.columns, index // self.columns
+        x = col / (self.columns - 1) * 100 if self.columns > 1 else 0
+        y = row / (self.rows - 1) * 100 if self.rows > 1 else 0
+        return f"{x:.4f}% {y:.4f}%"
+
+
+def digest(entries: Sequence[SpriteEntry]) -> str:
+    """Changes whenever an image, its content or the availability of its thumbnail changes."""
+    h = hashlib.sha1(f"{TILE_SIZE}".encode())
+    for entry in entries:
+        h.update(f"|{entry.image_id}:{entry.content_hash}:{entry.thumb_path is not None}".encode())
+    return h.hexdigest()[:20]
+
+
+def sheet_for(entries: Sequence[SpriteEntry]) -> SpriteSheet:
+    columns = min(len(entries), COLUMNS) or 1
+    rows = max(math.ceil(len(entries) / columns), 1)
+    ids = ",".join(str(entry.image_id) for entry in entries)
+    return SpriteSheet(f"/sprites/{digest(entries)}.webp?ids={ids}", columns, rows)
+
+
+def render(entries: Sequence[SpriteEntry], out_path: str):
+    """Paste every thumbnail as a square tile, row-major, into one WebP."""
+    sheet = sheet_for(entries)
+    canvas = PILImage.new("RGB", (sheet.columns * TILE_SIZE, sheet.rows * TILE_SIZE), BACKGROUND)
+    for index, entry in enumerate(entries):
+        if entry.thumb_path is None:
+            continue
+        try:
+            with PILImage.open(entry.thumb_path) as thumb:
+                tile = ImageOps.fit(thumb.convert("RGB"), (TILE_SIZE, TILE_SIZE))
+        except OSError:
+            continue
+        canvas.paste(tile, ((index % sheet.columns) * TILE_SIZE, (index // sheet.columns) * TILE_SIZE))
+    renditions.save_webp(canvas, out_path, SPRITE)
+
+
+def parse_ids(value: str) -> List[int]:
+    ids = [int(part) for part in value.split(",") if part]
+    if not ids or len(ids) > MAX_TILES:
+        raise ValueError(f"between 1 and {MAX_TILES} ids required")
+    return ids
@@ -0,0 +1,86 @@
+"""
+Startup Phases
+Boot work that does not have to finish before the first request:
+- The app serves the gallery as soon as the schema is current and the workers are forked
+- Everything else (statistics, backfill queues, similarity indexes, library sync) runs as named phases on one background thread
+- Each phase records its status, progress and duration for /readyz
+"""
+
+import time
+import logging
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+# Uptime is counted from the import of this module (early in main)
+BOOTED = time.monotonic()
+
+
+class Phase:
+    def __init__(self, name: str):
+        self.name = name
+        self.status = "pending"  # pending -> running -> done | failed
+        self.done = 0
+        self.total: Optional[int] = None
+        self.error: Optional[str] = None
+        self.started: Optional[float] = None
+        self.finished: Optional[float] = None
+
+    def snapshot(self) -> dict:
+        state = {"name": self.name, "status": self.status}
+        if self.total is not None:
+            state["done"], state["total"] = self.done, self.total
+        if self.started is not None:
+            state["seconds"] = round((self.finished or time.monotonic()) - self.started, 2)
+        if self.error:
+            state["error"] = self.error
+        return state
+
+
+class StartupProgress:
+    """Runs phases in order and keeps their state; one failed phase does not stop the ones after it."""
+
+    def __init__(self):
+        self._phases: List[Phase] = []
+        self._lock = threading.Lock()
+
+    def run(self, phases: List[Tuple[str, Callable[[Callable[[int, int], None]], None]]]):
+        """phases: (name, fn) pairs; fn receives a report(done, total) callback."""
+        with self._lock:
+            self._phases = [Phase(name) for name, _ in phases]
+        for phase, (_, fn) in zip(self._phases, phases):
+            phase.status, phase.started = "running", time.monotonic()
+            try:
+                fn(lambda done, total, phase=phase: self._report(phase, done, total))
+                phase.status = "done"
+            except Exception as e:
+                phase.status, phase.error = "failed", str(e)
+                logger.error(f"Startup phase {phase.name} failed: {e}")
+            phase.finished = time.monotonic()
+        logger.info(f"Startup complete {time.monotonic() - BOOTED:.1f}s after boot")
+
+    def start(self, phases: List[Tuple[str, Callable[[Callable[[int, int], None]], None]]]):
+        threading.Thread(target=self.run, args=(phases,), name="startup", daemon=True).start()
+
+    def _report(self, phase: Phase, done: int, total: int):
+        phase.done, phase.total = done, total
+
+    def snapshot(self) -> Dict:
+        with self._lock:
+            phases = [p.snapshot() for p in self._phases]
+        return {
+            "uptime_seconds": round(time.monotonic() - BOOTED, 1),
+            "backfill_complete": bool(phases) and all(p["status"] in ("done", "failed") for p in phases),
+            "phases": phases,
+        }
+
+
+_progress = None
+
+def get_progress() -> StartupProgress:
+    """Get or create the global startup progress tracker."""
+    global _progress
+    if _progress is None:
+        _progress = StartupProgress()
+    return _progress
@@ -4,10 +4,10 @@
 
 let images = [];
 let currentIndex = 0;
-let offset = 50;
+let nextCursor = document.getElementById('gallery')?.dataset.nextCursor || null;
 const limit = 50;
 let isLoading = false;
-let hasMore = true;
+let hasMore = !!nextCursor;
 let search = "";
 let favoritesOnly = new URLSearchParams(window.location.search).get('favorites') === "true";
 
@@ -48,6 +48,12 @@ function handleUrlState() {
 
     let needsFetch = false;
 
+    // Sync smart search (e.g. ?search=tag:portrait faces:>2)
+    if (searchTerm !== search) {
+        search = searchTerm;
+        needsFetch = true;
+    }
+
 
     // Sync favorites
     if (fav !== favoritesOnly) {
@@ -86,10 +92,11 @@ function initGallery() {
     const cards = document.querySelectorAll('.image-card');
     images = Array.from(cards).map(card => ({
         id: card.dataset.id,
-        filename: card.querySelector('img').src.split('/').pop().replace('.webp', ''),
+        filename: card.dataset.filename,
         media_type: card.querySelector('.video-indicator') ? 'video' : 'image',
         is_favorite: card.querySelector('.btn-fav').classList.contains('active')
     }));
+    cards.forEach(card => applyPlaceholder(card, card.dataset.placeholder));
 }
 
 // --- API Interactions ---
@@ -99,7 +106,7 @@ async function fetchImages(reset = false) {
     isLoading = true;
 
     if (reset) {
-        offset = 0;
+        nextCursor = null;
         hasMore = true;
         images = [];
         const gallery = document.getElementById('gallery');
@@ -107,19 +114,28 @@ async function fetchImages(reset = false) {
     }
 
     try {
-        const response = await fetch(`/api/images?offset=${offset}&limit=${limit}&favorites=${favoritesOnly}`);
-        const data = await response.json();
-
-        if (data.length < limit) hasMore = false;
+        const params = new URLSearchParams({ limit, favorites: favoritesOnly });
+        if (nextCursor) params.set('cursor', nextCursor);
+        if (search) params.set('q', search);
+        // Dense grid: one request for the page plus one sprite sheet for all its thumbnails
+        const dense = isDenseGrid();
+        const endpoint = dense ? '/api/bundle' : (search ? '/api/search' : '/api/images');
+        const response = await fetch(`${endpoint}?${params}`);
+        const body = await response.json();
+        if (!response.ok) throw new Error(body.detail || response.statusText);
+        const data = dense ? body.images : body;
+        const sprite = dense ? body.sprite : null;
+
+        // Keyset pagination: the server hands us the position of the next page
+        nextCursor = response.headers.get('X-Next-Cursor');
+        if (!nextCursor) hasMore = false;
 
         data.forEach(img => {
             if (!images.find(i => i.id == img.id)) {
-                appendImageToGallery(img);
+                appendImageToGallery(img, sprite);
                 images.push(img);
             }
         });
-
-        offset += data.length;
     } catch (err) {
         console.error("Fetch error:", err);
     } finally {
@@ -127,13 +143,14 @@ async function fetchImages(reset = false) {
     }
 }
 
-function appendImageToGallery(img) {
+function appendImageToGallery(img, sprite = null) {
     const gallery = document.getElementById('gallery');
     if (!gallery) return;
 
     const card = document.createElement('div');
     card.className = "image-card glass active";
     card.dataset.id = img.id;
+    card.dataset.filename = img.filename;
     card.onclick = () => openViewer(img.id, img.filename, img.media_type);
 
     const favActive = img.is_favorite ? 'active' : '';
@@ -143,7 +160,9 @@ function appendImageToGallery(img) {
         <button class="btn-fav ${favActive}" onclick="event.stopPropagation(); toggleFavorite('${img.id}', this)">
             <span class="material-symbols-outlined fill-1">favorite</span>
         </button>
-        <img src="/thumbnails/${img.filename}.webp" alt="Memory" class="card-img" loading="lazy">
+        ${sprite
+            ? `<div class="card-img card-sprite" role="img" aria-label="Memory" style="background-image: url('${sprite.url}'); background-size: ${sprite.background_size}; background-position: ${img.sprite_position}"></div>`
+            : `<img src="/thumbnails/${img.filename}.webp" alt="Memory" class="card-img" loading="lazy">`}
         <div class="card-overlay">
             <div class="card-meta">
                 <div class="card-title">PRIVATE MOMENT</div>
@@ -153,6 +172,7 @@ function appendImageToGallery(img) {
         ${img.media_type === 'video' ? '<div class="video-indicator"><span class="material-symbols-outlined">play_circle</span></div>' : ''}
     `;
 
+    applyPlaceholder(card, img.placeholder);
     gallery.appendChild(card);
 }
 
@@ -496,6 +516,97 @@ function initInfiniteScroll() {
     });
 }
 
+// --- Placeholders (BlurHash, see placeholders.py) ---
+
+const BLURHASH_CHARS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz#$%*+,-.:;=?@[]^_{|}~";
+const PLACEHOLDER_SIZE = 32;
+const placeholderUrls = new Map();
+
+function decode83(str) {
+    let value = 0;
+    for (const c of str) value = value * 83 + BLURHASH_CHARS.indexOf(c);
+    return value;
+}
+
+function srgbToLinear(value) {
+    const v = value / 255;
+    return v <= 0.04045 ? v / 12.92 : Math.pow((v + 0.055) / 1.055, 2.4);
+}
+
+function linearToSrgb(value) {
+    const v = Math.max(0, Math.min(1, value));
+    return v <= 0.0031308 ? Math.round(v * 12.92 * 255) : Math.round((1.055 * Math.pow(v, 1 / 2.4) - 0.055) * 255);
+}
+
+function decodeBlurHash(hash, width, height) {
+    const sizeFlag = decode83(hash[0]);
+    const numX = (sizeFlag % 9) + 1;
+    const numY = Math.floor(sizeFlag / 9) + 1;
+    if (hash.length !== 4 + 2 * numX * numY) return null;
+
+    const maxValue = (decode83(hash[1]) + 1) / 166;
+    const colors = [];
+    const dc = decode83(hash.substring(2, 6));
+    colors.push([srgbToLinear(dc >> 16), srgbToLinear((dc >> 8) & 255), srgbToLinear(dc & 255)]);
+    const signPow = (v) => Math.sign(v) * v * v;
+    for (let i = 1; i < numX * numY; i++) {
+        const ac = decode83(hash.substring(4 + i * 2, 6 + i * 2));
+        colors.push([
+            signPow((Math.floor(ac / 361) - 9) / 9) * maxValue,
+            signPow((Math.floor(ac / 19) % 19 - 9) / 9) * maxValue,
+            signPow((ac % 19 - 9) / 9) * maxValue
+        ]);
+    }
+
+    const pixels = new Uint8ClampedArray(width * height * 4);
+    for (let y = 0; y < height; y++) {
+        for (let x = 0; x < width; x++) {
+            let r = 0, g = 0, b = 0;
+            for (let j = 0; j < numY; j++) {
+                const basisY = Math.cos(Math.PI * y * j / height);
+                for (let i = 0; i < numX; i++) {
+                    const basis = Math.cos(Math.PI * x * i / width) * basisY;
+                    const color = colors[i + j * numX];
+                    r += color[0] * basis;
+                    g += color[1] * basis;
+                    b += color[2] * basis;
+                }
+            }
+            const offset = 4 * (x + y * width);
+            pixels[offset] = linearToSrgb(r);
+            pixels[offset + 1] = linearToSrgb(g);
+            pixels[offset + 2] = linearToSrgb(b);
+            pixels[offset + 3] = 255;
+        }
+    }
+    return pixels;
+}
+
+function placeholderUrl(hash) {
+    // Cards are re-created on every refetch, so decode each hash once
+    if (!placeholderUrls.has(hash)) {
+        const pixels = decodeBlurHash(hash, PLACEHOLDER_SIZE, PLACEHOLDER_SIZE);
+        let url = null;
+        if (pixels) {
+            const canvas = document.createElement('canvas');
+            canvas.width = canvas.height = PLACEHOLDER_SIZE;
+            canvas.getContext('2d').putImageData(new ImageData(pixels, PLACEHOLDER_SIZE, PLACEHOLDER_SIZE), 0, 0);
+            url = canvas.toDataURL();
+        }
+        placeholderUrls.set(hash, url);
+    }
+    return placeholderUrls.get(hash);
+}
+
+function applyPlaceholder(card, hash) {
+    if (!hash) return;
+    const url = placeholderUrl(hash);
+    if (!url) return;
+    // Inline longhands, so the .glass:hover background shorthand cannot reset them
+    card.style.backgroundImage = `url(${url})`;
+    card.style.backgroundSize = 'cover';
+}
+
 // --- Slideshow Logic ---
 
 function toggleSlideshow() {
@@ -622,14 +733,22 @@ function updateGridCols(val) {
     document.getElementById('grid-col-range').value = currentCols;
     localStorage.setItem('pixi_cols', currentCols);
 
-    // Performance Optimization: high density = low res mode
+    // Performance Optimization: high density = low res mode (sprite sheets instead of thumbnails)
     const gallery = document.getElementById('gallery');
     if (gallery) {
-        if (currentCols >= 5) gallery.dataset.density = 'high';
-        else gallery.dataset.density = 'normal';
+        const density = currentCols >= 5 ? 'high' : 'normal';
+        const changed = (gallery.dataset.density || 'normal') !== density;
+        gallery.dataset.density = density;
+        // Lets the server render the first page of the next visit as a sprite too
+        document.cookie = `pixi_density=${density}; path=/; max-age=31536000; SameSite=Lax`;
+        if (changed && images.length > 0) fetchImages(true);
     }
 }
 
+function isDenseGrid() {
+    return document.getElementById('gallery')?.dataset.density === 'high';
+}
+
 function showToast(msg, type = 'info') {
     const container = document.getElementById('toast-container');
     const toast = document.createElement('div');
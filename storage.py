@@ -0,0 +1,131 @@
+"""
+Storage Layout
+Where originals and renditions live on disk:
+- New files are content-addressed: the stored name is the SHA-256 of the bytes plus the extension
+- Content-addressed names are sharded into nested directories (uploads/ab/cd/abcd…ef.jpg), so no directory grows past a few hundred entries
+- Renditions follow their original (thumbnails/ab/cd/abcd…ef.jpg.webp), URLs stay /uploads/<name>, /thumbnails/<name>.webp
+- Legacy names (uuid or watch-folder names) stay flat in the top-level directories until migrate_storage.py moves them
+- The top level of uploads/ remains the watch folder; imported files are moved into their shard
+"""
+
+import os
+import re
+import shutil
+from typing import Iterator, List, Set
+
+BASE_DIR = os.getcwd()
+UPLOAD_DIR = os.path.join(BASE_DIR, "uploads")
+PREVIEW_DIR = os.path.join(BASE_DIR, "previews")
+THUMB_DIR = os.path.join(BASE_DIR, "thumbnails")
+
+# "sharded": new uploads and watch-folder imports get content-addressed names
+# "flat": keep uuid names in the top-level directories (previous behaviour)
+LAYOUT = os.environ.get("PIXI_STORAGE_LAYOUT", "sharded")
+
+# Two levels of two hex characters: 65,536 leaf directories, ~15 files each at a million originals
+SHARD_DEPTH = 2
+SHARD_WIDTH = 2
+
+_CONTENT_NAME = re.compile(r"^[0-9a-f]{64}\.")
+_SHARD_NAME = re.compile(rf"^[0-9a-f]{{{SHARD_WIDTH}}}$")
+
+
+def is_content_addressed(name: str) -> bool:
+    """True for stored names (and rendition names) that start with a SHA-256 digest."""
+    return _CONTENT_NAME.match(name) is not None
+
+
+def content_name(content_hash: str, original_name: str) -> str:
+    """Stored name for a file in the sharded layout: digest plus the lower-cased extension."""
+    return content_hash + os.path.splitext(original_name)[1].lower()
+
+
+def stored_name(content_hash: str, original_name: str, legacy_name: str) -> str:
+    """Name a new file is stored under in the configured layout."""
+    return content_name(content_hash, original_name) if LAYOUT == "sharded" else legacy_name
+
+
+def shard(name: str) -> str:
+    """Relative shard directory of a content-addressed name ("ab/cd")."""
+    return os.path.join(*(name[i * SHARD_WIDTH:(i + 1) * SHARD_WIDTH] for i in range(SHARD_DEPTH)))
+
+
+def path(root: str, name: str) -> str:
+    """
+    Resolve a stored or rendition name under root.
+
+    The layout follows from the name alone, so serving a file needs no
+    database lookup and both layouts can coexist during a migration.
+    """
+    if is_content_addressed(name):
+        return os.path.join(root, shard(name), name)
+    return os.path.join(root, name)
+
+
+def original_path(filename: str) -> str:
+    return path(UPLOAD_DIR, filename)
+
+
+def thumbnail_path(filename: str) -> str:
+    """300px thumbnail, or the poster frame of a video."""
+    return path(THUMB_DIR, filename + ".webp")
+
+
+def preview_path(filename: str, media_type: str = "image") -> str:
+    """1600px preview, or the animated hover preview of a video."""
+    if media_type == "video":
+        return path(THUMB_DIR, filename + "_preview.webp")
+    return path(PREVIEW_DIR, filename + ".webp")
+
+
+def rendition_paths(filename: str, media_type: str) -> List[str]:
+    """All generated files (thumbnail, preview) belonging to an original."""
+    return [thumbnail_path(filename), preview_path(filename, media_type)]
+
+
+def ensure_parent(file_path: str):
+    os.makedirs(os.path.dirname(file_path), exist_ok=True)
+
+
+def iter_files(root: str, top_level: bool = True) -> Iterator[os.DirEntry]:
+    """Files in root (unless top_level is False) and in its shard directories, one scandir per directory."""
+    pending = [(root, 0)]
+    while pending:
+        directory, depth = pending.pop()
+        try:
+            entries = os.scandir(directory)
+        except FileNotFoundError:
+            continue
+        with entries:
+            for entry in entries:
+                if entry.is_file():
+                    if depth or top_level:
+                        yield entry
+                elif depth < SHARD_DEPTH and _SHARD_NAME.match(entry.name) and entry.is_dir():
+                    pending.append((entry.path, depth + 1))
+
+
+def list_names(root: str) -> Set[str]:
+    """Names of all files in root and its shard directories."""
+    return {entry.name for entry in iter_files(root)}
+
+
+def place(src: str, dest: str, keep_source: bool = False):
+    """
+    Move src to dest, creating the shard directories.
+
+    With keep_source, dest becomes a hard link and src stays in place, so
+    readers of the old path keep working until the caller removes it.
+    Filesystems without hard links fall back to a copy. An existing dest
+    holds the same bytes (same digest) and is kept.
+    """
+    ensure_parent(dest)
+    if not keep_source:
+        os.replace(src, dest)
+        return
+    try:
+        os.link(src, dest)
+    except FileExistsError:
+        pass
+    except OSError:
+        shutil.copy2(src, dest)
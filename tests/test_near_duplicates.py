@@ -0,0 +1,32 @@
+import numpy as np
+from PIL import Image as PILImage
+import near_duplicates
+
+
+def _hash(img: PILImage.Image) -> int:
+    return near_duplicates.to_signed(near_duplicates.dhash(img.copy()))
+
+
+def test_flat_images_are_not_near_duplicates():
+    red = PILImage.new("RGB", (640, 480), (220, 20, 20))
+    green = PILImage.new("RGB", (640, 480), (20, 200, 40))
+    assert _hash(red) == _hash(green) == near_duplicates.FLAT_HASH
+
+    index = near_duplicates.MultiIndexHash()
+    index.add(1, _hash(red))
+    index.add(2, _hash(green))
+    assert len(index) == 0
+    assert index.clusters(near_duplicates.MAX_DISTANCE) == []
+    assert index.query(_hash(red), near_duplicates.MAX_DISTANCE) == []
+
+
+def test_resized_copy_is_a_near_duplicate():
+    rng = np.random.default_rng(7)
+    photo = PILImage.fromarray(rng.integers(0, 256, (60, 80, 3), dtype=np.uint8)).resize((800, 600))
+    copy = photo.resize((400, 300))
+
+    index = near_duplicates.MultiIndexHash()
+    index.add(1, _hash(photo))
+    index.add(2, _hash(copy))
+    index.add(3, _hash(PILImage.new("RGB", (800, 600), (0, 0, 0))))
+    assert index.clusters(near_duplicates.MAX_DISTANCE) == [[1, 2]]
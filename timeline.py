@@ -0,0 +1,116 @@
+"""
+Timeline
+Orders the library by when a photo was taken instead of when it was imported:
+- The timeline date is the EXIF capture date, or the upload date for files without one
+- An expression index on that date backs keyset pagination (/api/images?order=taken)
+- timeline_months holds the number of images per month; SQLite triggers on images keep it
+  current for every writer (uploads, watch folder, deletes, scripts) inside the same transaction
+- Libraries from before capture dates were read are backfilled in chunks at startup
+"""
+
+import logging
+from typing import Callable, List, Optional, Tuple
+from sqlalchemy import func, text
+from sqlalchemy.orm import Session
+import models
+import exif
+import page_cache
+import storage
+from database import SessionLocal
+
+logger = logging.getLogger(__name__)
+
+# Must match the expression of ix_images_timeline_id for the index to be used
+DATE = func.coalesce(models.Image.taken_at, models.Image.upload_date)
+
+BACKFILL_CHUNK = 500
+
+
+def _month(row: str) -> str:
+    # DateTime is stored as "YYYY-MM-DD HH:MM:SS.ffffff"
+    return f"substr(coalesce({row}.taken_at, {row}.upload_date, ''), 1, 7)"
+
+
+TRIGGERS = (
+    f"""CREATE TRIGGER IF NOT EXISTS timeline_insert AFTER INSERT ON images BEGIN
+        INSERT INTO timeline_months (month, count) VALUES ({_month("NEW")}, 1)
+        ON CONFLICT(month) DO UPDATE SET count = count + 1;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS timeline_delete AFTER DELETE ON images BEGIN
+        UPDATE timeline_months SET count = count - 1 WHERE month = {_month("OLD")};
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS timeline_update AFTER UPDATE OF taken_at, upload_date ON images
+    WHEN {_month("OLD")} IS NOT {_month("NEW")} BEGIN
+        UPDATE timeline_months SET count = count - 1 WHERE month = {_month("OLD")};
+        INSERT INTO timeline_months (month, count) VALUES ({_month("NEW")}, 1)
+        ON CONFLICT(month) DO UPDATE SET count = count + 1;
+    END""",
+)
+
+
+def install(db: Session):
+    """Create the triggers and recount all months (schema upgrade; caller commits)."""
+    for trigger in TRIGGERS:
+        db.execute(text(trigger))
+    rebuild(db)
+
+
+def rebuild(db: Session):
+    """Recount timeline_months from images in one pass (caller commits)."""
+    db.execute(text("DELETE FROM timeline_months"))
+    db.execute(text(
+        f"INSERT INTO timeline_months (month, count) "
+        f"SELECT {_month('images')} AS month, count(*) FROM images GROUP BY month"
+    ))
+
+
+def months(db: Session) -> List[Tuple[str, int]]:
+    """(YYYY-MM, image count) for every month with images, newest first; undated rows are left out."""
+    return db.query(models.TimelineMonth.month, models.TimelineMonth.count).filter(
+        models.TimelineMonth.count > 0,
+        models.TimelineMonth.month != ""
+    ).order_by(models.TimelineMonth.month.desc()).all()
+
+
+def backfill_capture_dates(report: Optional[Callable[[int, int], None]] = None) -> int:
+    """
+    Read the EXIF header of images that were imported before capture dates existed.
+
+    One chunk per transaction; the update trigger moves each image to its
+    month. Unreadable files are marked (exif.UNREADABLE) and not retried.
+    """
+    pending = (models.Image.orientation.is_(None), models.Image.media_type == "image")
+    updated = 0
+    with SessionLocal() as db:
+        total = db.query(func.count(models.Image.id)).filter(*pending).scalar()
+        if not total:
+            return 0
+        logger.info(f"Reading capture dates of {total} images")
+        last_id = 0
+        done = 0
+        while True:
+            rows = db.query(models.Image.id, models.Image.filename).filter(
+                *pending, models.Image.id > last_id
+            ).order_by(models.Image.id).limit(BACKFILL_CHUNK).all()
+            if not rows:
+                break
+            mappings = []
+            for image_id, filename in rows:
+                try:
+                    _, info = exif.read_file(storage.original_path(filename))
+                except Exception as e:
+                    if not isinstance(e, FileNotFoundError):
+                        logger.warning(f"Could not read EXIF of {filename}: {e}")
+                    info = exif.CaptureInfo(orientation=exif.UNREADABLE)
+                mappings.append({"id": image_id, "taken_at": info.taken_at,
+                                 "orientation": info.orientation, "camera": info.camera})
+                updated += info.taken_at is not None
+            db.bulk_update_mappings(models.Image, mappings)
+            db.commit()
+            last_id = rows[-1][0]
+            done += len(rows)
+            if report:
+                report(done, total)
+            page_cache.bump()
+    logger.info(f"✓ Capture dates read: {updated} of {total} images have one")
+    return updated
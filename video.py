@@ -0,0 +1,185 @@
+"""
+Video Pipeline
+Poster frame and hover preview for videos with bounded resources:
+- One ffprobe per video for width, height (display orientation) and duration
+- Poster and animated preview come from a single ffmpeg decode with two outputs
+- Wall-clock timeout, address-space limit and thread cap per ffmpeg process
+- A cross-process slot lock caps how many videos are decoded at once
+"""
+
+import os
+import json
+import time
+import fcntl
+import logging
+import resource
+import subprocess
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Optional
+import metrics
+
+logger = logging.getLogger(__name__)
+
+LOCK_DIR = os.path.join(os.getcwd(), "data")
+
+TIMEOUT_SECONDS = float(os.environ.get("PIXI_FFMPEG_TIMEOUT", 120))
+MAX_MEMORY_MB = int(os.environ.get("PIXI_FFMPEG_MAX_MEMORY_MB", 2048))
+THREADS = int(os.environ.get("PIXI_FFMPEG_THREADS", 2))
+# Videos decoded at the same time across all worker processes
+CONCURRENCY = int(os.environ.get("PIXI_VIDEO_CONCURRENCY", 1))
+PROBE_TIMEOUT_SECONDS = 30
+
+POSTER_WIDTH = 400
+PREVIEW_WIDTH = 320
+PREVIEW_SECONDS = 3
+PREVIEW_FPS = 10
+
+
+@dataclass
+class VideoInfo:
+    width: int
+    height: int
+    duration: Optional[float]
+
+
+def _limit_resources(pid: int):
+    """Address-space limit and lower priority for a spawned child.
+
+    Applied from the parent after the spawn instead of in a preexec_fn,
+    which is unsafe here: probe() also runs in the web process, next to the
+    request, upload and folder-observer threads.
+    """
+    try:
+        if MAX_MEMORY_MB > 0:
+            limit = MAX_MEMORY_MB * 1024 * 1024
+            resource.prlimit(pid, resource.RLIMIT_AS, (limit, limit))
+        os.setpriority(os.PRIO_PROCESS, pid, 5)
+    except ProcessLookupError:
+        pass  # already exited
+
+
+def _run(args, timeout: float) -> subprocess.CompletedProcess:
+    """subprocess.run(args, check=True, capture_output=True, timeout=timeout) with _limit_resources."""
+    with subprocess.Popen(args, stdout=subprocess.PIPE, stderr=subprocess.PIPE) as proc:
+        _limit_resources(proc.pid)
+        try:
+            stdout, stderr = proc.communicate(timeout=timeout)
+        except BaseException:
+            proc.kill()
+            proc.communicate()
+            raise
+    if proc.returncode:
+        raise subprocess.CalledProcessError(proc.returncode, args, stdout, stderr)
+    return subprocess.CompletedProcess(args, proc.returncode, stdout, stderr)
+
+
+def probe(video_path: str) -> VideoInfo:
+    """Reads the first video stream's display size and the container duration."""
+    with metrics.stage("ffprobe"):
+        result = _run([
+            'ffprobe', '-v', 'error', '-select_streams', 'v:0',
+            '-show_entries', 'stream=width,height:stream_tags=rotate:stream_side_data=rotation:format=duration',
+            '-of', 'json', video_path
+        ], PROBE_TIMEOUT_SECONDS)
+    data = json.loads(result.stdout or b"{}")
+    streams = data.get("streams") or [{}]
+    stream = streams[0]
+    width, height = int(stream.get("width") or 0), int(stream.get("height") or 0)
+
+    rotation = stream.get("tags", {}).get("rotate")
+    for side_data in stream.get("side_data_list", []):
+        rotation = side_data.get("rotation", rotation)
+    if rotation is not None and abs(int(float(rotation))) % 180 == 90:
+        width, height = height, width
+
+    duration = data.get("format", {}).get("duration")
+    return VideoInfo(width, height, float(duration) if duration not in (None, "N/A") else None)
+
+
+@contextmanager
+def decode_slot():
+    """Holds one of CONCURRENCY flock-based slots, shared by every process on this host."""
+    os.makedirs(LOCK_DIR, exist_ok=True)
+    handles = [open(os.path.join(LOCK_DIR, f".video-slot-{i}.lock"), "w") for i in range(max(CONCURRENCY, 1))]
+    held = None
+    try:
+        while held is None:
+            for handle in handles:
+                try:
+                    fcntl.flock(handle, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    held = handle
+                    break
+                except BlockingIOError:
+                    continue
+            else:
+                time.sleep(0.25)
+        yield
+    finally:
+        if held is not None:
+            fcntl.flock(held, fcntl.LOCK_UN)
+        for handle in handles:
+            handle.close()
+
+
+def _webp_output(label: str, path: str, quality: int, extra=()):
+    return ['-map', f'[{label}]', *extra, '-c:v', 'webp', '-lossless', '0', '-compression_level', '4',
+            '-q:v', str(quality), '-f', 'webp', path]
+
+
+def render(video_path: str, poster_path: Optional[str], preview_path: Optional[str],
+           duration: Optional[float] = None):
+    """
+    Writes whichever of poster/preview is given, decoding the video once.
+
+    Both start 1s in (or 10% into clips shorter than 10s). Outputs are written
+    atomically. Raises subprocess.CalledProcessError / TimeoutExpired on failure.
+    """
+    outputs = [(kind, path) for kind, path in (("poster", poster_path), ("preview", preview_path)) if path]
+    if not outputs:
+        return
+    start = 1.0 if not duration or duration >= 10 else duration * 0.1
+
+    split = f"split={len(outputs)}" + "".join(f"[{kind}_in]" for kind, _ in outputs)
+    filters = [f"[0:v]{split}"]
+    args = []
+    tmp_paths = []
+    for kind, path in outputs:
+        os.makedirs(os.path.dirname(path), exist_ok=True)  # shard directory (storage.py)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        tmp_paths.append((tmp_path, path))
+        if kind == "poster":
+            filters.append(f"[poster_in]scale={POSTER_WIDTH}:-2[poster]")
+            args += _webp_output("poster", tmp_path, 65, ['-frames:v', '1'])
+        else:
+            filters.append(f"[preview_in]fps={PREVIEW_FPS},scale={PREVIEW_WIDTH}:-2:flags=lanczos[preview]")
+            args += _webp_output("preview", tmp_path, 50, ['-loop', '0'])
+
+    try:
+        with metrics.stage("ffmpeg"):
+            _run([
+                'ffmpeg', '-y', '-v', 'error', '-threads', str(THREADS),
+                '-ss', f"{start:.3f}", '-t', str(PREVIEW_SECONDS), '-i', video_path,
+                '-filter_complex', ";".join(filters), '-filter_complex_threads', str(THREADS),
+                *args
+            ], TIMEOUT_SECONDS)
+        for tmp_path, path in tmp_paths:
+            os.replace(tmp_path, path)
+    finally:
+        for tmp_path, _ in tmp_paths:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+
+def ensure_renditions(video_path: str, poster_path: str, preview_path: str, duration: Optional[float] = None):
+    """Creates missing poster/preview in one ffmpeg run, at most CONCURRENCY videos at a time."""
+    if os.path.exists(poster_path) and os.path.exists(preview_path):
+        return
+    with decode_slot():
+        # Another worker may have produced them while we waited for the slot
+        render(
+            video_path,
+            None if os.path.exists(poster_path) else poster_path,
+            None if os.path.exists(preview_path) else preview_path,
+            duration
+        )